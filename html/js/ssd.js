@@ -17,6 +17,97 @@ limitations under the License.
 */
 
 
+// Fill in the footer timezone picker from the (browser cached) timezone list
+jQuery(function($) {
+  var picker = $('#tz_pref');
+  if (!picker.length || !picker.data('src')) {
+    return;
+  }
+
+  $.ajax({
+    url: picker.data('src'),
+    dataType: 'json',
+    cache: true,
+    success: function(timezones) {
+      var options = [];
+      $.each(timezones, function(i, timezone) {
+        options.push(new Option(timezone, timezone));
+      });
+      picker.append(options);
+    }
+  });
+});
+
+
+// Keep the dashboard current without reloading the page.  The server
+// pushes a change whenever an event is written in the admin
+// (/api/v1/changes), and the service grids and timelines (#live_status)
+// are then fetched again from the page and swapped in.  Without the change
+// stream (an older browser, or SSD_FEED_ENABLED = False) /api/v1/status is
+// polled instead, which costs a 304 when nothing changed, and the page is
+// only fetched when it did.
+jQuery(function($) {
+  if (!$('#live_status').length) {
+    return;
+  }
+
+  // Seconds between status polls without the change stream
+  var poll = 60;
+
+  function reload() {
+    $.ajax({url: window.location.href, dataType: 'html', cache: false}).done(function(html) {
+      // Keep the scripts, those of the fragment (the timeline sliders) run when it's inserted
+      var page = $($.parseHTML(html, document, true));
+      var live = page.filter('#live_status').add(page.find('#live_status'));
+      if (!live.length) {
+        return;
+      }
+
+      // Keep the events that were expanded open
+      var expanded = [];
+      $('#live_status [id^=event_]:visible').each(function() {
+        expanded.push(this.id.substring(6));
+      });
+
+      $('#live_status').replaceWith(live);
+
+      $.each(expanded, function(i, id) {
+        $('#event_' + id).show();
+        $('#expand_' + id).removeClass('foundicon-genenc-plus').addClass('foundicon-genenc-minus');
+      });
+    });
+  }
+
+  function refresh() {
+    $.ajax({url: '/api/v1/status', dataType: 'json', ifModified: true}).done(function(status) {
+      if (status) {
+        reload();
+      }
+    });
+  }
+
+  function polling() {
+    setInterval(refresh, poll * 1000);
+  }
+
+  if (!window.EventSource) {
+    polling();
+    return;
+  }
+
+  var source = new EventSource('/api/v1/changes');
+  source.addEventListener('change', reload, false);
+  source.addEventListener('reset', reload, false);
+
+  // The browser reconnects after each stream, it only gives up when the stream is not served
+  source.addEventListener('error', function() {
+    if (source.readyState == EventSource.CLOSED) {
+      polling();
+    }
+  }, false);
+});
+
+
 
 
 
@@ -0,0 +1,62 @@
+-- ----------------------------
+-- Schema changes for existing SSD installations
+--
+-- New tables are created by 'python manage.py syncdb', but syncdb does not
+-- alter existing tables.  Apply the statements below that are newer than
+-- your installation, in order, e.g.:
+--   mysql -u [user] -p ssd < upgrade.sql
+-- ----------------------------
+
+
+-- ----------------------------
+-- Multiple email recipients per event
+-- (the unique event_id index is replaced by a unique (event_id, email_id) one)
+-- ----------------------------
+ALTER TABLE `dashboard_event_email`
+  DROP INDEX `event_id`,
+  ADD UNIQUE KEY `event_id` (`event_id`,`email_id`);
+
+
+-- ----------------------------
+-- Full-text search index
+-- (no statements: 'python manage.py syncdb' creates dashboard_event_search with
+-- its FULLTEXT index and dashboard_search_term, then run
+-- 'python manage.py ssd_reindex' to index the existing events)
+-- ----------------------------
+
+
+-- ----------------------------
+-- Indexes for the dashboard and search queries
+-- (new installations get them from syncdb, check them with
+-- 'python manage.py ssd_explain')
+-- ----------------------------
+ALTER TABLE `dashboard_event`
+  ADD INDEX `dashboard_event_start` (`start`),
+  ADD INDEX `dashboard_event_status_start` (`status_id`,`start`),
+  ADD INDEX `dashboard_event_type_start` (`type_id`,`start`);
+ALTER TABLE `dashboard_event_service`
+  ADD INDEX `dashboard_event_service_service_event` (`service_id`,`event_id`);
+ALTER TABLE `dashboard_event_update`
+  ADD INDEX `dashboard_event_update_event_id` (`event_id`,`id`);
+
+
+-- ----------------------------
+-- Daily service availability rollup
+-- (no statements: 'python manage.py syncdb' creates dashboard_service_day,
+-- then run 'python manage.py ssd_rollup' to fill it from the existing events)
+-- ----------------------------
+
+
+-- ----------------------------
+-- Hourly event counts for the dashboard graph
+-- (no statements: 'python manage.py syncdb' creates dashboard_event_count_hour,
+-- then run 'python manage.py ssd_rollup' to fill it from the existing events)
+-- ----------------------------
+
+
+-- ----------------------------
+-- Event archive
+-- (no statements: 'python manage.py syncdb' creates dashboard_archive_event,
+-- dashboard_archive_event_service and dashboard_archive_event_update, then
+-- schedule 'python manage.py ssd_archive')
+-- ----------------------------
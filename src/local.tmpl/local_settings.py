@@ -62,6 +62,75 @@ CACHES = {
 }
 """
 
+# -- CACHE TUNING
+# Optional settings controlling how SSD uses the cache (defaults shown)
+# SSD_CACHE_STALE        - seconds an expired value may be served while one process refreshes it
+# SSD_CACHE_JITTER       - fraction of a timeout that is randomly removed so keys do not expire together
+# SSD_LOCAL_CACHE_TTL    - seconds configuration values are kept in each process
+# SSD_LOCAL_CACHE_CHECK  - seconds between checks for configuration changes made in the admin
+# SSD_LOCAL_CACHE_SIZE   - maximum number of configuration values kept in each process
+# SSD_FEED_CACHE         - the CACHES alias holding the live change feed
+# SSD_FEED_ENABLED       - serve the live change stream, otherwise dashboards poll the status API
+# SSD_FEED_TIMEOUT       - seconds a live change stream without changes is held open before the browser reconnects
+# SSD_FEED_POLL          - seconds between checks for changes while a stream is open
+#                          every open stream holds a web server thread, see wsgi.conf for
+#                          serving them from their own daemon process
+# SSD_CACHE_STALE = 60
+# SSD_CACHE_JITTER = 0.1
+# SSD_LOCAL_CACHE_TTL = 60
+# SSD_LOCAL_CACHE_CHECK = 1
+# SSD_LOCAL_CACHE_SIZE = 100
+# SSD_FEED_CACHE = 'default'
+# SSD_FEED_ENABLED = True
+# SSD_FEED_TIMEOUT = 10
+# SSD_FEED_POLL = 1
+
+# -- STATIC SNAPSHOT
+# If set, the public dashboard and open event detail pages are rendered into this
+# directory whenever events change (and by 'manage.py ssd_snapshot') so the web
+# server can serve them directly.  See wsgi.conf for the rewrite rules.
+# SSD_SNAPSHOT_DIR = '/var/www/ssd_snapshot'
+
+# -- SEARCH
+# SSD_SEARCH_BACKEND     - 'mysql' (FULLTEXT index) or 'python' (inverted index, any database)
+#                          by default 'mysql' is used on MySQL and 'python' otherwise
+# SSD_SEARCH_LIMIT       - maximum number of results of a text search
+# SSD_SEARCH_CACHE_TIMEOUT - seconds search results are cached (any event write
+#                          invalidates them), by default the cache TIMEOUT
+# Run 'manage.py ssd_reindex' after changing the backend and 'manage.py ssd_searchcache'
+# to see the cache hit ratio.
+# SSD_SEARCH_BACKEND = 'mysql'
+# SSD_SEARCH_LIMIT = 1000
+# SSD_SEARCH_CACHE_TIMEOUT = 300
+
+# -- ARCHIVE
+# 'manage.py ssd_archive' (e.g. nightly from cron) moves closed events to the archive
+# tables.  The dashboard only shows live events; searches and detail pages show both.
+# SSD_ARCHIVE_DAYS       - days after their end that closed events are archived
+# SSD_ARCHIVE_BATCH      - events moved per transaction
+# SSD_ARCHIVE_DAYS = 365
+# SSD_ARCHIVE_BATCH = 500
+
+# -- EMAIL OUTBOX
+# Notifications are queued in the database and sent by 'manage.py ssd_outbox', which
+# must be running (or run from cron with --once) for any email to go out.
+# SSD_OUTBOX_ATTEMPTS    - send attempts before a notification is marked failed
+# SSD_OUTBOX_BACKOFF     - seconds to wait after the first failure (doubled after each one)
+# SSD_OUTBOX_BACKOFF_MAX - longest wait between attempts
+# SSD_OUTBOX_POLL        - seconds between checks for new notifications
+# SSD_OUTBOX_BATCH       - maximum notifications sent per check (over one connection)
+# SSD_OUTBOX_ATTEMPTS = 5
+# SSD_OUTBOX_BACKOFF = 60
+# SSD_OUTBOX_BACKOFF_MAX = 3600
+# SSD_OUTBOX_POLL = 5
+# SSD_OUTBOX_BATCH = 500
+# To test without a mail relay, keep the messages in memory or print them with a local
+# stand-in ('python -m smtpd -n -c DebuggingServer localhost:1025'):
+# EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+# EMAIL_HOST = 'localhost'
+# EMAIL_PORT = 1025
+# 'manage.py ssd_mailbench' measures the throughput against such a stand-in.
+
 # -- SESSION CACHE
 # If you have memcache installed/configured, then you can use a write-through cache
 # to store session information.  If you'd rather not use the write-through cache and
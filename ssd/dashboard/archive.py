@@ -0,0 +1,204 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Hot/cold archival of closed events for SSD
+
+   Closed incidents and completed maintenances that ended more than
+   SSD_ARCHIVE_DAYS days ago are moved, with their services and updates,
+   from the Event tables to the Archive_Event tables by the ssd_archive
+   management command:
+
+     python manage.py ssd_archive              - archive everything that's old enough
+     python manage.py ssd_archive --days 730   - use another age
+
+   Each batch of SSD_ARCHIVE_BATCH events is copied and deleted in one
+   transaction, so an event is always in exactly one of the two tables
+   (with the same id).  Email recipients, pending notifications and the
+   full-text index rows of an archived event are deleted with it.
+
+   The newest event is never archived, even if it's old enough.  SQLite
+   and InnoDB before MySQL 8.0 (after a restart) hand out the next id from
+   the largest one in the table, so moving it out would give its id to the
+   next new event as well.
+
+   The dashboard, the timeline and the admin lists only read the live
+   tables, which stay small.  The event search, the graph search and the
+   detail pages read both (see search(), keyset.MergedPaginator and
+   event_doc), and the availability rollup and hourly counts include the
+   archived events.  Archived events can't be edited.
+
+   Text searches of the archive match each word anywhere in the
+   description and updates (a LIKE scan of the archive), and the matches
+   are shown after the live ones.
+
+"""
+
+
+import datetime
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone as jtz
+from ssd.dashboard.models import Event, Event_Service, Event_Update, Archive_Event, Archive_Event_Service, Archive_Event_Update
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_doc
+from ssd.dashboard import search_index
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Days after their end that closed events are archived
+ARCHIVE_DAYS = getattr(settings, 'SSD_ARCHIVE_DAYS', 365)
+
+# Events moved per transaction
+ARCHIVE_BATCH = getattr(settings, 'SSD_ARCHIVE_BATCH', 500)
+
+# Maximum number of archived events returned by a text search
+ARCHIVE_SEARCH_LIMIT = getattr(settings, 'SSD_SEARCH_LIMIT', 1000)
+
+# The statuses of events that are over
+CLOSED_STATUSES = ('closed','completed')
+
+# The columns of an event that are archived
+EVENT_VALUES = (
+                'id',
+                'type_id',
+                'date',
+                'description',
+                'start',
+                'end',
+                'status_id',
+                'user_id',
+                'event_impact__impact',
+                'event_coordinator__coordinator'
+               )
+
+
+def _newest(lock=False):
+    """Return the id of the newest event (0 if there are none), locking it if asked"""
+
+    events = Event.objects.all()
+    if lock:
+        events = events.select_for_update()
+
+    newest = list(events.values_list('id', flat=True).order_by('-id')[:1])
+    return newest and newest[0] or 0
+
+
+def _candidates(days, limit):
+    """Return the ids of up to limit events that are old enough to archive (never the newest one)"""
+
+    cutoff = jtz.now() - datetime.timedelta(days=days)
+
+    return list(Event.objects.filter(status__status__in=CLOSED_STATUSES, end__lt=cutoff, id__lt=_newest()).values_list('id', flat=True).order_by('id')[:limit])
+
+
+def _move(ids, days):
+    """Move a batch of events to the archive in one transaction, returns the events moved"""
+
+    cutoff = jtz.now() - datetime.timedelta(days=days)
+    now = jtz.now()
+
+    with transaction.atomic():
+        # Check again in the transaction, in case one was reopened or the newest event was deleted
+        # in the meantime (it's locked, so it stays the newest until the batch is moved)
+        events = list(Event.objects.filter(id__in=ids, status__status__in=CLOSED_STATUSES, end__lt=cutoff, id__lt=_newest(lock=True)).values(*EVENT_VALUES))
+        ids = [event['id'] for event in events]
+        if not ids:
+            return []
+
+        updates = list(Event_Update.objects.filter(event_id__in=ids).values('id','event_id','date','update','user_id').order_by('id'))
+        services = list(Event_Service.objects.filter(event_id__in=ids).values('event_id','service_id').order_by('id'))
+
+        # The searchable text, like the live search index
+        text = dict([(event['id'], [event['description']]) for event in events])
+        for update in updates:
+            text[update['event_id']].append(update['update'])
+
+        Archive_Event.objects.bulk_create([
+                                           Archive_Event(
+                                                         id=event['id'],
+                                                         type_id=event['type_id'],
+                                                         date=event['date'],
+                                                         description=event['description'],
+                                                         start=event['start'],
+                                                         end=event['end'],
+                                                         status_id=event['status_id'],
+                                                         user_id=event['user_id'],
+                                                         impact=event['event_impact__impact'] or '',
+                                                         coordinator=event['event_coordinator__coordinator'] or '',
+                                                         text=' '.join(text[event['id']]),
+                                                         archived=now
+                                                        )
+                                           for event in events
+                                          ])
+        Archive_Event_Update.objects.bulk_create([
+                                                  Archive_Event_Update(id=update['id'], event_id=update['event_id'], date=update['date'], update=update['update'], user_id=update['user_id'])
+                                                  for update in updates
+                                                 ])
+        Archive_Event_Service.objects.bulk_create([
+                                                   Archive_Event_Service(event_id=service['event_id'], service_id=service['service_id'])
+                                                   for service in services
+                                                  ])
+
+        # Everything else tied to the events goes with them
+        Event.objects.filter(id__in=ids).delete()
+
+    return events
+
+
+def archive(days=ARCHIVE_DAYS, batch=ARCHIVE_BATCH, limit=None):
+    """Move the closed events that ended more than days ago to the archive, returns the number moved
+
+    Stops after limit events, if given.
+
+    """
+
+    moved = 0
+    while not limit or moved < limit:
+        ids = _candidates(days, batch if not limit else min(batch, limit - moved))
+        if not ids:
+            break
+
+        events = _move(ids, days)
+        if not events:
+            break
+
+        # The documents are now built from the archive and the dashboard no longer shows the events
+        for event in events:
+            event_doc.invalidate(event['id'])
+        event_cache.invalidate(*events)
+
+        moved += len(events)
+        logger.debug('Archived %s events (%s so far)' % (len(events), moved))
+
+    return moved
+
+
+def search(text, **filter):
+    """Return the ids of the archived events matching every word of text (and filter), newest first"""
+
+    words = search_index.tokenize(text)
+    if not words:
+        return []
+
+    events = Archive_Event.objects.filter(**filter)
+    for word in set(words):
+        events = events.filter(text__icontains=word)
+
+    return list(events.values_list('id', flat=True).order_by('-id')[:ARCHIVE_SEARCH_LIMIT])
@@ -0,0 +1,131 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Conditional GET support for SSD
+
+   The public read views are wrapped with condition(), which builds an ETag
+   from cache version stamps before the view runs.  When the browser (or a
+   proxy) sends a matching If-None-Match, a 304 is returned without running
+   the view, so nothing is queried or rendered.
+
+   The version stamps come from memcached (see functions.namespace_get), so a
+   304 costs no database queries.  Each view supplies a function returning
+   the stamps and request values its page depends on, for example:
+
+     def _index_version(request):
+         return (timeline.version(), event_cache.version(), request.GET.get('ref'))
+
+     @conditional.condition(_index_version)
+     def index(request):
+         ...
+
+   The pages also depend on who is looking at them (the login links and the
+   csrf token in the timezone form), so the session and csrf cookies and the
+   timezone are always part of the ETag.  A page with a pending flash message
+   is always rendered so the message is not lost.
+
+   Views can also send a Last-Modified header built from the rows they
+   loaded (see last_modified).
+
+"""
+
+
+import calendar
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import condition as http_condition
+from ssd.dashboard import event_cache
+from ssd.dashboard import localcache
+from ssd.dashboard import timeline
+
+
+def etag(*parts):
+    """Build an ETag from a list of version stamps and values"""
+
+    return hashlib.md5('|'.join([str(part) for part in parts])).hexdigest()
+
+
+def event_versions():
+    """Return the version stamps that change with any event, update or configuration write"""
+
+    return (event_cache.version(), timeline.version(), localcache.version())
+
+
+def _pending_messages(request):
+    """Return True if a flash message is waiting to be shown
+
+    The default message storage keeps messages in a cookie (and uses the
+    session only when the cookie overflows, which still leaves the cookie in
+    place), so checking for the cookie avoids loading the session.
+
+    """
+
+    return 'messages' in request.COOKIES
+
+
+def condition(version_func):
+    """Decorator adding ETag based conditional GET handling to a view
+
+    version_func is called with the view arguments and returns a tuple of
+    values the page depends on.  It must not touch the database.
+
+    """
+
+    def etag_func(request, *args, **kwargs):
+        if _pending_messages(request):
+            return None
+
+        return etag(
+                    request.path,
+                    request.COOKIES.get(settings.SESSION_COOKIE_NAME),
+                    request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+                    request.timezone,
+                    *version_func(request, *args, **kwargs)
+                   )
+
+    def decorator(view):
+        conditional_view = http_condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+
+            # Always revalidate, and keep per cookie copies apart
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            patch_vary_headers(response, ('Cookie',))
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def last_modified(response, *dates):
+    """Set the Last-Modified header of a response to the latest of a list of aware datetimes
+
+    None values are ignored.
+
+    """
+
+    dates = [date for date in dates if not date == None]
+    if dates:
+        response['Last-Modified'] = http_date(calendar.timegm(max(dates).utctimetuple()))
+
+    return response
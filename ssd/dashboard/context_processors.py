@@ -24,9 +24,8 @@
 
 import logging
 import pytz
-from django.core.cache import cache
-from ssd.dashboard.models import Config_Admin, Config_Logo, Config_Escalation, Config_Ireport
 from django.conf import settings
+from ssd.dashboard import siteconfig
 
 
 # Get an instance of the ssd logger
@@ -49,36 +48,22 @@ def prefs(request):
     else:
         values['app_version'] = False
 
+
+    # All of the flags below come from the cached site configuration
+    config = siteconfig.get()
+
         
     # -- LOGO DISPLAY -- #
-    display_logo = cache.get('display_logo')
-    if display_logo == None:
-        logger.debug('cache miss: %s' % 'display_logo')
-        display_logo = Config_Logo.objects.filter(id=Config_Logo.objects.values('id')[0]['id']).values('logo_enabled')[0]['logo_enabled']
-        cache.set('display_logo', display_logo)
-    else:
-        logger.debug('cache hit: %s' % 'display_logo')
-    if display_logo == 1:
+    if config.logo.logo_enabled == 1:
         # Yes, display it, what's the url
-        logo_url = cache.get('logo_url')
-        if logo_url == None:
-            logo_url = Config_Logo.objects.filter(id=Config_Logo.objects.values('id')[0]['id']).values('url')[0]['url']
-            cache.set('logo_url', logo_url)
-        values['logo'] = logo_url
+        values['logo'] = config.logo.url
     else:
         values['logo'] = False
     # -- LOGO DISPLAY -- #
 
 
     # -- INCIDENT REPORT -- #
-    enable_ireport = cache.get('enable_ireport')
-    if enable_ireport == None:
-        logger.debug('cache miss: %s' % 'enable_ireport')
-        enable_ireport = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('enabled')[0]['enabled']
-        cache.set('enable_ireport', enable_ireport)
-    else:
-        logger.debug('cache hit: %s' % 'enable_ireport')
-    if enable_ireport == 1:    
+    if config.ireport.enabled == 1:    
         values['ireport'] = True
     else:
         values['ireport'] = False
@@ -86,14 +71,7 @@ def prefs(request):
 
 
     # -- ESCALATION PATH --#
-    enable_escalation = cache.get('enable_escalation')
-    if enable_escalation == None:
-        logger.debug('cache miss: %s' % 'enable_escalation')
-        enable_escalation = Config_Escalation.objects.filter(id=Config_Escalation.objects.values('id')[0]['id']).values('enabled')[0]['enabled']
-        cache.set('enable_escalation', enable_escalation)
-    else:
-        logger.debug('cache hit: %s' % 'enable_escalation')
-    if enable_escalation == 1:
+    if config.escalation.enabled == 1:
         values['escalation'] = True
     else:
         values['escalation'] = False
@@ -101,14 +79,7 @@ def prefs(request):
 
 
     # -- ADMIN LINK --#
-    display_admin = cache.get('display_admin')
-    if display_admin == None:
-        logger.debug('cache miss: %s' % 'display_admin')
-        display_admin = Config_Admin.objects.filter(id=Config_Admin.objects.values('id')[0]['id']).values('link_enabled')[0]['link_enabled']
-        setit = cache.set('display_admin', display_admin)
-    else:
-        logger.debug('cache hit: %s' % 'display_admin')
-    if display_admin == 1:
+    if config.admin.link_enabled == 1:
         values['admin_link'] = True
     else:
         values['admin_link'] = False
@@ -120,9 +91,12 @@ def prefs(request):
 
 
 def timezones(request):
-    """Populate the timezones in the footer timezone picker"""
+    """Provide the url of the timezone list for the footer timezone picker
+
+    The list itself is fetched by the browser (see prefs.timezones) rather
+    than rendered into every page.  The pytz version is part of the url so
+    browsers refetch it when pytz is upgraded.
 
-    # Obtain all timezones
-    timezones = pytz.all_timezones
+    """
 
-    return {'timezones': timezones}
+    return {'timezones_url': '/prefs/timezones?v=%s' % pytz.__version__}
@@ -0,0 +1,235 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Per-day event cache for SSD
+
+   The dashboard events are cached in one shard per UTC day rather than one
+   blob per requested window.  A window in any timezone is served by reading
+   the shards that cover it with a single get_many call and cutting the
+   requested range out of them, so consecutive weeks, the jump-to-date form
+   and users in different timezones all share the same entries.
+
+   Missing shards are filled with one range query covering only the missing
+   days.  The event counts used by the dashboard graph are sharded the same
+   way.
+
+   The memcache keys will be:
+     events_[ns]_[YYYYMMDD]
+     event_count_[ns]_[YYYYMMDD]
+
+   Writes to an event only invalidate the shards for the days the event
+   started on before and after the write (see invalidate), so editing an old
+   event leaves the current week cached.  Every write also changes the event
+   version (see version).
+
+"""
+
+
+import datetime
+import logging
+import pytz
+import time
+from django.core.cache import cache
+from ssd.dashboard.models import Event
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The columns cached for each dashboard event
+EVENT_VALUES = (
+                'id',
+                'type__type',
+                'description',
+                'start',
+                'end',
+                'event_service__service__service_name',
+                'status__status'
+               )
+
+
+# The columns cached for each graph event count
+COUNT_VALUES = ('type__type','start')
+
+
+# The memcached key holding the event version
+VERSION_KEY = 'event_version_ns'
+
+
+def utc_days(start, end):
+    """Return the list of UTC dates covering the aware datetimes start through end"""
+
+    day = start.astimezone(pytz.utc).date()
+    last = end.astimezone(pytz.utc).date()
+
+    days = []
+    while day <= last:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+
+    return days
+
+
+def shard_key(prefix, ns, day):
+    """Return the memcache key for the shard of a UTC day"""
+
+    return '%s_%s_%s' % (prefix, ns, day.strftime('%Y%m%d'))
+
+
+def _load(days, queryset, values):
+    """Load the shards for a list of UTC days with a single range query"""
+
+    shards = dict((day, []) for day in days)
+
+    # Query from midnight UTC of the first missing day through midnight UTC after the last
+    q_start = pytz.utc.localize(datetime.datetime.combine(min(days), datetime.time.min))
+    q_end = pytz.utc.localize(datetime.datetime.combine(max(days) + datetime.timedelta(days=1), datetime.time.min))
+
+    rows = queryset.filter(start__gte=q_start,start__lt=q_end).values(*values).order_by('id')
+
+    for row in rows:
+        day = row['start'].astimezone(pytz.utc).date()
+
+        # Days in between missing days were also returned, only keep what was asked for
+        if day in shards:
+            shards[day].append(row)
+
+    return shards
+
+
+def _wait(shards, keys, missing):
+    """Wait for another worker to load missing shards, returning the days that are still missing"""
+
+    deadline = time.time() + functions.CACHE_LOCK_WAIT
+    while missing and time.time() < deadline:
+        time.sleep(0.05)
+        shards.update(cache.get_many([keys[day] for day in missing]))
+        missing = [day for day in missing if not keys[day] in shards]
+
+    return missing
+
+
+def _get_sharded(prefix, queryset, values, start, end):
+    """Return the rows of a sharded set that start between the aware datetimes start and end"""
+
+    # Obtain the memcached namespace for the key prefix
+    ns = functions.namespace_get(logger, '%s_ns' % prefix)
+
+    days = utc_days(start, end)
+    keys = dict((day, shard_key(prefix, ns, day)) for day in days)
+
+    shards = cache.get_many(keys.values())
+
+    missing = [day for day in days if not keys[day] in shards]
+    if missing:
+        logger.debug('cache miss: %s' % ','.join(keys[day] for day in missing))
+
+        # Only one worker loads a given set of missing days, the others wait for it
+        lock = '%s_%s' % (keys[missing[0]], missing[-1].strftime('%Y%m%d'))
+        locked = functions.cache_lock(lock)
+        if not locked:
+            missing = _wait(shards, keys, missing)
+
+        if missing:
+            try:
+                loaded = _load(missing, queryset, values)
+                cache.set_many(dict((keys[day], rows) for day, rows in loaded.items()), functions.jitter())
+            finally:
+                if locked:
+                    functions.cache_unlock(lock)
+
+            for day, rows in loaded.items():
+                shards[keys[day]] = rows
+    else:
+        logger.debug('cache hit: %s' % ','.join(keys[day] for day in days))
+
+    # Cut the requested range out of the shards
+    rows = []
+    for day in days:
+        for row in shards[keys[day]]:
+            if start <= row['start'] <= end:
+                rows.append(row)
+
+    return rows
+
+
+def get_events(start, end):
+    """Return the dashboard events that start between the aware datetimes start and end
+
+    Events are returned ordered by id, as a list of dicts with EVENT_VALUES as keys.
+
+    """
+
+    # The only thing we don't want shown here are maintenances that are in the planning stage
+    events = _get_sharded('events', Event.objects.exclude(status__status='planning'), EVENT_VALUES, start, end)
+    events.sort(key=lambda event: event['id'])
+
+    return events
+
+
+def get_event_counts(start, end):
+    """Return the type and start of every event that starts between the aware datetimes start and end"""
+
+    return _get_sharded('event_count', Event.objects.all(), COUNT_VALUES, start, end)
+
+
+def version():
+    """Return the current event version, which changes whenever an event is written"""
+
+    return functions.namespace_get(logger, VERSION_KEY)
+
+
+def snapshot(id):
+    """Return the cache relevant state of an event (its start), or None if it does not exist
+
+    Take a snapshot before and after writing an event and pass both to invalidate.
+
+    """
+
+    state = Event.objects.filter(id=id).values('start')
+    if state:
+        return state[0]
+
+    return None
+
+
+def invalidate(*states):
+    """Invalidate the cache entries touched by an event write
+
+    Each state is a snapshot of the event (or None when the event did not exist
+    before, or no longer exists after, the write).  Only the shards for the days
+    the event started on are removed.  The timeline is patched separately (see
+    ssd.dashboard.timeline).
+
+    """
+
+    days = set()
+    for state in states:
+        if state:
+            days.add(state['start'].astimezone(pytz.utc).date())
+
+    keys = []
+    for prefix in ('events','event_count'):
+        ns = functions.namespace_get(logger, '%s_ns' % prefix)
+        for day in days:
+            keys.append(shard_key(prefix, ns, day))
+
+    logger.debug('Invalidating: %s' % ','.join(keys))
+    cache.delete_many(keys)
+
+    functions.namespace_bump(logger, VERSION_KEY)
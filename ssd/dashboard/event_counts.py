@@ -0,0 +1,195 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Hourly event counts for the dashboard graph
+
+   The graph on the dashboard shows the number of incidents and
+   maintenances starting on each of 31 days in the user's timezone.  Rather
+   than loading every event in the window and formatting the date of each
+   one for each day, the Event_Count_Hour table holds the number of events
+   of each type starting in each UTC hour.  The count of a local day is the
+   sum of the 24 hourly rows it covers, so the graph is one small indexed
+   query for any timezone.
+
+   The write views take a snapshot() of the event before and after changing
+   it (in the same transaction, after the event is locked, see
+   rollup.snapshot) and pass both to update(), which takes one from the
+   count of the hour the event started in before and adds one to the hour
+   it starts in after.  Adjusting the counts in place, rather than
+   recounting the events, keeps concurrent writes to the same hour from
+   overwriting each other.  The counts include the archived events (see
+   archive.py).
+   'manage.py ssd_rollup' rebuilds the table from the event history (see
+   backfill).
+
+   A local day only lines up with UTC hours in timezones whose offset is a
+   whole number of hours.  For the others (e.g. Asia/Kolkata) the counts
+   are taken from the per-day event shards instead (see event_cache).
+
+"""
+
+
+import datetime
+import logging
+import pytz
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from ssd.dashboard.models import Event, Event_Count_Hour, Archive_Event
+from ssd.dashboard import event_cache
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Events read at a time by backfill and count rows written at a time
+COUNT_CHUNK = 1000
+
+
+def hour(value):
+    """Return the start of the UTC hour of an aware datetime"""
+
+    return value.astimezone(pytz.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def snapshot(id):
+    """Return the count relevant state of an event (its type and hour), or None if it does not exist
+
+    Take a snapshot before and after writing an event, in the transaction
+    of the write once the event is locked, and pass both to update.
+
+    """
+
+    state = Event.objects.filter(id=id).values('type_id','start')
+    if state:
+        return {'type_id':state[0]['type_id'], 'hour':hour(state[0]['start'])}
+
+    return None
+
+
+def _adjust(type_id, start, delta):
+    """Add delta to the count of a type in the UTC hour start (dropping the row when it reaches 0)"""
+
+    counts = Event_Count_Hour.objects.filter(type_id=type_id, hour=start)
+
+    if delta < 0:
+        # Never below 0 (the table may have been rebuilt without the event)
+        if counts.filter(count__gte=-delta).update(count=F('count') + delta):
+            counts.filter(count=0).delete()
+        return
+
+    if counts.update(count=F('count') + delta):
+        return
+
+    # The first event of the hour, another write may add the row at the same time (the insert is
+    # then rolled back to a savepoint and that row is updated instead)
+    try:
+        with transaction.atomic():
+            Event_Count_Hour(type_id=type_id, hour=start, count=delta).save()
+    except IntegrityError:
+        counts.update(count=F('count') + delta)
+
+
+def update(before, after):
+    """Move an event between the hourly counts after a write
+
+    before and after are snapshots of the event taken before and after the
+    write (None when the event did not exist before, or no longer exists
+    after, the write).  Call it in the transaction of the write.
+
+    """
+
+    if before == after:
+        return
+
+    if before:
+        _adjust(before['type_id'], before['hour'], -1)
+    if after:
+        _adjust(after['type_id'], after['hour'], 1)
+
+    logger.debug('Moved an event from the hour %s to %s' % (before and before['hour'], after and after['hour']))
+
+
+def backfill(since=None):
+    """Rebuild the counts from the event history (from the UTC day since on, if given), returns the rows written
+
+    The live and archived events are read COUNT_CHUNK at a time, in id order.
+
+    """
+
+    old = Event_Count_Hour.objects.all()
+    if since:
+        since_start = pytz.utc.localize(datetime.datetime.combine(since, datetime.time.min))
+        old = old.filter(hour__gte=since_start)
+
+    counts = {}
+    for queryset in (Event.objects.all(), Archive_Event.objects.all()):
+        if since:
+            queryset = queryset.filter(start__gte=since_start)
+
+        last = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last).values('id','type_id','start').order_by('id')[:COUNT_CHUNK])
+            if not rows:
+                break
+
+            for row in rows:
+                bucket = (row['type_id'], hour(row['start']))
+                counts[bucket] = counts.get(bucket, 0) + 1
+            last = rows[-1]['id']
+
+    records = [Event_Count_Hour(type_id=type_id, hour=start, count=count) for (type_id, start), count in sorted(counts.items())]
+
+    with transaction.atomic():
+        old.delete()
+        for first in range(0, len(records), COUNT_CHUNK):
+            Event_Count_Hour.objects.bulk_create(records[first:first + COUNT_CHUNK])
+
+    return len(records)
+
+
+def _whole_hours(*values):
+    """Return True if the UTC offset of each aware datetime is a whole number of hours"""
+
+    for value in values:
+        if value.utcoffset().total_seconds() % 3600:
+            return False
+
+    return True
+
+
+def daily_counts(start, end, tz):
+    """Return the number of events of each type starting on each local day between the aware datetimes start and end
+
+    start and end are midnight and the end of a day in the timezone tz.
+    Returns a dict of 'YYYY-MM-DD' -> {type: count}.
+
+    """
+
+    counts = {}
+
+    if _whole_hours(start, end):
+        rows = Event_Count_Hour.objects.filter(hour__gte=hour(start), hour__lte=end).values('type__type','hour','count')
+        for row in rows:
+            day = counts.setdefault(row['hour'].astimezone(tz).strftime('%Y-%m-%d'), {})
+            day[row['type__type']] = day.get(row['type__type'], 0) + row['count']
+    else:
+        logger.debug('%s is not a whole number of hours from UTC, counting the events' % tz)
+        for row in event_cache.get_event_counts(start, end):
+            day = counts.setdefault(row['start'].astimezone(tz).strftime('%Y-%m-%d'), {})
+            day[row['type__type']] = day.get(row['type__type'], 0) + 1
+
+    return counts
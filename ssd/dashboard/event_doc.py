@@ -0,0 +1,212 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Cached event documents for SSD
+
+   Everything the detail pages and the notification emails show about an
+   event is kept in one cached document:
+
+   doc = {
+          'id':1,
+          'type':'incident',
+          'details':[{'status__status':'open','start':datetime,'end':None,'date':datetime,
+                      'description':'...','event_impact__impact':'...',
+                      'event_coordinator__coordinator':'...',
+                      'user_id__first_name':'...','user_id__last_name':'...'}],
+          'services':[{'event_service__service__service_name':'service1'}],
+          'updates':[{'event_update__id':1,'event_update__date':datetime,'event_update__update':'...',
+                      'event_update__user__first_name':'...','event_update__user__last_name':'...'}]
+         }
+
+   updates is None when there are none.  The keys match the ones the detail
+   and email templates already use.  Events moved to the archive tables (see
+   ssd.dashboard.archive) get the same document, with 'archived':True.
+
+   The document is built with three narrow queries (the event with its
+   one-to-one rows, its services and its updates with their authors).  Each
+   event has its own version (event_doc_ns_[id]) and the memcache key is:
+     event_doc_[ns]_[id]
+
+   The write views call refresh() for the events they touch, which moves the
+   version and rebuilds the document, so readers never rebuild it after a
+   write.  That happens after the write is committed, so a reader that may
+   run in between (the outbox worker) passes the modification date of the
+   event it expects to get() and an older document is rebuilt.
+
+"""
+
+
+import logging
+from ssd.dashboard.models import Event, Event_Service, Event_Update, Archive_Event, Archive_Event_Service, Archive_Event_Update
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The columns of the event and its one-to-one rows
+DETAIL_VALUES = (
+                 'type__type',
+                 'status__status',
+                 'start',
+                 'end',
+                 'date',
+                 'description',
+                 'event_impact__impact',
+                 'event_coordinator__coordinator',
+                 'user_id__first_name',
+                 'user_id__last_name'
+                )
+
+
+def _version_key(id):
+    """Return the memcache key holding the version of an event"""
+
+    return 'event_doc_ns_%s' % int(id)
+
+
+def version(id):
+    """Return the current version of an event document"""
+
+    return functions.namespace_get(logger, _version_key(id))
+
+
+def _key(id):
+    """Return the memcache key of the current document of an event"""
+
+    return 'event_doc_%s_%s' % (version(id), int(id))
+
+
+# The columns of an archived event, in the order of DETAIL_VALUES
+ARCHIVE_VALUES = (
+                  'type__type',
+                  'status__status',
+                  'start',
+                  'end',
+                  'date',
+                  'description',
+                  'impact',
+                  'coordinator',
+                  'user__first_name',
+                  'user__last_name'
+                 )
+
+
+def _updates(rows):
+    """Return the updates of a document from (Archive_)Event_Update rows"""
+
+    return [
+            {
+             'event_update__id':update['id'],
+             'event_update__date':update['date'],
+             'event_update__update':update['update'],
+             'event_update__user__first_name':update['user__first_name'],
+             'event_update__user__last_name':update['user__last_name']
+            }
+            for update in rows.values('id','date','update','user__first_name','user__last_name').order_by('id')
+           ]
+
+
+def _build_archived(id):
+    """Load the document of an archived event, returns {} if it does not exist"""
+
+    details = list(Archive_Event.objects.filter(id=id).values(*ARCHIVE_VALUES))
+    if not details:
+        return {}
+
+    # Use the same keys as the live events
+    details = [dict(zip(DETAIL_VALUES, [detail[column] for column in ARCHIVE_VALUES])) for detail in details]
+
+    services = [
+                {'event_service__service__service_name':service['service__service_name']}
+                for service in Archive_Event_Service.objects.filter(event_id=id).values('service__service_name').order_by('id')
+               ]
+
+    updates = _updates(Archive_Event_Update.objects.filter(event_id=id))
+
+    return {
+            'id':int(id),
+            'type':details[0]['type__type'],
+            'details':details,
+            'services':services,
+            'updates':updates or None,
+            'archived':True
+           }
+
+
+def build(id):
+    """Load the document of an event from the database (or the archive), returns {} if it does not exist"""
+
+    logger.debug('Building the document for event %s' % id)
+
+    details = list(Event.objects.filter(id=id).values(*DETAIL_VALUES))
+    if not details:
+        return _build_archived(id)
+
+    services = [
+                {'event_service__service__service_name':service['service__service_name']}
+                for service in Event_Service.objects.filter(event_id=id).values('service__service_name').order_by('id')
+               ]
+
+    updates = _updates(Event_Update.objects.filter(event_id=id))
+
+    return {
+            'id':int(id),
+            'type':details[0]['type__type'],
+            'details':details,
+            'services':services,
+            'updates':updates or None
+           }
+
+
+def get(id, date=None):
+    """Return the document of an event, or None if it does not exist
+
+    If date (a modification date of the event) is given and the cached
+    document is older, it is refreshed first.
+
+    """
+
+    doc = functions.cache_get_or_compute(logger, _key(id), lambda: build(id))
+
+    if doc and date != None and doc['details'][0]['date'] < date:
+        logger.debug('The document of event %s predates %s, rebuilding it' % (id, date))
+        refresh(id)
+        doc = functions.cache_get_or_compute(logger, _key(id), lambda: build(id))
+
+    if not doc:
+        return None
+
+    return doc
+
+
+def invalidate(id):
+    """Move the version of an event so its document is rebuilt on the next read"""
+
+    functions.namespace_bump(logger, _version_key(id))
+
+
+def refresh(id):
+    """Move the version of an event and store a freshly built document
+
+    The write views call this after changing an event, its services or its
+    updates.
+
+    """
+
+    invalidate(id)
+    functions.cache_set(_key(id), build(id))
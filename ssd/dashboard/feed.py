@@ -0,0 +1,135 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Change feed for SSD
+
+   The admin views publish a small change record whenever an incident or
+   maintenance is created, updated or deleted.  The dashboard listens for
+   these through a Server-Sent Events stream (see ssd.dashboard.views.api)
+   and patches the page in place instead of being reloaded.
+
+   The feed lives in the cache:
+     feed_version - the number of the latest change (the version counter)
+     feed_log     - the last FEED_KEEP changes as a list of (number, change)
+
+   Listeners poll the small version counter and only read the log when it
+   moves.  The counter starts from the current time when it's missing, so
+   it keeps increasing across cache restarts.
+
+   The cache used is set with SSD_FEED_CACHE (a CACHES alias, default
+   'default').  Any Django backend works, so a locmem cache can stand in
+   for memcached when testing in a single process.
+
+"""
+
+
+import logging
+import time
+from django.conf import settings
+from django.core.cache import get_cache
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The cache holding the feed
+FEED_CACHE = getattr(settings, 'SSD_FEED_CACHE', 'default')
+
+# Number of changes kept for listeners that fall behind
+FEED_KEEP = 100
+
+# Seconds to wait for the publish lock before writing anyway
+FEED_LOCK_WAIT = 2
+
+# The cache keys
+VERSION_KEY = 'feed_version'
+LOG_KEY = 'feed_log'
+LOCK_KEY = 'feed_lock'
+
+
+cache = get_cache(FEED_CACHE)
+
+
+def version():
+    """Return the number of the latest change"""
+
+    current = cache.get(VERSION_KEY)
+    if current == None:
+        # Someone may beat us to it, so use add and read it back
+        cache.add(VERSION_KEY, int(time.time()))
+        current = cache.get(VERSION_KEY)
+
+    return current
+
+
+def publish(type, id, action, status=None):
+    """Add a change to the feed, returning its number
+
+    type is incident or maintenance, action is created, updated or deleted
+    and status is the event status after the change (if it still exists).
+
+    """
+
+    change = {
+              'type':type,
+              'id':int(id),
+              'action':action,
+              'status':status
+             }
+
+    # Writes are rare (admin only), so serialize them with a short lock
+    deadline = time.time() + FEED_LOCK_WAIT
+    locked = cache.add(LOCK_KEY, 1, FEED_LOCK_WAIT * 5)
+    while not locked and time.time() < deadline:
+        time.sleep(0.05)
+        locked = cache.add(LOCK_KEY, 1, FEED_LOCK_WAIT * 5)
+
+    try:
+        number = version() + 1
+
+        log = cache.get(LOG_KEY) or []
+        log.append((number, change))
+        cache.set(LOG_KEY, log[-FEED_KEEP:])
+        cache.set(VERSION_KEY, number)
+    finally:
+        if locked:
+            cache.delete(LOCK_KEY)
+
+    logger.debug('Published change %s: %s' % (number, change))
+    return number
+
+
+def changes(since):
+    """Return the (number, change) pairs published after number since
+
+    Returns None if the listener fell too far behind (or the log was lost),
+    in which case it should refresh everything and continue from version().
+
+    """
+
+    current = version()
+    if current <= since:
+        return []
+
+    log = cache.get(LOG_KEY) or []
+    changes = [(number, change) for number, change in log if number > since]
+
+    # Changes between since and the oldest one kept are gone
+    if not changes or changes[0][0] > since + 1:
+        return None
+
+    return changes
@@ -27,8 +27,7 @@ import datetime
 import re
 from django import forms
 from django.conf import settings
-from ssd.dashboard.models import Config_Email
-from ssd.dashboard.models import Config_Ireport
+from ssd.dashboard import siteconfig
 
 
 
@@ -38,7 +37,7 @@ def file_size(value):
     """Ensure file size is below the maximum allowed"""
 
     # Obtain the max file size
-    file_size = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('file_size')[0]['file_size']
+    file_size = siteconfig.get().ireport.file_size
 
     if value.size > file_size:
         raise forms.ValidationError('File too large (%s bytes) - please reduce the size of the upload to below %s bytes.' % (value.size,file_size))
@@ -125,13 +124,13 @@ class EmailConfigForm(forms.Form):
 
         # If incident reports are enabled, and email notifications for incident reports are enabled, then a text pager 
         # recipient must be defined
-        ireport_config = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('enabled','email_enabled')
+        ireport_config = siteconfig.get().ireport
         # If email is being enabled without a text pager address and incident reports with email are turned on, error
-        if enabled and not text_pager and ireport_config[0]['enabled'] == 1 and ireport_config[0]['email_enabled'] == 1:
+        if enabled and not text_pager and ireport_config.enabled == 1 and ireport_config.email_enabled == 1:
             self._errors["text_pager"] = self.error_class(['A text pager email address must be provided if incident reports with email notifications are enabled'])
         # If email is being disabled, see if incident reports and associated emails are enabled
         if not enabled:
-            if ireport_config[0]['enabled'] == 1 and ireport_config[0]['email_enabled'] == 1:
+            if ireport_config.enabled == 1 and ireport_config.email_enabled == 1:
                 # Yes they are, so cannot disable email notification
                 self._errors["enabled"] = self.error_class(['Cannot disable email functionality if incident reports with email notifications are enabled.'])
 
@@ -257,11 +256,11 @@ class IreportConfigForm(forms.Form):
                 self._errors["upload_path"] = self.error_class(['This location does not exist.'])
 
         # Email notifications cannot be enabled if global email is disabled
-        global_email_config = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled','text_pager')
+        global_email_config = siteconfig.get().email
         if email_enabled:
-            if not global_email_config[0]['enabled']:
+            if not global_email_config.enabled:
                 self._errors["email_enabled"] = self.error_class(['Global email must be enabled to enable this option.'])
-            if not global_email_config[0]['text_pager'] :
+            if not global_email_config.text_pager :
                 self._errors["email_enabled"] = self.error_class(['A text pager recipient must be defined within the global email options in order to enable this option.'])
 
         # Return the full collection of cleaned data
@@ -332,7 +331,7 @@ class DeleteRecipientForm(forms.Form):
 class ListForm(forms.Form):
     """Form for querying lists of reports"""
 
-    page = forms.IntegerField(required=False)
+    cursor = forms.CharField(required=False, max_length=200)
 
 
 class AddContactForm(forms.Form):
@@ -381,7 +380,7 @@ class SearchForm(forms.Form):
     end = forms.DateField(required=False, input_formats=['%Y-%m-%d'])
     type = forms.CharField(required=False)
     text = forms.CharField(required=False, max_length=50)
-    page = forms.IntegerField(required=False)
+    cursor = forms.CharField(required=False, max_length=200)
 
 
 class GSearchForm(forms.Form):
@@ -391,7 +390,7 @@ class GSearchForm(forms.Form):
 
     date = forms.DateField(required=True, input_formats=['%Y-%m-%d'])
     type = forms.CharField(required=True)
-    page = forms.IntegerField(required=False)
+    cursor = forms.CharField(required=False, max_length=200)
 
 
 class AddIncidentForm(forms.Form):
@@ -20,10 +20,26 @@
 """
 
 
+from django.conf import settings
 from django.core.cache import cache
+import random
+import time
 import uuid
 
 
+# Seconds a value may be served stale (past its soft expiry) while one worker refreshes it
+CACHE_STALE = getattr(settings, 'SSD_CACHE_STALE', 60)
+
+# Fraction of the timeout that is randomly taken off so keys set together do not expire together
+CACHE_JITTER = getattr(settings, 'SSD_CACHE_JITTER', 0.1)
+
+# Seconds a recompute lock is held before it's considered abandoned
+CACHE_LOCK_TIMEOUT = 30
+
+# Seconds to wait for another worker to fill a missing key before computing it anyway
+CACHE_LOCK_WAIT = 2
+
+
 def namespace_get(logger, key):
 	"""Acquire the current namespace for a specified set of keys
 
@@ -60,3 +76,122 @@ def namespace_get(logger, key):
 	return ns
 
 
+def namespace_bump(logger, key):
+	"""Replace the namespace for a specified set of keys with a new unique value
+
+	Namespaces double as version stamps, so anything derived from the old
+	namespace (cache keys, ETags) becomes stale.
+
+	"""
+
+	ns = uuid.uuid4().hex
+	logger.debug('New namespace for %s: %s' % (key, ns))
+	cache.set(key, ns)
+
+	return ns
+
+
+def jitter(timeout=None):
+	"""Return the timeout (or the cache default) with a random amount of jitter removed
+
+	"""
+
+	if timeout == None:
+		timeout = getattr(cache, 'default_timeout', 300)
+
+	return int(timeout * (1 - random.uniform(0, CACHE_JITTER))) or 1
+
+
+def cache_set(key, value, timeout=None):
+	"""Store a value for use with cache_get_or_compute
+
+	The value is stored along with its (jittered) soft expiry.  The key itself
+	lives CACHE_STALE seconds longer so stale data can be served while it's
+	being refreshed.
+
+	"""
+
+	soft = jitter(timeout)
+	cache.set(key, (value, time.time() + soft), soft + CACHE_STALE)
+
+
+def cache_peek(key):
+	"""Return a value stored with cache_set, ignoring its soft expiry (None if missing)
+
+	"""
+
+	entry = cache.get(key)
+	if entry == None:
+		return None
+
+	return entry[0]
+
+
+def cache_lock(key):
+	"""Try to acquire the recompute lock for a key, returns True if acquired
+
+	"""
+
+	return cache.add('%s_lock' % key, 1, CACHE_LOCK_TIMEOUT)
+
+
+def cache_unlock(key):
+	"""Release the recompute lock for a key
+
+	"""
+
+	cache.delete('%s_lock' % key)
+
+
+def cache_get_or_compute(logger, key, compute, timeout=None):
+	"""Return the cached value of a key, computing it if required
+
+	Only one worker recomputes a key at a time (single-flight using a cache.add
+	lock).  Once a value passes its soft expiry it's served stale to every other
+	worker while the lock holder refreshes it.  When there is no value at all,
+	the other workers wait briefly for the lock holder before giving up and
+	computing it themselves.
+
+	compute is called with no arguments and must return a picklable (evaluated)
+	value other than None.
+
+	"""
+
+	entry = cache.get(key)
+
+	if not entry == None:
+		value, soft_expiry = entry
+		if time.time() < soft_expiry:
+			logger.debug('cache hit: %s' % key)
+			return value
+
+		# Stale, so only one worker refreshes it and everyone else keeps using it
+		if not cache_lock(key):
+			logger.debug('cache stale (refresh in progress): %s' % key)
+			return value
+
+		logger.debug('cache stale (refreshing): %s' % key)
+	else:
+		logger.debug('cache miss: %s' % key)
+
+		if not cache_lock(key):
+			# Someone else is computing it, give them a chance to finish
+			deadline = time.time() + CACHE_LOCK_WAIT
+			while time.time() < deadline:
+				time.sleep(0.05)
+				entry = cache.get(key)
+				if not entry == None:
+					return entry[0]
+
+			logger.debug('Gave up waiting for %s, computing it' % key)
+			value = compute()
+			cache_set(key, value, timeout)
+			return value
+
+	try:
+		value = compute()
+		cache_set(key, value, timeout)
+	finally:
+		cache_unlock(key)
+
+	return value
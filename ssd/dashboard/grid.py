@@ -0,0 +1,102 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Dashboard grid helper functions for SSD
+
+   The main dashboard shows every service against a range of days.  Rather
+   than comparing every service with every date and every event, the events
+   are bucketed once by (service name, local date) and the rows are then
+   assembled with dictionary lookups.
+
+"""
+
+
+def bucket_events(events, tz):
+    """Group events by (service name, local date) in a single pass
+
+    Each event is a dict as returned by the dashboard events query.  The
+    returned dict maps (service name, date) to a list of cell entries in
+    the order the events were given.
+
+    """
+
+    buckets = {}
+
+    for event in events:
+        # Convert to the requested timezone
+        event_date = event['start'].astimezone(tz)
+
+        # If the event closed date is there, make sure the time zone is correct
+        end_date = event['end']
+        if end_date:
+            end_date = end_date.astimezone(tz)
+
+        key = (event['event_service__service__service_name'], event_date.date())
+        if not key in buckets:
+            buckets[key] = []
+
+        buckets[key].append({
+                             'id':event['id'],
+                             'type':event['type__type'],
+                             'description':event['description'],
+                             'open':event_date,
+                             'closed':end_date,
+                             'status':event['status__status']
+                            })
+
+    return buckets
+
+
+def build_rows(services, events, dates, lookup, tz):
+    """Build the service rows of the main dashboard table
+
+    Each row looks like this:
+      [{service:www.domain1.com,status:0},['green'],[{'id':foo,'description':foo,'open':foo,'closed':foo,'type':foo}]]
+
+    Statuses are as follows:
+      - 0 = green
+      - 1 = active incident
+      - 2 = active maintenance
+
+    The cost is linear in the number of events plus services x dates,
+    instead of the product of all three.
+
+    """
+
+    buckets = bucket_events(events, tz)
+
+    # Only the calendar date of each column is needed for the lookups
+    days = [date.date() for date in dates]
+
+    rows = []
+    for service in services:
+        service_name = service['service_name']
+        row = [{'service':service_name,'status':0}]
+
+        # Set the status from our lookup table first
+        # Incidents over-ride everything for setting the status of the service
+        if service_name in lookup['incident']:
+            row[0]['status'] = 1
+        elif service_name in lookup['maintenance']:
+            row[0]['status'] = 2
+
+        # If there is no bucket, there were no events so mark this date/service as green
+        for day in days:
+            row.append(buckets.get((service_name, day)) or ['green'])
+
+        rows.append(row)
+
+    return rows
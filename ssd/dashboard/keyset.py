@@ -0,0 +1,288 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Keyset (cursor) pagination for SSD
+
+   Django's Paginator pages with LIMIT/OFFSET, which reads and throws away
+   every row before the page, so deep pages get slower, and it needs a
+   COUNT(*) for every page.  KeysetPaginator pages by the sort key instead:
+   the next page is "the rows after the last one shown", which an index on
+   the key answers directly however deep the page is.
+
+   Lists are sorted newest first by one or more keys, e.g. ('id',) or
+   ('start','id') (the last key must be unique).  Pages are addressed by
+   opaque cursors holding the direction and the key of the boundary row:
+
+     paginator = keyset.KeysetPaginator(queryset, 10, ('start','id'), count_key=...)
+     page = paginator.page(request.GET.get('cursor'))
+
+   The template links to ?cursor={{page.next_cursor}} and
+   ?cursor={{page.previous_cursor}} (see has_next and has_previous).  An
+   invalid cursor shows the first page.
+
+   The total shown with the list is a COUNT(*).  Pass count_key (see
+   count_key()) built from the cache versions the list depends on and it's
+   computed once per version instead of on every page.
+
+   MergedPaginator pages through several querysets as one list (e.g. the
+   live and archived events).  ListPaginator gives the same interface for
+   an already loaded list (e.g. the ids of a full-text search in relevance
+   order).
+
+"""
+
+
+import base64
+import calendar
+import datetime
+import hashlib
+import logging
+import operator
+from django.db.models import Q
+from django.utils import timezone as jtz
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+def count_key(name, *parts):
+    """Return a cache key for the total of a list from its name and the versions/parameters it depends on"""
+
+    return 'keyset_count_%s_%s' % (name, hashlib.md5('|'.join([str(part) for part in parts])).hexdigest())
+
+
+def _dump(value):
+    """Encode a key value for a cursor"""
+
+    if isinstance(value, datetime.datetime):
+        # Microseconds since the epoch (UTC)
+        return 'd%d' % (calendar.timegm(value.utctimetuple()) * 1000000 + value.microsecond)
+
+    return 'i%d' % value
+
+
+def _load(value):
+    """Decode a key value from a cursor"""
+
+    if value[0] == 'd':
+        seconds, microseconds = divmod(int(value[1:]), 1000000)
+        return (datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=seconds, microseconds=microseconds)).replace(tzinfo=jtz.utc)
+
+    return int(value[1:])
+
+
+def encode(direction, values):
+    """Build an opaque cursor from a direction ('n'ext, 'p'revious or 'o'ffset) and a list of values"""
+
+    return base64.urlsafe_b64encode('%s:%s' % (direction, ':'.join([_dump(value) for value in values]))).rstrip('=')
+
+
+def decode(cursor):
+    """Return the (direction, values) of a cursor, or None if it's missing or invalid"""
+
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4))
+        direction, values = raw.split(':', 1)
+        if not direction in ('n', 'p', 'o'):
+            return None
+        return direction, [_load(value) for value in values.split(':')]
+    except Exception:
+        logger.debug('Invalid cursor: %s' % cursor)
+        return None
+
+
+class Page:
+
+    """
+    One page of a list
+    """
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, count):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+
+    """
+    Paginate a values() queryset newest first by a list of keys
+    """
+
+    def __init__(self, queryset, per_page, keys=('id',), count_key=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = keys
+        self.count_key = count_key
+
+    def count(self):
+        """Return the total number of rows (cached if there is a count_key)"""
+
+        if self.count_key == None:
+            return self.queryset.count()
+
+        return functions.cache_get_or_compute(logger, self.count_key, self.queryset.count)
+
+    def _after(self, values, lookup):
+        """Return a filter for the rows past values in the order of the keys (lookup is lt or gt)"""
+
+        # (k1 < v1) or (k1 = v1 and k2 < v2) or ...
+        terms = []
+        for i in range(len(self.keys)):
+            term = Q(**{'%s__%s' % (self.keys[i], lookup): values[i]})
+            for j in range(i):
+                term &= Q(**{self.keys[j]: values[j]})
+            terms.append(term)
+
+        return reduce(operator.or_, terms)
+
+    def _cursor(self, direction, row):
+        return encode(direction, [row[key] for key in self.keys])
+
+    def _fetch(self, filter, order, limit):
+        """Return up to limit rows matching filter (a Q or None) in order"""
+
+        queryset = self.queryset
+        if filter:
+            queryset = queryset.filter(filter)
+
+        return list(queryset.order_by(*order)[:limit])
+
+    def page(self, cursor=None):
+        """Return the page addressed by a cursor (the first page if it's missing or invalid)"""
+
+        newest = ['-%s' % key for key in self.keys]
+        oldest = list(self.keys)
+
+        decoded = decode(cursor)
+        if decoded and decoded[0] in ('n', 'p') and len(decoded[1]) == len(self.keys):
+            direction, values = decoded
+        else:
+            direction, values = None, None
+
+        # Read one extra row to find out if there is another page in the same direction
+        if direction == 'p':
+            rows = self._fetch(self._after(values, 'gt'), oldest, self.per_page + 1)
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            has_previous, has_next = more, True
+        elif direction == 'n':
+            rows = self._fetch(self._after(values, 'lt'), newest, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = True
+        else:
+            rows = self._fetch(None, newest, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = False
+
+        # Stepping back onto the first page (or past the end) may leave nothing, start over
+        if not rows and direction:
+            return self.page(None)
+
+        return Page(
+                    rows,
+                    has_next,
+                    has_previous,
+                    has_next and self._cursor('n', rows[-1]) or None,
+                    has_previous and self._cursor('p', rows[0]) or None,
+                    self.count()
+                   )
+
+
+class MergedPaginator(KeysetPaginator):
+
+    """
+    Paginate several values() querysets with the same columns as one list
+
+    The keys must be unique across the querysets (e.g. the ids of the live
+    and archived events).  Each page reads a page from every queryset and
+    keeps the first rows of the merged result.
+    """
+
+    def __init__(self, querysets, per_page, keys=('id',), count_key=None):
+        KeysetPaginator.__init__(self, None, per_page, keys, count_key)
+        self.querysets = querysets
+
+    def _total(self):
+        return sum([queryset.count() for queryset in self.querysets])
+
+    def count(self):
+        """Return the total number of rows (cached if there is a count_key)"""
+
+        if self.count_key == None:
+            return self._total()
+
+        return functions.cache_get_or_compute(logger, self.count_key, self._total)
+
+    def _fetch(self, filter, order, limit):
+        """Return up to limit rows matching filter (a Q or None) in order, from all of the querysets"""
+
+        rows = []
+        for queryset in self.querysets:
+            if filter:
+                queryset = queryset.filter(filter)
+            rows.extend(queryset.order_by(*order)[:limit])
+
+        rows.sort(key=lambda row: [row[key] for key in self.keys], reverse=order[0].startswith('-'))
+
+        return rows[:limit]
+
+
+class ListPaginator:
+
+    """
+    Paginate a list that's already loaded, with the same interface as KeysetPaginator
+    """
+
+    def __init__(self, items, per_page):
+        self.items = items
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """Return the page addressed by a cursor (the first page if it's missing or invalid)"""
+
+        decoded = decode(cursor)
+        if decoded and decoded[0] == 'o' and 0 <= decoded[1][0] < len(self.items):
+            offset = decoded[1][0]
+        else:
+            offset = 0
+
+        end = offset + self.per_page
+        return Page(
+                    self.items[offset:end],
+                    end < len(self.items),
+                    offset > 0,
+                    end < len(self.items) and encode('o', [end]) or None,
+                    offset > 0 and encode('o', [max(offset - self.per_page, 0)]) or None,
+                    len(self.items)
+                   )
@@ -0,0 +1,214 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Two tier cache for SSD configuration values
+
+   The site configuration (see ssd.dashboard.siteconfig) and the service list
+   are read on nearly every page but change rarely.  They are held in a small
+   in-process LRU in front of memcached.
+
+   The local tier is kept coherent with a single version key in memcached
+   (config_version).  Each process checks that key at most once every
+   SSD_LOCAL_CACHE_CHECK seconds and drops its local entries when it
+   changes.  The admin configuration views call bump() after saving, which
+   removes the memcached entries and changes the version.
+
+   Local entries also expire after SSD_LOCAL_CACHE_TTL seconds.
+
+"""
+
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Seconds a value is kept in the local tier
+LOCAL_TTL = getattr(settings, 'SSD_LOCAL_CACHE_TTL', 60)
+
+# Seconds between checks of the memcached version key
+LOCAL_CHECK = getattr(settings, 'SSD_LOCAL_CACHE_CHECK', 1)
+
+# Maximum number of values kept in the local tier
+LOCAL_SIZE = getattr(settings, 'SSD_LOCAL_CACHE_SIZE', 100)
+
+# The memcached key holding the configuration version
+VERSION_KEY = 'config_version'
+
+
+class LRU:
+
+    """
+    A small thread safe LRU with a per entry expiry
+    """
+
+    def __init__(self, size, ttl):
+        """
+        Constructor
+
+        """
+
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return (True, value) if the key is present and fresh, otherwise (False, None)
+
+        """
+
+        with self.lock:
+            if not key in self.entries:
+                return False, None
+
+            value, expires = self.entries.pop(key)
+            if expires < time.time():
+                return False, None
+
+            # Move it to the most recently used end
+            self.entries[key] = (value, expires)
+            return True, value
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entry if full
+
+        """
+
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+            elif len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+
+            self.entries[key] = (value, time.time() + self.ttl)
+
+    def clear(self):
+        """
+        Remove every entry
+
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+
+# The process local tier and its state
+_local = LRU(LOCAL_SIZE, LOCAL_TTL)
+_state = {'version':None, 'checked':0}
+
+# Hit/miss counters for each tier (per process)
+_stats = {
+          'local': {'hits':0, 'misses':0},
+          'memcached': {'hits':0, 'misses':0}
+         }
+
+
+def _sync():
+    """Drop the local tier if the memcached version changed since the last check"""
+
+    now = time.time()
+    if now - _state['checked'] < LOCAL_CHECK:
+        return
+
+    _state['checked'] = now
+    version = cache.get(VERSION_KEY)
+    if not version == _state['version']:
+        logger.debug('Configuration version changed from %s to %s, clearing the local cache' % (_state['version'], version))
+        _local.clear()
+        _state['version'] = version
+
+
+def get(logger, key, compute):
+    """Return a configuration value from the local tier, then memcached, then compute
+
+    compute is called with no arguments and must return a picklable (evaluated)
+    value other than None.
+
+    """
+
+    _sync()
+
+    found, value = _local.get(key)
+    if found:
+        _stats['local']['hits'] += 1
+        logger.debug('local cache hit: %s' % key)
+        return value
+    _stats['local']['misses'] += 1
+
+    # Record whether memcached had to compute the value
+    computed = []
+    def _compute():
+        computed.append(True)
+        return compute()
+
+    value = functions.cache_get_or_compute(logger, key, _compute)
+    if computed:
+        _stats['memcached']['misses'] += 1
+    else:
+        _stats['memcached']['hits'] += 1
+
+    _local.set(key, value)
+    return value
+
+
+def bump(keys):
+    """Remove configuration values from memcached and invalidate every local tier
+
+    The admin configuration views call this after saving.
+
+    """
+
+    cache.delete_many(keys)
+    cache.set(VERSION_KEY, uuid.uuid4().hex)
+
+    # This process can clear its own tier right away
+    _local.clear()
+    _state['checked'] = 0
+
+
+def version():
+    """Return the current configuration version"""
+
+    return functions.namespace_get(logger, VERSION_KEY)
+
+
+def stats():
+    """Return the per tier hit/miss counters and hit rates for this process"""
+
+    tiers = []
+    for tier in ('local','memcached'):
+        hits = _stats[tier]['hits']
+        misses = _stats[tier]['misses']
+        total = hits + misses
+        if total:
+            rate = '%.1f%%' % (100.0 * hits / total)
+        else:
+            rate = 'n/a'
+        tiers.append({'tier':tier, 'hits':hits, 'misses':misses, 'rate':rate})
+
+    return tiers
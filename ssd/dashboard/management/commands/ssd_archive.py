@@ -0,0 +1,65 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Move old closed events to the archive tables
+
+   Usage:
+     python manage.py ssd_archive                 - archive events that ended SSD_ARCHIVE_DAYS ago
+     python manage.py ssd_archive --days 730      - use another age
+     python manage.py ssd_archive --limit 10000   - stop after this many events
+
+   Run it from cron (e.g. nightly).  See ssd.dashboard.archive.
+
+"""
+
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ssd.dashboard import archive
+
+
+class Command(BaseCommand):
+
+    help = 'Move closed events older than SSD_ARCHIVE_DAYS to the archive tables'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days',
+                    dest='days',
+                    type='int',
+                    default=archive.ARCHIVE_DAYS,
+                    help='Archive events that ended more than this many days ago'),
+        make_option('--batch',
+                    dest='batch',
+                    type='int',
+                    default=archive.ARCHIVE_BATCH,
+                    help='Events moved per transaction'),
+        make_option('--limit',
+                    dest='limit',
+                    type='int',
+                    default=None,
+                    help='Stop after this many events'),
+    )
+
+    def handle(self, *args, **options):
+
+        if options['days'] < 1 or options['batch'] < 1:
+            raise CommandError('--days and --batch must be at least 1')
+
+        begin = time.time()
+        count = archive.archive(options['days'], options['batch'], options['limit'])
+
+        self.stdout.write('Archived %s events in %.3fs' % (count, time.time() - begin))
@@ -0,0 +1,173 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Check the query plans of the dashboard and search queries
+
+   Runs EXPLAIN for each of the hot queries behind the dashboard (see
+   event_cache and timeline) and the searches (see views/search.py) and
+   fails if any of them scans a whole table, e.g. after a schema change
+   drops one of the indexes in models.py:
+
+     python manage.py ssd_explain             - print the plans, exit 1 on a full scan
+     python manage.py ssd_explain --sql       - also print the SQL
+     python manage.py ssd_explain --time      - also time each query (best of 3)
+
+   Works with MySQL, PostgreSQL and SQLite.  The planners pick a full scan
+   for tables with only a few rows, so run it against a database with a
+   realistic number of events (e.g. 'manage.py ssd_pagebench --populate'
+   on a scratch database).  The type and status lookup tables only hold a
+   handful of rows and are allowed to be scanned.
+
+   --time measures the effect of archiving (see ssd.dashboard.archive),
+   e.g. on a scratch database with 5M events:
+     python manage.py ssd_pagebench --populate 5000000
+     python manage.py ssd_explain --time
+     python manage.py ssd_archive
+     python manage.py ssd_explain --time
+
+"""
+
+
+import datetime
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone as jtz
+from ssd.dashboard.models import Event, Event_Service, Event_Update
+from ssd.dashboard import event_cache
+from ssd.dashboard import timeline
+from ssd.dashboard.views import search
+
+
+# Tables that may be scanned (they only hold a few rows)
+SCAN_ALLOWED = ('dashboard_type', 'dashboard_status')
+
+
+def hot_queries():
+    """Return the (name, queryset) of each query that's checked"""
+
+    end = jtz.now()
+    start = end - datetime.timedelta(days=7)
+    ids = list(Event.objects.values_list('id', flat=True).order_by('-id')[:10]) or [0]
+
+    return (
+            ('dashboard events',
+             Event.objects.exclude(status__status='planning').filter(start__gte=start,start__lt=end).values(*event_cache.EVENT_VALUES).order_by('id')),
+            ('dashboard event counts',
+             Event.objects.filter(start__gte=start,start__lt=end).values(*event_cache.COUNT_VALUES).order_by('id')),
+            ('timeline events',
+             Event.objects.filter(status__status__in=timeline.ACTIVE_STATUSES).values('id','start','type__type','description').order_by('start')),
+            ('timeline services',
+             Event_Service.objects.filter(event_id__in=ids).values('event_id','service__service_name').order_by('id')),
+            ('timeline updates',
+             Event_Update.objects.filter(event_id__in=ids).values('id','event_id','date','update').order_by('id')),
+            ('events of a service',
+             Event_Service.objects.filter(service_id=1).values('event_id')),
+            ('search by type and date',
+             Event.objects.filter(type__type='incident',start__range=[start,end]).values(*search.EVENT_VALUES).order_by('-id')[:11]),
+            ('search text matches',
+             Event.objects.filter(id__in=ids,type__type='incident',start__range=[start,end]).values_list('id',flat=True)),
+            ('graph day',
+             Event.objects.filter(type__type='incident',start__range=[end - datetime.timedelta(days=1),end]
+                                 ).values('id','type__type','start','description','status__status').order_by('-start','-id')[:11]),
+           )
+
+
+def explain(queryset):
+    """Return the plan of a queryset as a list of (table, full scan, description)"""
+
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    vendor = connection.vendor
+    plan = []
+
+    if vendor == 'mysql':
+        cursor.execute('EXPLAIN %s' % sql, params)
+        columns = [column[0] for column in cursor.description]
+        for row in cursor.fetchall():
+            row = dict(zip(columns, row))
+            plan.append((row['table'], row['type'] == 'ALL', 'type=%(type)s key=%(key)s rows=%(rows)s %(Extra)s' % row))
+    elif vendor == 'postgresql':
+        cursor.execute('EXPLAIN %s' % sql, params)
+        for row in cursor.fetchall():
+            line = row[0].strip(' ->')
+            table = None
+            if 'Seq Scan on ' in line:
+                table = line.split('Seq Scan on ')[1].split()[0]
+            plan.append((table, table != None, line))
+    elif vendor == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN %s' % sql, params)
+        for row in cursor.fetchall():
+            detail = row[-1]
+            words = detail.split()
+            table = None
+            if words[:1] == ['SCAN']:
+                table = words[2] if words[1:2] == ['TABLE'] else words[1]
+            plan.append((table, table != None, detail))
+    else:
+        raise CommandError('EXPLAIN is not supported for %s' % vendor)
+
+    return sql, plan
+
+
+class Command(BaseCommand):
+
+    help = 'Check the query plans of the dashboard and search queries for full table scans'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--sql',
+                    action='store_true',
+                    dest='sql',
+                    default=False,
+                    help='Print the SQL of each query'),
+        make_option('--time',
+                    action='store_true',
+                    dest='time',
+                    default=False,
+                    help='Time each query (best of 3 runs)'),
+    )
+
+    def handle(self, *args, **options):
+
+        scans = []
+        for name, queryset in hot_queries():
+            sql, plan = explain(queryset)
+
+            if options['time']:
+                timings = []
+                for i in range(3):
+                    begin = time.time()
+                    list(queryset.all())
+                    timings.append(time.time() - begin)
+                self.stdout.write('%s (%.4fs)' % (name, min(timings)))
+            else:
+                self.stdout.write(name)
+
+            if options['sql']:
+                self.stdout.write('  %s' % sql)
+
+            for table, full_scan, description in plan:
+                flag = ''
+                if full_scan and not table in SCAN_ALLOWED:
+                    flag = '  <-- FULL SCAN'
+                    scans.append('%s (%s)' % (name, table))
+                self.stdout.write('  %s: %s%s' % (table, description, flag))
+
+        if scans:
+            raise CommandError('Full table scans in: %s' % ', '.join(scans))
+
+        self.stdout.write('No full table scans')
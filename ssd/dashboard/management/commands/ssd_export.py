@@ -0,0 +1,84 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Export the event history as JSON lines
+
+   Usage:
+     python manage.py ssd_export > events.jsonl              - the live events
+     python manage.py ssd_export --archived -o events.jsonl  - the archived events too
+
+   Memory use doesn't grow with the number of events, they're read
+   --chunk at a time.  Load the file into another SSD with ssd_import.  See
+   ssd.dashboard.transfer for the format.
+
+"""
+
+
+import sys
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ssd.dashboard import transfer
+
+
+class Command(BaseCommand):
+
+    help = 'Export the event history as JSON lines'
+
+    option_list = BaseCommand.option_list + (
+        make_option('-o', '--output',
+                    dest='output',
+                    default=None,
+                    help='Write to this file rather than stdout'),
+        make_option('--archived',
+                    action='store_true',
+                    dest='archived',
+                    default=False,
+                    help='Also export the archived events'),
+        make_option('--chunk',
+                    dest='chunk',
+                    type='int',
+                    default=transfer.EXPORT_CHUNK,
+                    help='Events read per query'),
+    )
+
+    def handle(self, *args, **options):
+
+        if options['chunk'] < 1:
+            raise CommandError('--chunk must be at least 1')
+
+        # The events go to stdout unless there's a file, so report on stderr
+        report = sys.stderr
+        begin = time.time()
+
+        def progress(count):
+            if int(options['verbosity']) > 1:
+                report.write('%s events, %.0f events/s\n' % (count, count / max(time.time() - begin, 0.001)))
+
+        if options['output']:
+            try:
+                out = open(options['output'], 'w')
+            except IOError, e:
+                raise CommandError('Cannot open %s: %s' % (options['output'], e))
+        else:
+            out = sys.stdout
+
+        try:
+            count = transfer.dump(out, options['archived'], options['chunk'], progress)
+        finally:
+            if options['output']:
+                out.close()
+
+        elapsed = time.time() - begin
+        report.write('Exported %s events in %.3fs (%.0f events/s)\n' % (count, elapsed, count / max(elapsed, 0.001)))
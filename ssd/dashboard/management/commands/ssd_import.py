@@ -0,0 +1,108 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Import event history exported by ssd_export
+
+   Usage:
+     python manage.py ssd_import events.jsonl                     - import a file
+     python manage.py ssd_import --batch 5000 events.jsonl        - events per transaction
+     python manage.py ssd_import --id-offset 1000000 events.jsonl - shift the event and update ids
+     python manage.py ssd_import --user admin events.jsonl        - owner of events by unknown users
+     python manage.py ssd_import - < events.jsonl                 - read stdin
+
+   The file is read a line at a time and each --batch events are written
+   with bulk_create in one transaction, so memory use doesn't grow with the
+   size of the file.  The ids are kept (shifted by --id-offset), so they
+   must not already be in use.  If a batch fails the earlier ones stay
+   imported.
+
+   Afterwards rebuild the search index, the availability rollup and the
+   hourly counts:
+     python manage.py ssd_reindex
+     python manage.py ssd_rollup
+
+"""
+
+
+import sys
+import time
+from optparse import make_option
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from ssd.dashboard import transfer
+
+
+class Command(BaseCommand):
+
+    args = '<file>'
+    help = 'Import event history exported by ssd_export'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch',
+                    dest='batch',
+                    type='int',
+                    default=transfer.IMPORT_BATCH,
+                    help='Events written per transaction'),
+        make_option('--id-offset',
+                    dest='id_offset',
+                    type='int',
+                    default=0,
+                    help='Add this to the event and update ids'),
+        make_option('--user',
+                    dest='user',
+                    default=None,
+                    help='Username to attribute events and updates by unknown users to'),
+    )
+
+    def handle(self, *args, **options):
+
+        if len(args) != 1:
+            raise CommandError('Give the file to import (- for stdin)')
+
+        if options['batch'] < 1 or options['id_offset'] < 0:
+            raise CommandError('--batch must be at least 1 and --id-offset at least 0')
+
+        default_user = None
+        if options['user']:
+            try:
+                default_user = User.objects.get(username=options['user']).pk
+            except User.DoesNotExist:
+                raise CommandError('There is no user %s' % options['user'])
+
+        if args[0] == '-':
+            lines = sys.stdin
+        else:
+            try:
+                lines = open(args[0])
+            except IOError, e:
+                raise CommandError('Cannot open %s: %s' % (args[0], e))
+
+        begin = time.time()
+
+        def progress(count):
+            if int(options['verbosity']) > 1:
+                self.stdout.write('%s events, %.0f events/s' % (count, count / max(time.time() - begin, 0.001)))
+
+        try:
+            count = transfer.load(lines, options['batch'], options['id_offset'], default_user, progress)
+        except (ValueError, KeyError, DatabaseError), e:
+            raise CommandError('Import failed: %s' % e)
+        finally:
+            if args[0] != '-':
+                lines.close()
+
+        elapsed = time.time() - begin
+        self.stdout.write('Imported %s events in %.3fs (%.0f events/s)' % (count, elapsed, count / max(elapsed, 0.001)))
+        self.stdout.write('Now run ssd_reindex and ssd_rollup')
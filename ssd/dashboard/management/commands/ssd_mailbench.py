@@ -0,0 +1,151 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Measure email throughput against a mail sink
+
+   Sends the same number of test messages three times, first with one
+   connection per message (the old behavior), then over one connection a
+   message per send_messages call (what the outbox worker does) and then
+   over one connection in batches of --batch, and prints the messages per
+   second of each.
+
+   With --event, sends update emails about an existing event instead,
+   first rendering the templates for every message (the old behavior) and
+   then using the cached rendering (see notify.email.event_payload).
+
+   Point EMAIL_HOST/EMAIL_PORT at a sink, never at a real relay, e.g.:
+     python -m smtpd -n -c DebuggingServer localhost:1025 > /dev/null
+     python manage.py ssd_mailbench --count 500 --batch 50
+     python manage.py ssd_mailbench --count 500 --event 12
+
+"""
+
+
+import time
+from optparse import make_option
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from ssd.dashboard import notify
+
+
+# Messages per send_messages call in the batched run
+BENCH_BATCH = 50
+
+
+class Command(BaseCommand):
+
+    help = 'Measure email throughput (batched sends, cached rendering) against a mail sink'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count',
+                    dest='count',
+                    type='int',
+                    default=200,
+                    help='Number of messages sent in each run'),
+        make_option('--batch',
+                    dest='batch',
+                    type='int',
+                    default=BENCH_BATCH,
+                    help='Messages per send_messages call in the batched run'),
+        make_option('--event',
+                    dest='event',
+                    type='int',
+                    default=None,
+                    help='Compare rendering every email about this event with the cached rendering'),
+        make_option('--to',
+                    dest='to',
+                    default='ssd-bench@localhost',
+                    help='Recipient of the test messages'),
+    )
+
+    def _report(self, label, seconds, count):
+        self.stdout.write('%-28s %8.3fs  %8.1f msg/s' % (label, seconds, count / max(seconds, 0.001)))
+
+    def _event(self, options):
+        """Time sending emails about an event, rendered every time and then from the cache"""
+
+        email = notify.email()
+        id = options['event']
+        email_from = settings.DEFAULT_FROM_EMAIL
+
+        if email.event_payload(id, False) == None:
+            raise CommandError('Event %s does not exist' % id)
+
+        self.stdout.write('Sending %s emails about event %s through %s (%s:%s)' % (options['count'], id, settings.EMAIL_BACKEND, settings.EMAIL_HOST, settings.EMAIL_PORT))
+
+        timings = []
+        connection = get_connection()
+        try:
+            connection.open()
+            for label, render in (('rendered per message', email.render_event), ('cached rendering', email.event_payload)):
+                begin = time.time()
+                for i in range(options['count']):
+                    payload = render(id, False)
+                    msg = EmailMultiAlternatives(payload['subject'], payload['text'], email_from, [options['to']], connection=connection)
+                    if payload['html']:
+                        msg.attach_alternative(payload['html'], "text/html")
+                    msg.send()
+                timings.append((label, time.time() - begin))
+        finally:
+            connection.close()
+
+        for label, seconds in timings:
+            self._report(label, seconds, options['count'])
+
+    def handle(self, *args, **options):
+
+        if options['event']:
+            return self._event(options)
+
+        msgs = [
+                EmailMultiAlternatives('SSD benchmark %s' % i, 'SSD email benchmark message', settings.DEFAULT_FROM_EMAIL, [options['to']])
+                for i in range(options['count'])
+               ]
+
+        self.stdout.write('Sending %s messages through %s (%s:%s)' % (options['count'], settings.EMAIL_BACKEND, settings.EMAIL_HOST, settings.EMAIL_PORT))
+
+        # One connection per message
+        begin = time.time()
+        for msg in msgs:
+            msg.send()
+        single = time.time() - begin
+
+        # One connection, one message per call
+        begin = time.time()
+        connection = get_connection()
+        try:
+            connection.open()
+            for msg in msgs:
+                connection.send_messages([msg])
+        finally:
+            connection.close()
+        shared = time.time() - begin
+
+        # One connection, batched
+        begin = time.time()
+        connection = get_connection()
+        try:
+            connection.open()
+            for first in range(0, len(msgs), options['batch']):
+                connection.send_messages(msgs[first:first + options['batch']])
+        finally:
+            connection.close()
+        batched = time.time() - begin
+
+        self._report('one connection per message', single, options['count'])
+        self._report('one connection', shared, options['count'])
+        self._report('batched (%s per call)' % options['batch'], batched, options['count'])
@@ -0,0 +1,76 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Send the email notifications queued in the outbox
+
+   Usage:
+     python manage.py ssd_outbox               - run forever (under supervisord, upstart, etc)
+     python manage.py ssd_outbox --once        - send whatever is due and exit (from cron)
+     python manage.py ssd_outbox --purge 30    - also delete sent rows older than 30 days
+
+   See ssd.dashboard.outbox for the retry and backoff rules.
+
+"""
+
+
+import time
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_connection
+from ssd.dashboard import outbox
+
+
+class Command(BaseCommand):
+
+    help = 'Send the email notifications queued in the outbox'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--once',
+                    action='store_true',
+                    dest='once',
+                    default=False,
+                    help='Send the notifications that are due and exit'),
+        make_option('--interval',
+                    dest='interval',
+                    type='float',
+                    default=getattr(settings, 'SSD_OUTBOX_POLL', 5),
+                    help='Seconds between checks for new notifications'),
+        make_option('--purge',
+                    dest='purge',
+                    type='int',
+                    default=None,
+                    help='Delete sent notifications older than this many days'),
+    )
+
+    def handle(self, *args, **options):
+
+        if not options['purge'] == None:
+            self.stdout.write('Purged %s sent notifications' % outbox.purge(options['purge']))
+
+        while True:
+            sent, failed = outbox.drain()
+            if sent or failed:
+                self.stdout.write('Sent %s, failed %s' % (sent, failed))
+
+            if options['once']:
+                break
+
+            # Keep draining while full batches come back, otherwise wait
+            if sent + failed < outbox.OUTBOX_BATCH:
+                # Don't hold a database connection open while idle
+                close_connection()
+                time.sleep(options['interval'])
@@ -0,0 +1,156 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Compare OFFSET and keyset pagination of the events
+
+   Times reading page 1 and a deep page (--page) of the event list ordered
+   newest first by (start, id), the way search.graph pages it, first with
+   Django's Paginator (COUNT(*) and LIMIT/OFFSET) and then with
+   keyset.KeysetPaginator (the deep page is reached through the cursor of
+   the row before it, as the Next link would).
+
+   Use a scratch database, e.g. for a 1M row table:
+     python manage.py ssd_pagebench --populate 1000000
+     python manage.py ssd_pagebench --page 5000
+     python manage.py ssd_pagebench --cleanup
+
+   The synthetic events have the description 'ssd_pagebench' and are only
+   useful for benchmarks (they have no services or updates).  --cleanup
+   also removes the ones that were archived (see ssd_explain --time).
+
+"""
+
+
+import datetime
+import time
+from optparse import make_option
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.utils import timezone as jtz
+from ssd.dashboard.models import Event, Type, Status, Archive_Event
+from ssd.dashboard import keyset
+
+
+# The description of the synthetic events
+BENCH_DESCRIPTION = 'ssd_pagebench'
+
+# Rows per INSERT when populating
+BENCH_CHUNK = 5000
+
+
+class Command(BaseCommand):
+
+    help = 'Compare OFFSET and keyset pagination of the events'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--page',
+                    dest='page',
+                    type='int',
+                    default=5000,
+                    help='The deep page to read'),
+        make_option('--per-page',
+                    dest='per_page',
+                    type='int',
+                    default=10,
+                    help='Events per page'),
+        make_option('--populate',
+                    dest='populate',
+                    type='int',
+                    default=0,
+                    help='Add this many synthetic events and exit'),
+        make_option('--cleanup',
+                    action='store_true',
+                    dest='cleanup',
+                    default=False,
+                    help='Delete the synthetic events and exit'),
+    )
+
+    def _populate(self, count):
+        """Bulk insert synthetic incidents, one minute apart"""
+
+        try:
+            type = Type.objects.get(type='incident')
+            status = Status.objects.get(status='closed')
+        except (Type.DoesNotExist, Status.DoesNotExist):
+            raise CommandError('Load the SSD initial data first')
+
+        user = User.objects.order_by('id')[:1]
+        if not user:
+            raise CommandError('Create a user first')
+
+        now = jtz.now()
+        begin = time.time()
+        for first in range(0, count, BENCH_CHUNK):
+            Event.objects.bulk_create([
+                                       Event(
+                                             type=type,
+                                             date=now,
+                                             description=BENCH_DESCRIPTION,
+                                             start=now - datetime.timedelta(minutes=i),
+                                             end=now - datetime.timedelta(minutes=i) + datetime.timedelta(hours=1),
+                                             status=status,
+                                             user=user[0]
+                                            )
+                                       for i in range(first, min(first + BENCH_CHUNK, count))
+                                      ])
+
+        self.stdout.write('Added %s events in %.3fs' % (count, time.time() - begin))
+
+    def _time(self, label, read):
+        begin = time.time()
+        rows = read()
+        self.stdout.write('%-32s %9.4fs  (%s rows)' % (label, time.time() - begin, len(rows)))
+
+    def handle(self, *args, **options):
+
+        if options['cleanup']:
+            count = 0
+            for events in (Event.objects.all(), Archive_Event.objects.all()):
+                count += events.filter(description=BENCH_DESCRIPTION).count()
+                events.filter(description=BENCH_DESCRIPTION).delete()
+            self.stdout.write('Deleted %s events' % count)
+            return
+
+        if options['populate']:
+            return self._populate(options['populate'])
+
+        per_page = options['per_page']
+        deep = options['page']
+        events = Event.objects.values('id','start','description')
+        total = events.count()
+
+        if total < deep * per_page:
+            raise CommandError('Page %s needs at least %s events (there are %s), see --populate' % (deep, deep * per_page, total))
+
+        self.stdout.write('%s events, %s per page' % (total, per_page))
+
+        # The row before the deep page, whose cursor the Next link of the previous page holds
+        boundary = events.order_by('-start','-id')[(deep - 1) * per_page - 1]
+        cursor = keyset.encode('n', [boundary['start'], boundary['id']])
+
+        paginator = Paginator(events.order_by('-start','-id'), per_page)
+        self._time('offset page 1', lambda: list(paginator.page(1)))
+        paginator = Paginator(events.order_by('-start','-id'), per_page)
+        self._time('offset page %s' % deep, lambda: list(paginator.page(deep)))
+
+        paginator = keyset.KeysetPaginator(events, per_page, ('start','id'))
+        self._time('keyset page 1', lambda: paginator.page(None).object_list)
+        self._time('keyset page %s' % deep, lambda: paginator.page(cursor).object_list)
+
+        paginator = keyset.KeysetPaginator(events, per_page, ('start','id'), count_key=keyset.count_key('ssd_pagebench', total))
+        paginator.page(None)
+        self._time('keyset page %s (cached count)' % deep, lambda: paginator.page(cursor).object_list)
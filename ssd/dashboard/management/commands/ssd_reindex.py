@@ -0,0 +1,59 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Rebuild the full-text search index
+
+   Usage:
+     python manage.py ssd_reindex              - index every event
+     python manage.py ssd_reindex --event 12   - only event 12
+
+   The write views keep the index current, so this is only needed after an
+   upgrade, a change of SSD_SEARCH_BACKEND or changes made outside of SSD.
+
+"""
+
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from ssd.dashboard.models import Event
+from ssd.dashboard import search_index
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the full-text search index of the events'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--event',
+                    action='append',
+                    dest='events',
+                    type='int',
+                    default=[],
+                    help='Only index this event id (may be repeated)'),
+    )
+
+    def handle(self, *args, **options):
+
+        ids = options['events'] or Event.objects.values_list('id', flat=True).order_by('id')
+
+        begin = time.time()
+        count = 0
+        for id in ids:
+            search_index.update(id)
+            count += 1
+
+        self.stdout.write('Indexed %s events in %.3fs (%s backend)' % (count, time.time() - begin, search_index.backend().__class__.__name__))
@@ -0,0 +1,64 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Rebuild the daily service availability rollup and the hourly event counts
+
+   Usage:
+     python manage.py ssd_rollup                      - rebuild every day
+     python manage.py ssd_rollup --since 2013-06-01   - only from this UTC day on
+
+   See ssd.dashboard.rollup and ssd.dashboard.event_counts.  The write
+   views keep both current, so this is only needed after an upgrade or
+   changes made outside of SSD.
+
+"""
+
+
+import datetime
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ssd.dashboard import event_counts
+from ssd.dashboard import rollup
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuild the daily service availability rollup and the hourly event counts from the events'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--since',
+                    dest='since',
+                    default=None,
+                    help='Only rebuild from this UTC day (YYYY-MM-DD) on'),
+    )
+
+    def handle(self, *args, **options):
+
+        since = None
+        if options['since']:
+            try:
+                since = datetime.datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Improperly formatted date, use YYYY-MM-DD.')
+
+        begin = time.time()
+        count = rollup.backfill(since)
+        self.stdout.write('Wrote %s service days in %.3fs' % (count, time.time() - begin))
+
+        begin = time.time()
+        count = event_counts.backfill(since)
+        self.stdout.write('Wrote %s hourly event counts in %.3fs' % (count, time.time() - begin))
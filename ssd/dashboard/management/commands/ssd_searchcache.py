@@ -0,0 +1,50 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Show the hit and miss counters of the search result cache
+
+   Usage:
+     python manage.py ssd_searchcache          - print the counters
+     python manage.py ssd_searchcache --reset  - print and then zero them
+
+"""
+
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from ssd.dashboard import search_cache
+
+
+class Command(BaseCommand):
+
+    help = 'Show the hit and miss counters of the search result cache'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reset',
+                    action='store_true',
+                    dest='reset',
+                    default=False,
+                    help='Zero the counters after printing them'),
+    )
+
+    def handle(self, *args, **options):
+
+        stats = search_cache.stats()
+        self.stdout.write('hits: %(hits)s  misses: %(misses)s  hit ratio: %(ratio).1f%%' % dict(stats, ratio=stats['ratio'] * 100))
+
+        if options['reset']:
+            search_cache.reset()
+            self.stdout.write('Counters reset')
@@ -0,0 +1,67 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Publish the static snapshot of the public status pages
+
+   Usage:
+     python manage.py ssd_snapshot              - regenerate every page
+     python manage.py ssd_snapshot --event 12   - only the pages touched by event 12
+
+   Both print a timing report.  Run the full regeneration from cron (at least
+   once a day, since the dashboard moves with the date).
+
+"""
+
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from ssd.dashboard import snapshot
+
+
+class Command(BaseCommand):
+
+    help = 'Render the public status pages into SSD_SNAPSHOT_DIR'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--event',
+                    action='append',
+                    dest='events',
+                    type='int',
+                    default=[],
+                    help='Only re-render the pages touched by this event id (may be repeated)'),
+    )
+
+    def handle(self, *args, **options):
+
+        if not snapshot.enabled():
+            raise CommandError('SSD_SNAPSHOT_DIR is not set in local_settings.py')
+
+        begin = time.time()
+        if options['events']:
+            mode = 'Incremental'
+            timings = []
+            for id in options['events']:
+                timings.extend(snapshot.publish_event(id))
+        else:
+            mode = 'Full'
+            timings = snapshot.publish()
+        total = time.time() - begin
+
+        for page, seconds in timings:
+            self.stdout.write('%8.3fs  %s' % (seconds, page))
+
+        self.stdout.write('%s regeneration: %s pages in %.3fs (written to %s)' % (mode, len(timings), total, snapshot.SNAPSHOT_DIR))
@@ -78,11 +78,16 @@ class Event(models.Model):
     type = models.ForeignKey(Type)
     date = models.DateTimeField(blank=False, auto_now=True)
     description = models.CharField(blank=False, max_length=1000)
-    start = models.DateTimeField(blank=False)
+    start = models.DateTimeField(blank=False, db_index=True)
     end = models.DateTimeField(null=True, blank=True)
     status = models.ForeignKey(Status)
     user = models.ForeignKey(User)
 
+    class Meta:
+        # The dashboard and search read events by start date, by status
+        # (open and started events) and by type (the graph)
+        index_together = (('status', 'start'), ('type', 'start'))
+
 
 class Event_Service(models.Model):
     """Tie services to events"""
@@ -90,6 +95,9 @@ class Event_Service(models.Model):
     event = models.ForeignKey(Event)
     service = models.ForeignKey(Service)
 
+    class Meta:
+        index_together = (('service', 'event'),)
+
 
 class Event_Impact(models.Model):
     """Event Impact Analysis (maintenance specific)
@@ -112,14 +120,17 @@ class Event_Coordinator(models.Model):
 
 
 class Event_Email(models.Model):
-    """Event Email Recipient
-        - only one entry allowed per event
+    """Event Email Recipients
+        - any number of recipients per event, each one only once
 
     """
 
-    event = models.ForeignKey(Event, unique=True)
+    event = models.ForeignKey(Event)
     email = models.ForeignKey(Email)
 
+    class Meta:
+        unique_together = ('event', 'email')
+
 
 class Event_Update(models.Model):
     """Updates to Events"""
@@ -129,6 +140,10 @@ class Event_Update(models.Model):
     update = models.CharField(blank=False, max_length=1000)
     user = models.ForeignKey(User)
 
+    class Meta:
+        # The updates of an event are read in order
+        index_together = (('event', 'id'),)
+
 
 class Escalation(models.Model):
     """Escalation Contacts"""
@@ -139,6 +154,134 @@ class Escalation(models.Model):
     hidden = models.BooleanField(blank=False)
 
 
+class Event_Search(models.Model):
+    """Searchable text of an event (description and updates) for the MySQL search backend
+        - FULLTEXT indexed, see sql/event_search.mysql.sql and search_index.py
+
+    """
+
+    event = models.ForeignKey(Event, unique=True)
+    text = models.TextField(blank=True)
+
+
+class Search_Term(models.Model):
+    """Inverted index of event terms for the pure-Python search backend (see search_index.py)"""
+
+    term = models.CharField(blank=False, max_length=50, db_index=True)
+    event = models.ForeignKey(Event)
+    weight = models.PositiveIntegerField(blank=False)
+
+
+class Email_Outbox(models.Model):
+    """Email notifications waiting to be sent by the ssd_outbox worker
+
+       kind is 'event' (an incident or maintenance email to the event's
+       recipient) or 'page' (a text page with message to the pager address).
+       timezone is the one the event dates are shown in (that of the admin
+       who made the change) and event_date the modification date of the
+       event when it was queued.  status is 'pending', 'sent' or 'failed'.
+
+    """
+
+    kind = models.CharField(blank=False, max_length=10)
+    event = models.ForeignKey(Event, null=True, blank=True)
+    email = models.ForeignKey(Email, null=True, blank=True)
+    new = models.BooleanField(blank=False)
+    timezone = models.CharField(null=False, blank=True, max_length=50)
+    event_date = models.DateTimeField(null=True, blank=True)
+    message = models.CharField(null=False, blank=True, max_length=1000)
+    status = models.CharField(blank=False, max_length=10)
+    attempts = models.PositiveIntegerField(blank=False, default=0)
+    created = models.DateTimeField(blank=False)
+    next_attempt = models.DateTimeField(blank=False)
+    sent = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(null=False, blank=True, max_length=1000)
+
+
+class Service_Day(models.Model):
+    """Daily availability rollup of a service (see rollup.py)
+        - one row per service and UTC day with any events, days without a row had none
+        - minutes are those of the day covered by ended incidents and (non planning) maintenances
+        - counts are the incidents and maintenances starting on the day
+
+    """
+
+    service = models.ForeignKey(Service)
+    day = models.DateField(blank=False)
+    incident_minutes = models.PositiveIntegerField(blank=False, default=0)
+    maintenance_minutes = models.PositiveIntegerField(blank=False, default=0)
+    incidents = models.PositiveIntegerField(blank=False, default=0)
+    maintenances = models.PositiveIntegerField(blank=False, default=0)
+
+    class Meta:
+        unique_together = ('service', 'day')
+
+
+class Event_Count_Hour(models.Model):
+    """Hourly event counts for the dashboard graph (see event_counts.py)
+        - one row per type and UTC hour in which any events start, hours without a row had none
+
+    """
+
+    type = models.ForeignKey(Type)
+    hour = models.DateTimeField(blank=False, db_index=True)
+    count = models.PositiveIntegerField(blank=False, default=0)
+
+    class Meta:
+        unique_together = ('type', 'hour')
+
+
+#-- Archive Models -- #
+
+
+class Archive_Event(models.Model):
+    """Closed events moved out of Event by the ssd_archive command (see archive.py)
+        - the id is the one the event had in Event
+        - impact and coordinator are the maintenance specific Event_Impact and Event_Coordinator
+        - text is the description and updates, for text searches
+
+    """
+
+    id = models.IntegerField(primary_key=True)
+    type = models.ForeignKey(Type)
+    date = models.DateTimeField(blank=False)
+    description = models.CharField(blank=False, max_length=1000)
+    start = models.DateTimeField(blank=False, db_index=True)
+    end = models.DateTimeField(null=True, blank=True)
+    status = models.ForeignKey(Status)
+    user = models.ForeignKey(User)
+    impact = models.CharField(blank=True, max_length=1000)
+    coordinator = models.CharField(blank=True, max_length=250)
+    text = models.TextField(blank=True)
+    archived = models.DateTimeField(blank=False)
+
+    class Meta:
+        index_together = (('type', 'start'),)
+
+
+class Archive_Event_Service(models.Model):
+    """Services of archived events"""
+
+    event = models.ForeignKey(Archive_Event)
+    service = models.ForeignKey(Service)
+
+    class Meta:
+        index_together = (('service', 'event'),)
+
+
+class Archive_Event_Update(models.Model):
+    """Updates to archived events
+        - the id is the one the update had in Event_Update
+
+    """
+
+    id = models.IntegerField(primary_key=True)
+    event = models.ForeignKey(Archive_Event)
+    date = models.DateTimeField(blank=False)
+    update = models.CharField(blank=False, max_length=1000)
+    user = models.ForeignKey(User)
+
+
 #-- Configuration Models -- #
 
 
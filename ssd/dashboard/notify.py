@@ -16,7 +16,8 @@
 
 """Email class for SSD
 
-   This class handles the sending of emails and pages to the appropriate recipients
+   This class handles the building of emails and pages to the appropriate recipients.
+   The views queue them in the outbox and the ssd_outbox worker sends them (see outbox.py).
 
 """
 
@@ -26,14 +27,29 @@ from django.template.loader import get_template
 from django.template import Context
 from django.utils import timezone as jtz
 from ssd.dashboard.models import Email
-from ssd.dashboard.models import Event
-from ssd.dashboard.models import Config_Email, Config_Systemurl
+from ssd.dashboard import event_doc
+from ssd.dashboard import functions
+from ssd.dashboard import localcache
+from ssd.dashboard import siteconfig
 
 
 # Get an instance of the ssd logger
 logger = logging.getLogger(__name__)
 
 
+# Compiled email templates, loaded once per process
+_templates = {}
+
+
+def _template(name):
+    """Return a compiled template, loading it the first time it's used"""
+
+    if not name in _templates:
+        _templates[name] = get_template(name)
+
+    return _templates[name]
+
+
 class email:
 
     """
@@ -46,98 +62,69 @@ class email:
 
         """
 
-    def page(self,message):
+    def page_message(self,message):
         """
-        Send a short text message/page in text format
+        Build a short text message/page in text format
         The required format of EmailMessage is as follows:
           - EmailMessage(subject,body,from_email,[to_email],[bcc_email],headers,[cc_email]
-          - If there is an error, the user will be notified and an Apache error log will be generated
 
         """
 
-        # Obtain the recipient email address
-        text_pager = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('text_pager')[0]['text_pager']
+        email_config = siteconfig.get().email
 
-        # Obtain the sender email address and instantiate the message
-        from_address = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('from_address')[0]['from_address']
-        pager = EmailMessage('Incident Alert',message,from_address,[text_pager],None,None,None)
+        # Obtain the recipient and sender email addresses and instantiate the message
+        return EmailMessage('Incident Alert',message,email_config.from_address,[email_config.text_pager],None,None,None)
 
-        # If there is an issue, the user will be notified
-        try:
-            pager.send()
-        except Exception, e:
-            # Log to the error log and return the error to the caller
-            logger.error('Error sending text page: %s' % e)
 
-
-    def email_event(self,id,email_id,set_timezone,new):
+    def render_event(self,id,new):
         """
-        Send an email message in HTML or TEXT format about a new or existing incident
-           - If HTML formatting is selected, a multi-part MIME message will be sent w/ the text
-             version as well
+        Render the subject and bodies of an email in HTML or TEXT format about a new or existing incident
+           - Returns {'subject':..., 'text':..., 'html':...} (html is None unless HTML formatting
+             is selected), or {} if the event no longer exists
         """
 
 
-        logger.debug('Sending email for event: %s' % id)
+        logger.debug('Rendering email for event: %s' % id)
 
-        # Obain the incident detail
-        details = Event.objects.filter(id=id).values(
-                                                    'status__status',
-                                                    'start',
-                                                    'end',
-                                                    'description',
-                                                    'type__type',
-                                                    'event_impact__impact',
-                                                    'event_coordinator__coordinator'
-                                                    )
+        # Obtain the cached event document (details, services and updates)
+        doc = event_doc.get(id)
+        if doc == None:
+            logger.error('Event %s does not exist, exiting' % id)
+            return {}
 
-        # Which services were impacted
-        services = Event.objects.filter(id=id).values('event_service__service__service_name')
+        details = doc['details']
+        services = doc['services']
+        updates = doc['updates']
 
-        # Obain any incident updates
-        updates = Event.objects.filter(id=id).values(
-                                                'event_update__id',
-                                                'event_update__date',
-                                                'event_update__update',
-                                                ).order_by('event_update__id')
-
-        # If there are no updates, set to None
-        if len(updates) == 1 and updates[0]['event_update__date'] == None:
-            updates = None
-
-        # Obtain the recipient email address
-        recipient = Email.objects.filter(id=email_id).values('email')[0]['email']
-
-        # Obtain the sender email address
-        email_from = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('from_address')[0]['from_address']
+        config = siteconfig.get()
 
         # Obtain the ssd url
-        ssd_url = Config_Systemurl.objects.filter(id=Config_Systemurl.objects.values('id')[0]['id']).values('url')[0]['url']
+        ssd_url = config.systemurl.url
 
         # HTML (true) or text (false) formatting and footer
-        email_config = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('email_format','email_footer')
+        email_config = config.email
 
         # Obtain the greeting
         if new == True:
             if details[0]['type__type'] == 'incident':
-                greeting = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('incident_greeting')[0]['incident_greeting']
+                greeting = email_config.incident_greeting
                 email_subject = 'Incident Notification - ID:%s' % id
             elif details[0]['type__type'] == 'maintenance':
-                greeting = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('maintenance_greeting')[0]['maintenance_greeting']
+                greeting = email_config.maintenance_greeting
                 email_subject = 'Maintenance Notification - ID:%s' % id
             else:
                 logger.error('Unknown event type, exiting')
-                return
+                return {}
         else:
             if details[0]['type__type'] == 'incident':
-                greeting = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('incident_update')[0]['incident_update']
+                greeting = email_config.incident_update
                 email_subject = 'Incident Update - ID:%s' % id
             elif details[0]['type__type'] == 'maintenance':
-                greeting = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('maintenance_update')[0]['maintenance_update']
+                greeting = email_config.maintenance_update
                 email_subject = 'Maintenance Update - ID:%s' % id
             else:
                 logger.error('Unknown event type, exiting')
-                return
+                return {}
 
 
         # Setup the context and interpolate the values in the template
@@ -147,36 +134,84 @@ class email:
                      'services':services,
                      'updates':updates,
                      'ssd_url':ssd_url,
-                     'email_footer':email_config[0]['email_footer']
+                     'email_footer':email_config.email_footer
                     })
 
+        payload = {
+                   'subject':email_subject,
+                   'text':_template('email/email.txt').render(d),
+                   'html':None
+                  }
+
+        # If HTML is requested, render the html template as well
+        if email_config.email_format == 1:
+            payload['html'] = _template('email/email.html').render(d)
+
+        return payload
+
+
+    def event_payload(self,id,new,date=None):
+        """
+        Return the rendered subject and bodies of an email about an event (see render_event)
+           - date is the modification date of the event the email is about, the cached event
+             document is rebuilt first if it is older (see event_doc.get)
+           - Cached per event document version, configuration version, greeting, format and
+             (current) timezone, so an update is rendered once however many recipients (and
+             workers) it is sent to
+           - Returns None if the event no longer exists
+        """
+
+        # Make sure the cached document (and so its version) has the change
+        if event_doc.get(id,date) == None:
+            return None
+
+        key = 'email_payload_%s_%s_%s_%s_%s_%s' % (
+                                                   event_doc.version(id),
+                                                   localcache.version(),
+                                                   int(id),
+                                                   int(bool(new)),
+                                                   int(siteconfig.get().email.email_format),
+                                                   jtz.get_current_timezone_name()
+                                                  )
 
-        # Setup and send the message
-        try:
-            # Render the text template
-            # If html formatting is requested, we'll render that one later
-            rendered_template_txt = get_template('email/email.txt').render(d)
+        return functions.cache_get_or_compute(logger, key, lambda: self.render_event(id,new)) or None
 
+
+    def event_messages(self,id,email_ids,new,date=None):
+        """
+        Build the email messages in HTML or TEXT format about a new or existing incident
+           - If HTML formatting is selected, multi-part MIME messages will be built w/ the text
+             version as well
+           - Every recipient gets its own copy of the (cached) rendered message
+           - Returns a dict of email id: message (recipients that no longer exist are left out)
+             or None if the event no longer exists
+           - date is the modification date of the event (see event_payload)
+        """
+
+
+        logger.debug('Building email for event: %s' % id)
+
+        payload = self.event_payload(id,new,date)
+        if payload == None:
+            return None
+
+        # Obtain the sender and recipient email addresses
+        email_from = siteconfig.get().email.from_address
+        recipients = Email.objects.filter(id__in=email_ids).values('id','email')
+
+        msgs = {}
+        for recipient in recipients:
             msg = EmailMultiAlternatives(
-                                            email_subject,
-                                            rendered_template_txt,
+                                            payload['subject'],
+                                            payload['text'],
                                             email_from,
-                                            [recipient]
+                                            [recipient['email']]
                                         )
 
             # If HTML is requested, setup a multipart message
-            if email_config[0]['email_format'] == 1:
-                # Render the html template and attach it
-                rendered_template_html = get_template('email/email.html').render(d)
-                msg.attach_alternative(rendered_template_html, "text/html")
-
-            # Send the message
-            msg.send()
-        except Exception, e:
-            # Log to the error log and return the error to the caller
-            logger.error('Error sending event email: %s' % e)
-            return
-
-        return 'success'
+            if payload['html']:
+                msg.attach_alternative(payload['html'], "text/html")
 
+            msgs[recipient['id']] = msg
 
+        return msgs
@@ -0,0 +1,241 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Email outbox for SSD
+
+   The views never talk to the mail relay.  They queue a row in the
+   Email_Outbox table inside the same transaction as the event change (so a
+   notification is never lost or sent for a change that was rolled back) and
+   return immediately.  The ssd_outbox management command drains the table:
+
+     python manage.py ssd_outbox           - run forever, polling every SSD_OUTBOX_POLL seconds
+     python manage.py ssd_outbox --once    - send whatever is due and exit (for cron)
+
+   A failed send is retried up to SSD_OUTBOX_ATTEMPTS times, waiting
+   SSD_OUTBOX_BACKOFF seconds after the first failure and doubling the wait
+   after each one (up to SSD_OUTBOX_BACKOFF_MAX).  After the last attempt
+   the row is marked failed and kept with its error for the admin.
+
+   Rows are claimed with a conditional update that pushes next_attempt out
+   by OUTBOX_LEASE seconds, so several workers can run at once and a row
+   claimed by a worker that died is picked up again once the lease expires.
+
+   Each notified recipient of an event gets its own row.  Messages are built
+   when they are sent, from the cached event document, rendering the
+   templates once per event (in the timezone of the admin who queued them,
+   as the views would have), and go out through Django's EMAIL_BACKEND over
+   one connection per drain.  Each message is sent and recorded on its own,
+   so a refused recipient only fails its own row.  The pipeline can be tested with the locmem backend or a local SMTP
+   stand-in (see the ssd_mailbench command for a throughput check).
+
+"""
+
+
+import datetime
+import logging
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone as jtz
+from ssd.dashboard.models import Event, Email_Outbox
+from ssd.dashboard import notify
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Number of send attempts before a message is marked failed
+OUTBOX_ATTEMPTS = getattr(settings, 'SSD_OUTBOX_ATTEMPTS', 5)
+
+# Seconds to wait after the first failure (doubled after each one) and the longest wait
+OUTBOX_BACKOFF = getattr(settings, 'SSD_OUTBOX_BACKOFF', 60)
+OUTBOX_BACKOFF_MAX = getattr(settings, 'SSD_OUTBOX_BACKOFF_MAX', 3600)
+
+# Seconds a worker owns a claimed row before another worker may retry it
+OUTBOX_LEASE = 300
+
+# Maximum number of rows sent per drain
+OUTBOX_BATCH = getattr(settings, 'SSD_OUTBOX_BATCH', 500)
+
+# The columns a worker needs to send a row
+OUTBOX_VALUES = ('id','kind','event_id','email_id','new','timezone','event_date','message','attempts','next_attempt')
+
+
+def _queue(**fields):
+    """Add a pending row to the outbox"""
+
+    now = jtz.now()
+    row = Email_Outbox.objects.create(status='pending', created=now, next_attempt=now, **fields)
+    logger.debug('Queued %s notification %s' % (fields['kind'], row.pk))
+
+    return row.pk
+
+
+def queue_event(id, email_ids, new, timezone):
+    """Queue an email about a new (new=True) or updated event to each email address in email_ids
+
+    The event dates are shown in timezone (the name of the admin's timezone).
+    Call it in the transaction that changes the event: the modification date
+    it records tells the worker whether the cached event document already
+    has the change (the views only refresh it after the commit).
+
+    """
+
+    event_date = Event.objects.filter(id=id).values_list('date', flat=True)[0]
+
+    return [_queue(kind='event', event_id=id, email_id=email_id, new=new, timezone=timezone, event_date=event_date) for email_id in email_ids]
+
+
+def queue_page(message):
+    """Queue a text page to the pager address"""
+
+    return _queue(kind='page', message=message[:1000])
+
+
+def backoff(attempts):
+    """Return the seconds to wait before retrying a row that failed attempts times"""
+
+    return min(OUTBOX_BACKOFF * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+
+def _claim(row, now):
+    """Take ownership of a due row, returns False if another worker got it first"""
+
+    return Email_Outbox.objects.filter(
+                                       id=row['id'],
+                                       status='pending',
+                                       next_attempt=row['next_attempt']
+                                      ).update(next_attempt=now + datetime.timedelta(seconds=OUTBOX_LEASE)) == 1
+
+
+def _sent(row):
+    """Record a successful send"""
+
+    Email_Outbox.objects.filter(id=row['id']).update(status='sent', attempts=row['attempts'] + 1, sent=jtz.now(), error='')
+
+
+def _failed(row, error, retry=True):
+    """Record a failed send, scheduling a retry unless it was the last attempt (or retry is False)"""
+
+    attempts = row['attempts'] + 1
+    logger.error('Error sending outbox row %s (attempt %s): %s' % (row['id'], attempts, error))
+
+    if not retry or attempts >= OUTBOX_ATTEMPTS:
+        Email_Outbox.objects.filter(id=row['id']).update(status='failed', attempts=attempts, error=str(error)[:1000])
+    else:
+        Email_Outbox.objects.filter(id=row['id']).update(
+                                                         attempts=attempts,
+                                                         next_attempt=jtz.now() + datetime.timedelta(seconds=backoff(attempts)),
+                                                         error=str(error)[:1000]
+                                                        )
+
+
+def _messages(rows):
+    """Build the message of each claimed row, returns a list of (row, message)
+
+    The rows about the same event (and timezone) share one rendering of the
+    templates (see notify.email.event_messages), made with the row's
+    timezone active.  Rows that can't be built are recorded as failed here.
+
+    """
+
+    email = notify.email()
+    pending = []
+
+    # Group the event rows by event, greeting and timezone
+    events = {}
+    for row in rows:
+        if row['kind'] == 'event':
+            events.setdefault((row['event_id'], row['new'], row['timezone']), []).append(row)
+        elif row['kind'] == 'page':
+            try:
+                pending.append((row, email.page_message(row['message'])))
+            except Exception, e:
+                _failed(row, e)
+        else:
+            _failed(row, 'Unknown outbox row kind: %s' % row['kind'], retry=False)
+
+    for (id, new, timezone), group in events.items():
+        try:
+            jtz.activate(timezone or settings.TIME_ZONE)
+            msgs = email.event_messages(id, [row['email_id'] for row in group], new, max([row['event_date'] for row in group]))
+        except Exception, e:
+            for row in group:
+                _failed(row, e)
+            continue
+        finally:
+            jtz.deactivate()
+
+        for row in group:
+            if msgs and row['email_id'] in msgs:
+                pending.append((row, msgs[row['email_id']]))
+            else:
+                # Retrying won't help (the event or its recipient is gone)
+                _failed(row, 'Nothing to send', retry=False)
+
+    return pending
+
+
+def drain(limit=OUTBOX_BATCH):
+    """Send the rows that are due, returns the number (sent, failed)
+
+    The messages go out over one connection, one send_messages call each,
+    so a failed message (a refused recipient, or a relay that dropped the
+    connection) is only retried for its own row.  The connection is reopened
+    for the next message after a failure.
+
+    """
+
+    now = jtz.now()
+    rows = Email_Outbox.objects.filter(status='pending', next_attempt__lte=now).values(*OUTBOX_VALUES).order_by('next_attempt','id')[:limit]
+
+    # Only keep the rows this worker managed to claim
+    rows = [row for row in rows if _claim(row, now)]
+    if not rows:
+        return 0, 0
+
+    pending = _messages(rows)
+
+    sent = 0
+    connection = get_connection()
+    try:
+        for row, msg in pending:
+            try:
+                # Reopens the connection if a previous message broke it
+                connection.open()
+                connection.send_messages([msg])
+            except Exception, e:
+                _failed(row, e)
+                connection.close()
+                continue
+
+            _sent(row)
+            sent += 1
+    finally:
+        connection.close()
+
+    return sent, len(rows) - sent
+
+
+def purge(days):
+    """Delete sent rows older than days, returns the number removed"""
+
+    cutoff = jtz.now() - datetime.timedelta(days=days)
+    old = Email_Outbox.objects.filter(status='sent', sent__lt=cutoff)
+    count = old.count()
+    old.delete()
+
+    return count
@@ -0,0 +1,311 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Daily service availability rollup for SSD
+
+   Answering "how available was service X over the last 90 days" from the
+   events means reading the whole event history.  Instead the Service_Day
+   table holds one row per service and UTC day with:
+
+     incident_minutes    - minutes of the day covered by incidents
+     maintenance_minutes - minutes of the day covered by maintenances
+     incidents           - incidents starting on the day
+     maintenances        - maintenances starting on the day
+
+   Overlapping events are only counted once and planned maintenances
+   (status planning) are left out, like on the dashboard.  Days without
+   any events have no row.
+
+   The write views take a snapshot() of the event in their transaction
+   before and after changing it (the first one locks the event, so two
+   writes to the same event take turns) and once the transaction is
+   committed pass both to update(), which recomputes only the (service,
+   day) rows the event touched before and after the write.  update() runs
+   in its own transaction and locks the services before it reads the
+   events, so it sees every write committed before it (a write that held
+   the lock has committed) and concurrent writes rebuild their rows one at
+   a time.  If it fails the write stays and the error is logged, 'manage.py
+   ssd_rollup' rebuilds the table from the event history (see backfill).
+   Archived events (see archive.py) are included.
+
+   Events that have not ended (open incidents) have no minutes in the
+   table, since they grow by the minute.  availability() adds them up to
+   the current time when it reads the rollup.
+
+"""
+
+
+import datetime
+import logging
+import pytz
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone as jtz
+from ssd.dashboard.models import Event, Service, Event_Service, Service_Day, Archive_Event_Service
+from ssd.dashboard import event_cache
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Minutes in a day
+DAY_MINUTES = 1440
+
+# The columns read for each event/service combination
+ROLLUP_VALUES = ('id','service_id','event__type__type','event__start','event__end')
+
+# The columns of a day returned by availability
+DAY_VALUES = ('day','incident_minutes','maintenance_minutes','incidents','maintenances')
+
+# Event/service rows read at a time by backfill and rollup rows written at a time
+ROLLUP_CHUNK = 1000
+
+
+def _bounds(day):
+    """Return the aware datetimes of the start of a UTC day and of the next one"""
+
+    start = pytz.utc.localize(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
+
+
+def _rows(queryset):
+    """Return the event/service rows of a queryset that count towards availability"""
+
+    return queryset.exclude(event__status__status='planning').values(*ROLLUP_VALUES)
+
+
+def _minutes(intervals):
+    """Return the minutes covered by a list of (start, end) intervals, counting overlaps once"""
+
+    seconds = 0
+    current = None
+    for start, end in sorted(intervals):
+        if current and start <= current[1]:
+            current = (current[0], max(current[1], end))
+        else:
+            if current:
+                seconds += (current[1] - current[0]).total_seconds()
+            current = (start, end)
+    if current:
+        seconds += (current[1] - current[0]).total_seconds()
+
+    return int(round(seconds / 60))
+
+
+def _add(cells, row, end=None):
+    """Add an event/service row to a dict of (service_id, day) -> cell
+
+    end is used for events that have not ended (otherwise they only count
+    as started).
+
+    """
+
+    type = row['event__type__type']
+    start = row['event__start']
+    end = row['event__end'] or end
+
+    def cell(day):
+        key = (row['service_id'], day)
+        if not key in cells:
+            cells[key] = {'incident':[], 'maintenance':[], 'incidents':0, 'maintenances':0}
+        return cells[key]
+
+    cell(start.astimezone(pytz.utc).date())['%ss' % type] += 1
+
+    if end == None or end <= start:
+        return
+
+    # Split the event into the parts that fall on each UTC day
+    for day in event_cache.utc_days(start, end):
+        day_start, day_end = _bounds(day)
+        part = (max(start, day_start), min(end, day_end))
+        if part[1] > part[0]:
+            cell(day)[type].append(part)
+
+
+def _record(service_id, day, cell):
+    """Return the Service_Day of a cell"""
+
+    return Service_Day(
+                       service_id=service_id,
+                       day=day,
+                       incident_minutes=_minutes(cell['incident']),
+                       maintenance_minutes=_minutes(cell['maintenance']),
+                       incidents=cell['incidents'],
+                       maintenances=cell['maintenances']
+                      )
+
+
+def snapshot(id):
+    """Return the rollup relevant state of an event (its services and days), or None if it does not exist
+
+    Take a snapshot before and after writing an event, in the transaction of
+    the write, and pass both to update once it's committed.  The event is
+    locked until the end of the transaction, and read with locking reads so
+    the snapshot is never older than the last committed write.
+
+    """
+
+    list(Event.objects.select_for_update().filter(id=id).values_list('id', flat=True))
+    rows = list(Event_Service.objects.select_for_update().filter(event_id=id).values('service_id','event__start','event__end'))
+    if not rows:
+        return None
+
+    start = rows[0]['event__start']
+    return {
+            'services':set([row['service_id'] for row in rows]),
+            'days':event_cache.utc_days(start, max(rows[0]['event__end'] or start, start))
+           }
+
+
+def update(*states):
+    """Recompute the rollup rows touched by an event write
+
+    Each state is a snapshot of the event (or None when the event did not
+    exist before, or no longer exists after, the write).  Call it after the
+    write is committed, outside of any transaction: the events are read
+    after the services are locked, which only shows the writes committed in
+    the meantime if it's the start of the transaction (MySQL's repeatable
+    read keeps the view of the first read).  Errors are logged rather than
+    raised, since the write itself is done.
+
+    """
+
+    # The days to recompute for each service
+    services = {}
+    for state in states:
+        if state:
+            for service_id in state['services']:
+                services.setdefault(service_id, set()).update(state['days'])
+
+    if not services:
+        return
+
+    try:
+        _update(services)
+    except DatabaseError, e:
+        logger.error('Error updating the availability rollup of services %s (run ssd_rollup to repair it): %s' % (sorted(services.keys()), e))
+
+
+def _update(services):
+    """Recompute the rollup rows of a dict of service id -> days in one transaction"""
+
+    with transaction.atomic():
+        # The rows are rebuilt with a delete and an insert, which two writes to the same service
+        # must not interleave (the duplicate insert would fail), so lock the services first, in
+        # id order so two writes can't deadlock
+        list(Service.objects.select_for_update().filter(id__in=services.keys()).values_list('id', flat=True).order_by('id'))
+
+        for service_id, days in sorted(services.items()):
+            q_start = _bounds(min(days))[0]
+            q_end = _bounds(max(days))[1]
+
+            # Everything live or archived that starts in or overlaps the days
+            cells = {}
+            for event_services in (Event_Service.objects.all(), Archive_Event_Service.objects.all()):
+                rows = _rows(event_services.filter(
+                                                   Q(event__end__gt=q_start) | Q(event__end=None,event__start__gte=q_start),
+                                                   service_id=service_id,
+                                                   event__start__lt=q_end
+                                                  ))
+                for row in rows:
+                    _add(cells, row)
+
+            Service_Day.objects.filter(service_id=service_id, day__in=days).delete()
+            Service_Day.objects.bulk_create([_record(service_id, day, cell) for (s, day), cell in cells.items() if day in days])
+
+            logger.debug('Rolled up %s days of service %s' % (len(days), service_id))
+
+
+def backfill(since=None):
+    """Rebuild the rollup from the event history (from the UTC day since on, if given), returns the rows written
+
+    The live and archived event/service rows are read ROLLUP_CHUNK at a
+    time, in id order.
+
+    """
+
+    cells = {}
+    for queryset in (Event_Service.objects.all(), Archive_Event_Service.objects.all()):
+        if since:
+            since_start = _bounds(since)[0]
+            queryset = queryset.filter(Q(event__start__gte=since_start) | Q(event__end__gt=since_start))
+
+        last = 0
+        while True:
+            rows = list(_rows(queryset.filter(id__gt=last)).order_by('id')[:ROLLUP_CHUNK])
+            if not rows:
+                break
+
+            for row in rows:
+                _add(cells, row)
+            last = rows[-1]['id']
+
+    records = [_record(service_id, day, cell) for (service_id, day), cell in sorted(cells.items()) if not since or day >= since]
+
+    with transaction.atomic():
+        # Keep the write views out of the table while it's rebuilt (see update)
+        list(Service.objects.select_for_update().values_list('id', flat=True).order_by('id'))
+
+        old = Service_Day.objects.all()
+        if since:
+            old = old.filter(day__gte=since)
+        old.delete()
+
+        for first in range(0, len(records), ROLLUP_CHUNK):
+            Service_Day.objects.bulk_create(records[first:first + ROLLUP_CHUNK])
+
+    return len(records)
+
+
+def availability(service_id, first, last):
+    """Return the availability of a service over the UTC days first through last (inclusive)
+
+    Returns a dict with the totals, the uptime (the percentage of the range
+    without incidents) and the list of days that had events.
+
+    """
+
+    days = {}
+    for row in Service_Day.objects.filter(service_id=service_id, day__range=[first, last]).values(*DAY_VALUES).order_by('day'):
+        days[row['day']] = row
+
+    # Events that have not ended are not in the rollup, add them up to now
+    now = jtz.now()
+    range_start, range_end = _bounds(first)[0], _bounds(last)[1]
+    cells = {}
+    for row in _rows(Event_Service.objects.filter(service_id=service_id, event__end=None, event__start__lt=range_end)):
+        _add(cells, row, end=min(now, range_end))
+
+    for (s, day), cell in cells.items():
+        if first <= day <= last:
+            if not day in days:
+                days[day] = {'day':day, 'incident_minutes':0, 'maintenance_minutes':0, 'incidents':0, 'maintenances':0}
+            # They may overlap the ended events, but a day never has more than DAY_MINUTES
+            days[day]['incident_minutes'] = min(DAY_MINUTES, days[day]['incident_minutes'] + _minutes(cell['incident']))
+            days[day]['maintenance_minutes'] = min(DAY_MINUTES, days[day]['maintenance_minutes'] + _minutes(cell['maintenance']))
+
+    days = [days[day] for day in sorted(days)]
+    total = {}
+    for column in DAY_VALUES[1:]:
+        total[column] = sum([day[column] for day in days])
+
+    minutes = ((last - first).days + 1) * DAY_MINUTES
+    total['uptime'] = round(100.0 * (minutes - total['incident_minutes']) / minutes, 3)
+    total['days'] = days
+
+    return total
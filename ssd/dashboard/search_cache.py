@@ -0,0 +1,137 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Search result cache for SSD
+
+   The same searches get run over and over during an incident.  The results
+   of search.events and search.graph (the matching ids of a text search and
+   each page shown) are cached under a key built from the normalized query:
+   the parameters sorted by name, dates resolved to the UTC range they cover
+   in the user's timezone and the words of a text search sorted, so the same
+   question asked from another timezone or with the words in another order
+   shares the entry where it can.
+
+   Every key includes the event version (see event_cache.version), which
+   changes with any event write (and with every change to the search index,
+   see search_index.update), so results are never served from before a
+   write.  The old entries simply expire.
+
+   The number of hits and misses is kept in the cache as well (so it covers
+   every worker), see 'manage.py ssd_searchcache'.
+
+   The memcache keys will be:
+     search_[name]_[event version]_[hash of the normalized query]
+     search_cache_hits
+     search_cache_misses
+
+"""
+
+
+import hashlib
+import logging
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from ssd.dashboard import event_cache
+from ssd.dashboard import functions
+from ssd.dashboard import search_index
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Seconds a search result is cached (None uses the cache default)
+SEARCH_CACHE_TIMEOUT = getattr(settings, 'SSD_SEARCH_CACHE_TIMEOUT', None)
+
+# The memcached keys holding the counters
+STATS_KEYS = {
+              'hit': 'search_cache_hits',
+              'miss': 'search_cache_misses'
+             }
+
+
+def normalize_text(text):
+    """Return the words of a text search in a canonical order
+
+    Every word must match and the score is a sum over the words (see
+    search_index), so the order and repetition of the words don't change
+    the results.
+
+    """
+
+    return ' '.join(sorted(set(search_index.tokenize(text or ''))))
+
+
+def utc_range(start, end):
+    """Return an aware datetime range as a UTC string"""
+
+    return '%s/%s' % (start.astimezone(pytz.utc).isoformat(), end.astimezone(pytz.utc).isoformat())
+
+
+def key(name, params):
+    """Return the cache key of a result from its name and a dict of normalized query parameters"""
+
+    query = '&'.join(['%s=%s' % (param, params[param]) for param in sorted(params)])
+
+    return 'search_%s_%s_%s' % (name, event_cache.version(), hashlib.md5(query.encode('utf-8')).hexdigest())
+
+
+def _count(kind):
+    """Add one to the hit or miss counter"""
+
+    # The counters never expire (add does nothing if it's already there)
+    cache.add(STATS_KEYS[kind], 0, None)
+    try:
+        cache.incr(STATS_KEYS[kind])
+    except ValueError:
+        # Evicted in between, the next one will recreate it
+        pass
+
+
+def get(name, params, compute):
+    """Return the cached result of a search, computing it (with compute()) on a miss"""
+
+    computed = []
+
+    def _compute():
+        computed.append(True)
+        return compute()
+
+    value = functions.cache_get_or_compute(logger, key(name, params), _compute, SEARCH_CACHE_TIMEOUT)
+    _count(computed and 'miss' or 'hit')
+
+    return value
+
+
+def stats():
+    """Return the number of hits and misses and the hit ratio"""
+
+    counts = cache.get_many(STATS_KEYS.values())
+    hits = counts.get(STATS_KEYS['hit'], 0)
+    misses = counts.get(STATS_KEYS['miss'], 0)
+
+    return {
+            'hits': hits,
+            'misses': misses,
+            'ratio': hits + misses and float(hits) / (hits + misses) or 0.0
+           }
+
+
+def reset():
+    """Zero the counters"""
+
+    cache.delete_many(STATS_KEYS.values())
@@ -0,0 +1,201 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Full-text search index for SSD
+
+   Event searches match the words of the event description and of all of
+   its updates.  Every query word must match, each one as a prefix ('data'
+   finds 'database'), and results come back most relevant first (ties go to
+   the newest event).
+
+   The write views call update() for every event they touch (right after
+   event_doc.refresh, since the indexed text comes from the event document).
+   Deleted events drop out of the index with their rows.  Run
+   'manage.py ssd_reindex' to build the index for existing events.
+
+   Two backends, chosen with SSD_SEARCH_BACKEND (default: 'mysql' on MySQL,
+   'python' otherwise):
+
+     mysql  - the text of each event is kept in Event_Search, which has a
+              FULLTEXT index (created by syncdb, see
+              sql/event_search.mysql.sql), and searched in boolean mode.
+              MySQL ignores words shorter than ft_min_word_len (MyISAM) or
+              innodb_ft_min_token_size (InnoDB).
+     python - an inverted index of (term, event, weight) rows in
+              Search_Term, tokenized here, that works on any database
+              (including SQLite for testing).  A term's weight is the number
+              of times it appears, description words counting double.
+
+"""
+
+
+import logging
+import re
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from ssd.dashboard.models import Event_Search, Search_Term
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_doc
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The backend to use (None picks one for the database)
+SEARCH_BACKEND = getattr(settings, 'SSD_SEARCH_BACKEND', None)
+
+# Maximum number of results returned by a search (most relevant first)
+SEARCH_LIMIT = getattr(settings, 'SSD_SEARCH_LIMIT', 1000)
+
+# Terms longer than this are cut to fit the Search_Term column
+TERM_LENGTH = 50
+
+
+def tokenize(text):
+    """Split text into lower case words, returns a list"""
+
+    return [word[:TERM_LENGTH] for word in re.findall(r'\w+', text.lower(), re.UNICODE)]
+
+
+def _text(doc):
+    """Return the (description, updates) text of an event document"""
+
+    description = doc['details'][0]['description']
+    updates = ' '.join([update['event_update__update'] for update in doc['updates'] or []])
+
+    return description, updates
+
+
+class MysqlBackend:
+
+    """
+    MySQL FULLTEXT search of Event_Search
+    """
+
+    def update(self, id, doc):
+        """Store the text of an event"""
+
+        description, updates = _text(doc)
+        if not Event_Search.objects.filter(event_id=id).update(text='%s %s' % (description, updates)):
+            Event_Search(event_id=id, text='%s %s' % (description, updates)).save()
+
+    def search(self, words, limit, filter):
+        """Return the ids of the events matching every word and filter, most relevant first"""
+
+        query = ' '.join(['+%s*' % word for word in words])
+        match = 'MATCH(dashboard_event_search.text) AGAINST (%s IN BOOLEAN MODE)'
+
+        matches = Event_Search.objects.filter(**filter).extra(
+                                                              select={'score':match},
+                                                              select_params=[query],
+                                                              where=[match],
+                                                              params=[query]
+                                                             )
+
+        return [row[0] for row in matches.values_list('event_id','score').order_by('-score','-event')[:limit]]
+
+
+class PythonBackend:
+
+    """
+    Inverted index in Search_Term
+    """
+
+    def update(self, id, doc):
+        """Replace the terms of an event"""
+
+        description, updates = _text(doc)
+
+        weights = {}
+        for word in tokenize(description):
+            weights[word] = weights.get(word, 0) + 2
+        for word in tokenize(updates):
+            weights[word] = weights.get(word, 0) + 1
+
+        Search_Term.objects.filter(event_id=id).delete()
+        Search_Term.objects.bulk_create([Search_Term(term=term, event_id=id, weight=weight) for term, weight in weights.items()])
+
+    def search(self, words, limit, filter):
+        """Return the ids of the events matching every word and filter, most relevant first"""
+
+        scores = None
+        for word in set(words):
+            matches = Search_Term.objects.filter(term__startswith=word, **filter).values('event_id').annotate(score=Sum('weight'))
+            matches = dict([(match['event_id'], match['score']) for match in matches])
+
+            # Every word must match
+            if scores == None:
+                scores = matches
+            else:
+                scores = dict([(id, score + matches[id]) for id, score in scores.items() if id in matches])
+
+            if not scores:
+                return []
+
+        return sorted(scores, key=lambda id: (-scores[id], -id))[:limit]
+
+
+BACKENDS = {
+            'mysql': MysqlBackend,
+            'python': PythonBackend
+           }
+
+
+def backend():
+    """Return the configured backend"""
+
+    name = SEARCH_BACKEND or (connection.vendor == 'mysql' and 'mysql' or 'python')
+    return BACKENDS[name]()
+
+
+def update(id):
+    """Index the current text of an event (nothing happens if it was deleted or archived)
+
+    The event version is moved as well, so cached search results (see
+    search_cache) don't outlive a change to the indexed text, including
+    the writes that only touch an update.
+
+    """
+
+    doc = event_doc.get(id)
+    if doc == None or doc.get('archived'):
+        return
+
+    backend().update(int(id), doc)
+    functions.namespace_bump(logger, event_cache.VERSION_KEY)
+
+
+def search(text, limit=SEARCH_LIMIT, **filter):
+    """Return the ids of the events matching text, most relevant first
+
+    filter holds Event lookups (e.g. start__range or type__type) the events
+    must also pass.  They are applied in the backend query, before the
+    limit, so a common word doesn't crowd the matching events out.
+
+    """
+
+    words = tokenize(text)
+    if not words:
+        return []
+
+    filter = dict([('event__%s' % lookup, value) for lookup, value in filter.items()])
+    ids = backend().search(words, limit, filter)
+    logger.debug('Search for %s matched %s events' % (words, len(ids)))
+
+    return ids
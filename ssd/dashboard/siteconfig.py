@@ -0,0 +1,113 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Site configuration snapshot for SSD
+
+   Each Config_* table holds a single row.  Rather than looking each value up
+   with two queries where it's needed, every row is loaded in one pass into an
+   immutable SiteConfig and cached in the two tier cache (see
+   ssd.dashboard.localcache).  The admin configuration views call
+   invalidate() after saving.
+
+   Usage:
+     config = siteconfig.get()
+     if config.email.enabled:
+        ...
+
+"""
+
+
+import logging
+from collections import namedtuple
+from ssd.dashboard.models import Config_Admin, Config_Email, Config_Message, Config_Logo, Config_Escalation, Config_Systemurl, Config_Ireport
+from ssd.dashboard import localcache
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The cache key holding the snapshot
+KEY = 'site_config'
+
+
+AdminConfig = namedtuple('AdminConfig', ['link_enabled'])
+
+EmailConfig = namedtuple('EmailConfig', [
+                                         'enabled',
+                                         'email_format',
+                                         'from_address',
+                                         'text_pager',
+                                         'incident_greeting',
+                                         'incident_update',
+                                         'maintenance_greeting',
+                                         'maintenance_update',
+                                         'email_footer'
+                                        ])
+
+MessageConfig = namedtuple('MessageConfig', ['main','main_enabled','alert','alert_enabled'])
+
+LogoConfig = namedtuple('LogoConfig', ['url','logo_enabled'])
+
+EscalationConfig = namedtuple('EscalationConfig', ['enabled','instructions'])
+
+SystemurlConfig = namedtuple('SystemurlConfig', ['url','url_enabled'])
+
+IreportConfig = namedtuple('IreportConfig', [
+                                             'enabled',
+                                             'email_enabled',
+                                             'instructions',
+                                             'submit_message',
+                                             'upload_enabled',
+                                             'upload_path',
+                                             'file_size'
+                                            ])
+
+SiteConfig = namedtuple('SiteConfig', ['admin','email','message','logo','escalation','systemurl','ireport'])
+
+
+def _row(model, config_type):
+    """Load the single row of a Config_* model into its config type"""
+
+    return config_type(**model.objects.values(*config_type._fields).order_by('id')[0])
+
+
+def load():
+    """Load every configuration table (one query each) into a SiteConfig"""
+
+    logger.debug('Loading the site configuration')
+
+    return SiteConfig(
+                      admin=_row(Config_Admin, AdminConfig),
+                      email=_row(Config_Email, EmailConfig),
+                      message=_row(Config_Message, MessageConfig),
+                      logo=_row(Config_Logo, LogoConfig),
+                      escalation=_row(Config_Escalation, EscalationConfig),
+                      systemurl=_row(Config_Systemurl, SystemurlConfig),
+                      ireport=_row(Config_Ireport, IreportConfig)
+                     )
+
+
+def get():
+    """Return the cached SiteConfig"""
+
+    return localcache.get(logger, KEY, load)
+
+
+def invalidate():
+    """Discard the cached SiteConfig after a configuration change"""
+
+    localcache.bump([KEY])
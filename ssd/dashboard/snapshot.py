@@ -0,0 +1,215 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Static snapshot publisher for SSD
+
+   Renders the public status pages into SSD_SNAPSHOT_DIR so the web server
+   can serve them without Django:
+     index.html           - the main dashboard in the server timezone
+     i_detail/[id].html   - the detail page of every open incident
+     m_detail/[id].html   - the detail page of every open maintenance
+
+   Pages are written to a temporary file in the same directory and renamed
+   into place, so readers never see a partial page.
+
+   publish() regenerates everything (see the ssd_snapshot management
+   command).  publish_event() is the on-write hook used by the incident and
+   maintenance views, it only re-renders the dashboard and the page of the
+   event that changed.  publish_config() is the hook used by the
+   configuration and service views: the logo, messages, navigation links
+   and service names show on every page, so it regenerates everything.
+   They all return a list of (page, seconds) timings.
+
+   Nothing is written when SSD_SNAPSHOT_DIR is not set.  See wsgi.conf for
+   the rewrite rules that serve the pages.
+
+"""
+
+
+import logging
+import os
+import tempfile
+import time
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+from ssd.dashboard.models import Event
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The directory the pages are written to (None disables the publisher)
+SNAPSHOT_DIR = getattr(settings, 'SSD_SNAPSHOT_DIR', None)
+
+# Event statuses that no longer get a detail page
+CLOSED_STATUSES = ('closed','completed')
+
+# The detail view and directory for each event type
+DETAIL_PAGES = {
+                'incident': ('ssd.dashboard.views.incidents', 'i_detail'),
+                'maintenance': ('ssd.dashboard.views.maintenance', 'm_detail')
+               }
+
+
+def enabled():
+    """Return True if a snapshot directory is configured"""
+
+    return bool(SNAPSHOT_DIR)
+
+
+def _write(path, content):
+    """Atomically replace the file at path (relative to SNAPSHOT_DIR) with content"""
+
+    path = os.path.join(SNAPSHOT_DIR, path)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.snapshot')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(temp, 0644)
+        os.rename(temp, path)
+    except:
+        os.remove(temp)
+        raise
+
+
+def _remove(path):
+    """Remove a page (relative to SNAPSHOT_DIR) if it exists"""
+
+    try:
+        os.remove(os.path.join(SNAPSHOT_DIR, path))
+    except OSError:
+        pass
+
+
+def _render(view, params=None):
+    """Render a view as an anonymous user in the server timezone, returning the content"""
+
+    request = RequestFactory().get('/', params or {})
+    request.user = AnonymousUser()
+    request.timezone = settings.TIME_ZONE
+
+    module, name = view
+    response = getattr(__import__(module, fromlist=[name]), name)(request)
+    if not response.status_code == 200:
+        raise ValueError('%s returned %s' % (name, response.status_code))
+
+    return response.content
+
+
+def _publish_index(timings):
+    """Render the main dashboard"""
+
+    begin = time.time()
+    _write('index.html', _render(('ssd.dashboard.views.main', 'index')))
+    timings.append(('index.html', time.time() - begin))
+
+
+def _publish_detail(id, type, status, timings):
+    """Render (or remove, if it's closed) the detail page of an event"""
+
+    directory = DETAIL_PAGES[type][1]
+    page = '%s/%s.html' % (directory, id)
+
+    begin = time.time()
+    if status in CLOSED_STATUSES:
+        _remove(page)
+    else:
+        _write(page, _render(DETAIL_PAGES[type], {'id':id}))
+    timings.append((page, time.time() - begin))
+
+
+def publish():
+    """Regenerate every page, removing the detail pages of events that are no longer open"""
+
+    timings = []
+    if not enabled():
+        return timings
+
+    _publish_index(timings)
+
+    events = Event.objects.exclude(status__status__in=CLOSED_STATUSES).values('id','type__type','status__status')
+
+    keep = set()
+    for event in events:
+        _publish_detail(event['id'], event['type__type'], event['status__status'], timings)
+        keep.add('%s/%s.html' % (DETAIL_PAGES[event['type__type']][1], event['id']))
+
+    # Remove the pages of events that were closed or deleted
+    for type, view in DETAIL_PAGES.items():
+        directory = os.path.join(SNAPSHOT_DIR, view[1])
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                page = '%s/%s' % (view[1], name)
+                if name.endswith('.html') and not page in keep:
+                    _remove(page)
+
+    return timings
+
+
+def publish_event(id):
+    """Re-render the pages touched by a write to an event
+
+    Errors are logged rather than raised so a failed snapshot never breaks
+    the admin write that triggered it.
+
+    """
+
+    timings = []
+    if not enabled():
+        return timings
+
+    try:
+        _publish_index(timings)
+
+        event = Event.objects.filter(id=id).values('type__type','status__status')
+        if event:
+            _publish_detail(id, event[0]['type__type'], event[0]['status__status'], timings)
+        else:
+            # Deleted, so remove whichever page it had
+            for view in DETAIL_PAGES.values():
+                _remove('%s/%s.html' % (view[1], id))
+
+        logger.debug('Snapshot for event %s published in %.3fs' % (id, sum([seconds for page, seconds in timings])))
+    except Exception, e:
+        logger.error('Error publishing the snapshot for event %s: %s' % (id, e))
+
+    return timings
+
+
+def publish_config():
+    """Re-render every page after a write to the site configuration or the services
+
+    Errors are logged rather than raised, like publish_event.
+
+    """
+
+    timings = []
+    if not enabled():
+        return timings
+
+    try:
+        timings = publish()
+        logger.debug('Snapshot published in %.3fs' % sum([seconds for page, seconds in timings]))
+    except Exception, e:
+        logger.error('Error publishing the snapshot: %s' % e)
+
+    return timings
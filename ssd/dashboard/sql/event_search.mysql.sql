@@ -0,0 +1,3 @@
+-- Run by syncdb after creating dashboard_event_search (MySQL only)
+-- FULLTEXT indexes on InnoDB tables require MySQL 5.6 or later
+ALTER TABLE `dashboard_event_search` ADD FULLTEXT INDEX `event_search_text` (`text`);
@@ -0,0 +1,360 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Active event timeline for SSD
+
+   The timeline holds every open incident and started maintenance along with
+   the services they impact and their updates.  It is used to build the
+   timelines on the main dashboard and also as a lookup to set the service
+   status.  The structure looks like this:
+
+   timeline = {
+                'events': {
+                            'incident': {
+                                          1: {
+                                               'start':datetime,
+                                               'description':'We are having an issue with the exchange server',
+                                               'services':[{'event_service__service__service_name':'service1'}],
+                                               'updates':[[datetime,'We are having an issue',update_id]]
+                                             }
+                                        },
+                            'maintenance': {...}
+                          },
+                'lookup': {
+                            'incident': {'service1':''},
+                            'maintenance': {'service3':''}
+                          }
+              }
+
+   The timeline is always built with a fixed number of queries (events,
+   service associations and updates), regardless of the number of active
+   events.
+
+   Rather than throwing the cached timeline away on every write, the write
+   views patch it in place (refresh_event, remove_event, add_update,
+   modify_update and remove_update) so reads right after an edit remain cache
+   hits.  Patches hold the timeline's recompute lock, and drop the cached
+   timeline when they can't get it.  check compares the cached timeline with a full rebuild.
+
+   Each of those writes also changes the timeline version (see version), which
+   callers can use to tell whether the active events changed without reading
+   the timeline itself.
+
+"""
+
+
+import logging
+from django.core.cache import cache
+from ssd.dashboard.models import Event, Event_Service, Event_Update
+from ssd.dashboard import functions
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Event statuses that are considered active
+ACTIVE_STATUSES = ('open','started')
+
+
+# The memcached key holding the timeline version
+VERSION_KEY = 'timeline_ns'
+
+
+def empty():
+    """Return an empty timeline structure"""
+
+    return {
+            'events': {},
+            'lookup': {
+                        'incident': {},
+                        'maintenance': {}
+            }
+    }
+
+
+def build():
+    """Build the timeline from the database
+
+    Three queries are issued: the active events, their service associations
+    and their updates.  The results are joined in Python.
+
+    """
+
+    logger.debug('Building the active event timeline')
+
+    timeline = empty()
+
+    # Get the events
+    timeline_events = list(Event.objects.filter(status__status__in=ACTIVE_STATUSES).values('id','start','type__type','description').order_by('start'))
+
+    # Map each event id to its type so the associations can be placed
+    event_types = {}
+
+    for event in timeline_events:
+
+        # Add the type to the timeline if not there
+        if not event['type__type'] in timeline['events']:
+            timeline['events'][event['type__type']] = {}
+
+        timeline['events'][event['type__type']][event['id']] = {
+                                                                 'start':event['start'],
+                                                                 'description':event['description'],
+                                                                 'services':[]
+                                                                }
+        event_types[event['id']] = event['type__type']
+
+    # Nothing is active, so there is no need to look for services or updates
+    if not event_types:
+        return timeline
+
+    # Find out which services the events impact and add them to the timeline
+    services_impacted = Event_Service.objects.filter(event_id__in=event_types.keys()).values('event_id','service__service_name').order_by('id')
+    for service in services_impacted:
+        type = event_types[service['event_id']]
+        timeline['events'][type][service['event_id']]['services'].append({'event_service__service__service_name':service['service__service_name']})
+
+        # Add to the lookup table
+        timeline['lookup'][type][service['service__service_name']] = ''
+
+    # Now get the updates
+    timeline_updates = Event_Update.objects.filter(event_id__in=event_types.keys()).values('id','event_id','date','update').order_by('id')
+    for update in timeline_updates:
+        event = timeline['events'][event_types[update['event_id']]][update['event_id']]
+
+        # Add the updates array to the timeline if not there
+        if not 'updates' in event:
+            event['updates'] = []
+
+        event['updates'].append([update['date'],update['update'],update['id']])
+
+    return timeline
+
+
+def version():
+    """Return the current timeline version"""
+
+    return functions.namespace_get(logger, VERSION_KEY)
+
+
+def _changed():
+    """Record that the active events may have changed"""
+
+    functions.namespace_bump(logger, VERSION_KEY)
+
+
+def _rebuild_lookup(timeline):
+    """Recreate the service lookup table from the events in the timeline"""
+
+    timeline['lookup'] = empty()['lookup']
+
+    for type, events in timeline['events'].items():
+        for event in events.values():
+            for service in event['services']:
+                timeline['lookup'][type][service['event_service__service__service_name']] = ''
+
+
+def _find(timeline, id):
+    """Return the (type, entry) of an event in the timeline, or (None, None)"""
+
+    for type, events in timeline['events'].items():
+        if id in events:
+            return type, events[id]
+
+    return None, None
+
+
+def _discard(timeline, id):
+    """Remove an event from the timeline, returning True if it was there"""
+
+    type, entry = _find(timeline, id)
+    if entry is None:
+        return False
+
+    del timeline['events'][type][id]
+
+    # A full build never contains empty types
+    if not timeline['events'][type]:
+        del timeline['events'][type]
+
+    return True
+
+
+def _patch(patch):
+    """Apply a change to the cached timeline
+
+    patch is called with the cached timeline, edits it in place and returns
+    True if it changed anything.  The read-modify-write holds the timeline's
+    recompute lock (the one cache_get_or_compute takes to rebuild it), so
+    concurrent patches and rebuilds can't overwrite each other.  If the lock
+    is busy the cached timeline is dropped instead and the next read builds
+    it.
+
+    The version is moved last, once the cache holds the change, so a reader
+    never pairs the new version (its ETag) with the old timeline.
+
+    """
+
+    if not functions.cache_lock('timeline'):
+        logger.debug('The timeline is locked, dropping it rather than patching it')
+        cache.delete('timeline')
+        _changed()
+        return
+
+    try:
+        timeline = functions.cache_peek('timeline')
+
+        # Nothing cached means nothing to patch, the next read will build it
+        if not timeline == None and patch(timeline):
+            functions.cache_set('timeline', timeline)
+    finally:
+        functions.cache_unlock('timeline')
+
+    _changed()
+
+
+def refresh_event(id):
+    """Re-read a single event and patch it into the cached timeline
+
+    Use this after an event is created or after its details, status, services
+    or updates change.  The event is added if it's active and removed if not.
+
+    """
+
+    id = int(id)
+    entry = None
+
+    event = Event.objects.filter(id=id,status__status__in=ACTIVE_STATUSES).values('id','start','type__type','description')
+    if event:
+        event = event[0]
+        entry = {
+                 'start':event['start'],
+                 'description':event['description'],
+                 'services':[]
+                }
+
+        services_impacted = Event_Service.objects.filter(event_id=id).values('service__service_name').order_by('id')
+        for service in services_impacted:
+            entry['services'].append({'event_service__service__service_name':service['service__service_name']})
+
+        updates = Event_Update.objects.filter(event_id=id).values('id','date','update').order_by('id')
+        for update in updates:
+            if not 'updates' in entry:
+                entry['updates'] = []
+            entry['updates'].append([update['date'],update['update'],update['id']])
+
+    def patch(timeline):
+        changed = _discard(timeline, id)
+
+        if entry:
+            if not event['type__type'] in timeline['events']:
+                timeline['events'][event['type__type']] = {}
+            timeline['events'][event['type__type']][id] = entry
+            changed = True
+
+        if changed:
+            _rebuild_lookup(timeline)
+            logger.debug('Patched event %s in the timeline' % id)
+
+        return changed
+
+    _patch(patch)
+
+
+def remove_event(id):
+    """Remove a deleted event from the cached timeline"""
+
+    def patch(timeline):
+        if not _discard(timeline, int(id)):
+            return False
+
+        _rebuild_lookup(timeline)
+        logger.debug('Removed event %s from the timeline' % id)
+        return True
+
+    _patch(patch)
+
+
+def add_update(event_id, update_id, date, update):
+    """Append a new update to an event in the cached timeline"""
+
+    def patch(timeline):
+        type, entry = _find(timeline, int(event_id))
+        if entry is None:
+            # The event is not active so it does not appear in the timeline
+            return False
+
+        if not 'updates' in entry:
+            entry['updates'] = []
+        entry['updates'].append([date,update,int(update_id)])
+        return True
+
+    _patch(patch)
+
+
+def modify_update(update_id, update):
+    """Change the text of an update in the cached timeline"""
+
+    def patch(timeline):
+        for events in timeline['events'].values():
+            for entry in events.values():
+                for row in entry.get('updates', []):
+                    if row[2] == int(update_id):
+                        row[1] = update
+                        return True
+
+        return False
+
+    _patch(patch)
+
+
+def remove_update(event_id, update_id):
+    """Remove a deleted update from an event in the cached timeline"""
+
+    def patch(timeline):
+        type, entry = _find(timeline, int(event_id))
+        if entry is None or not 'updates' in entry:
+            return False
+
+        entry['updates'] = [row for row in entry['updates'] if not row[2] == int(update_id)]
+
+        # A full build never contains an empty updates list
+        if not entry['updates']:
+            del entry['updates']
+
+        return True
+
+    _patch(patch)
+
+
+def check():
+    """Compare the cached timeline with a full rebuild
+
+    Returns True if they match (or if nothing is cached) and logs an error
+    otherwise.
+
+    """
+
+    timeline = functions.cache_peek('timeline')
+    if timeline == None:
+        return True
+
+    rebuilt = build()
+    if timeline == rebuilt:
+        return True
+
+    logger.error('Cached timeline does not match a full rebuild.  Cached: %s, rebuilt: %s' % (timeline, rebuilt))
+    return False
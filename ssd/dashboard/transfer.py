@@ -0,0 +1,359 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Bulk export and import of the event history for SSD
+
+   Events are written as JSON lines (JSONL), one event per line with
+   everything tied to it, and referring to types, statuses, users, services
+   and email addresses by name rather than id:
+
+   {"id":12,"type":"incident","status":"closed","description":"...",
+    "start":"2013-09-01T12:00:00+00:00","end":"2013-09-01T13:00:00+00:00",
+    "date":"2013-09-01T13:00:00+00:00","user":"admin","impact":null,
+    "coordinator":null,"services":["www"],"emails":["ops@example.com"],
+    "updates":[{"id":40,"date":"...","update":"...","user":"admin"}],
+    "archived":false}
+
+   All dates are in UTC, in ISO 8601 format.  Archived events (see
+   archive.py) have "archived":true and no emails.
+
+   dump() reads the events EXPORT_CHUNK at a time in id order (with one
+   query per chunk for each kind of related row), so memory use doesn't
+   grow with the number of events.  load() reads the lines one at a time
+   and writes each batch of events with bulk_create in one transaction.
+   Both report their progress through a callback.
+
+   load() keeps the event and update ids (shifted by id_offset), so the
+   target must not already have those ids.  Missing services and email
+   addresses are created.  Users are matched by username.  The caches are
+   reset afterwards, but the search index, the availability rollup and the
+   hourly counts have to be rebuilt (ssd_reindex and ssd_rollup).
+
+"""
+
+
+import json
+import logging
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone as jtz
+from django.utils.dateparse import parse_datetime
+import pytz
+from ssd.dashboard.models import Event, Type, Status, Service, Email, Event_Service, Event_Update, Event_Email, Event_Impact, Event_Coordinator
+from ssd.dashboard.models import Archive_Event, Archive_Event_Service, Archive_Event_Update
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_doc
+from ssd.dashboard import functions
+from ssd.dashboard import timeline
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# Events read per chunk by dump
+EXPORT_CHUNK = 1000
+
+# Events written per transaction by load
+IMPORT_BATCH = 1000
+
+# The columns exported for each live and archived event
+EVENT_VALUES = ('id','type__type','status__status','description','start','end','date','user__username','event_impact__impact','event_coordinator__coordinator')
+ARCHIVE_VALUES = ('id','type__type','status__status','description','start','end','date','user__username','impact','coordinator')
+
+
+def _date(value):
+    """Format an aware datetime for the export (UTC, ISO 8601)"""
+
+    if value == None:
+        return None
+
+    return value.astimezone(pytz.utc).isoformat()
+
+
+def _parse(value):
+    """Parse a date from the export"""
+
+    if value == None:
+        return None
+
+    return parse_datetime(value)
+
+
+def _related(model, ids, values):
+    """Return the rows of model tied to the event ids, grouped by event id"""
+
+    related = {}
+    for row in model.objects.filter(event_id__in=ids).values('event_id', *values).order_by('id').iterator():
+        related.setdefault(row['event_id'], []).append(row)
+
+    return related
+
+
+def _records(events, archived):
+    """Return the export records of a chunk of event rows"""
+
+    ids = [event['id'] for event in events]
+
+    if archived:
+        services = _related(Archive_Event_Service, ids, ('service__service_name',))
+        updates = _related(Archive_Event_Update, ids, ('id','date','update','user__username'))
+        emails = {}
+    else:
+        services = _related(Event_Service, ids, ('service__service_name',))
+        updates = _related(Event_Update, ids, ('id','date','update','user__username'))
+        emails = _related(Event_Email, ids, ('email__email',))
+
+    records = []
+    for event in events:
+        id = event['id']
+        records.append({
+                        'id':id,
+                        'type':event['type__type'],
+                        'status':event['status__status'],
+                        'description':event['description'],
+                        'start':_date(event['start']),
+                        'end':_date(event['end']),
+                        'date':_date(event['date']),
+                        'user':event['user__username'],
+                        'impact':event.get('impact', event.get('event_impact__impact')) or None,
+                        'coordinator':event.get('coordinator', event.get('event_coordinator__coordinator')) or None,
+                        'services':[row['service__service_name'] for row in services.get(id, [])],
+                        'emails':[row['email__email'] for row in emails.get(id, [])],
+                        'updates':[
+                                   {'id':row['id'], 'date':_date(row['date']), 'update':row['update'], 'user':row['user__username']}
+                                   for row in updates.get(id, [])
+                                  ],
+                        'archived':archived
+                       })
+
+    return records
+
+
+def dump(out, archived=False, chunk=EXPORT_CHUNK, progress=None):
+    """Write every event (and the archived ones if archived is True) to out as JSON lines, returns the number written
+
+    progress is called with the number written so far after each chunk.
+
+    """
+
+    sources = [(Event, EVENT_VALUES, False)]
+    if archived:
+        sources.append((Archive_Event, ARCHIVE_VALUES, True))
+
+    count = 0
+    for model, values, is_archived in sources:
+        last = 0
+        while True:
+            events = list(model.objects.filter(id__gt=last).values(*values).order_by('id')[:chunk].iterator())
+            if not events:
+                break
+
+            for record in _records(events, is_archived):
+                out.write(json.dumps(record, separators=(',',':')))
+                out.write('\n')
+
+            last = events[-1]['id']
+            count += len(events)
+            if progress:
+                progress(count)
+
+    return count
+
+
+@contextmanager
+def _keep_dates():
+    """Keep the exported modification dates (auto_now would replace them with the current time on save)"""
+
+    fields = [Event._meta.get_field('date'), Event_Update._meta.get_field('date')]
+    for field in fields:
+        field.auto_now = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now = True
+
+
+class _Lookups:
+
+    """
+    The ids of the types, statuses, users, services and email addresses by name
+    """
+
+    def __init__(self, default_user):
+        self.types = dict(Type.objects.values_list('type','id'))
+        self.statuses = dict(Status.objects.values_list('status','id'))
+        self.users = dict(User.objects.values_list('username','id'))
+        self.services = dict(Service.objects.values_list('service_name','id'))
+        self.emails = dict(Email.objects.values_list('email','id'))
+        self.default_user = default_user
+
+    def user(self, username):
+        if username in self.users:
+            return self.users[username]
+        if self.default_user == None:
+            raise ValueError('Unknown user %s (use a default user)' % username)
+        return self.default_user
+
+    def service(self, name):
+        if not name in self.services:
+            self.services[name] = Service.objects.create(service_name=name).pk
+        return self.services[name]
+
+    def email(self, address):
+        if not address in self.emails:
+            self.emails[address] = Email.objects.create(email=address).pk
+        return self.emails[address]
+
+
+def _load_batch(records, lookups, id_offset):
+    """Write a batch of records in one transaction"""
+
+    events = []
+    archived_events = []
+    updates = []
+    archived_updates = []
+    services = []
+    archived_services = []
+    impacts = []
+    coordinators = []
+    emails = []
+
+    now = jtz.now()
+
+    with transaction.atomic():
+        for record in records:
+            id = record['id'] + id_offset
+
+            try:
+                fields = {
+                          'id':id,
+                          'type_id':lookups.types[record['type']],
+                          'status_id':lookups.statuses[record['status']],
+                          'description':record['description'],
+                          'start':_parse(record['start']),
+                          'end':_parse(record['end']),
+                          'date':_parse(record['date']),
+                          'user_id':lookups.user(record['user'])
+                         }
+            except KeyError, e:
+                raise ValueError('Event %s: unknown type or status %s' % (record['id'], e))
+
+            event_updates = [
+                             {
+                              'id':update['id'] + id_offset,
+                              'event_id':id,
+                              'date':_parse(update['date']),
+                              'update':update['update'],
+                              'user_id':lookups.user(update['user'])
+                             }
+                             for update in record['updates']
+                            ]
+            event_services = [{'event_id':id, 'service_id':lookups.service(name)} for name in record['services']]
+
+            if record.get('archived'):
+                text = ' '.join([record['description']] + [update['update'] for update in record['updates']])
+                archived_events.append(Archive_Event(
+                                                     impact=record['impact'] or '',
+                                                     coordinator=record['coordinator'] or '',
+                                                     text=text,
+                                                     archived=now,
+                                                     **fields
+                                                    ))
+                archived_updates.extend([Archive_Event_Update(**update) for update in event_updates])
+                archived_services.extend([Archive_Event_Service(**service) for service in event_services])
+            else:
+                events.append(Event(**fields))
+                updates.extend([Event_Update(**update) for update in event_updates])
+                services.extend([Event_Service(**service) for service in event_services])
+                if record['impact']:
+                    impacts.append(Event_Impact(event_id=id, impact=record['impact']))
+                if record['coordinator']:
+                    coordinators.append(Event_Coordinator(event_id=id, coordinator=record['coordinator']))
+                emails.extend([Event_Email(event_id=id, email_id=lookups.email(address)) for address in record['emails']])
+
+        for model, objs in (
+                            (Event, events),
+                            (Event_Update, updates),
+                            (Event_Service, services),
+                            (Event_Impact, impacts),
+                            (Event_Coordinator, coordinators),
+                            (Event_Email, emails),
+                            (Archive_Event, archived_events),
+                            (Archive_Event_Update, archived_updates),
+                            (Archive_Event_Service, archived_services)
+                           ):
+            if objs:
+                model.objects.bulk_create(objs)
+
+    # A document cached as missing would hide the new event
+    for record in records:
+        event_doc.invalidate(record['id'] + id_offset)
+
+
+def load(lines, batch=IMPORT_BATCH, id_offset=0, default_user=None, progress=None):
+    """Import the events in an iterable of JSON lines, returns the number imported
+
+    Each batch of events is written in its own transaction, so the batches
+    before one that fails stay imported.  progress is called with the number
+    imported so far after each batch.  default_user is the id of the user
+    that events and updates by an unknown username are attributed to
+    (they're rejected if it's None).
+
+    """
+
+    lookups = _Lookups(default_user)
+    count = 0
+    records = []
+
+    try:
+        with _keep_dates():
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+
+                records.append(json.loads(line))
+                if len(records) >= batch:
+                    _load_batch(records, lookups, id_offset)
+                    count += len(records)
+                    records = []
+                    if progress:
+                        progress(count)
+
+            if records:
+                _load_batch(records, lookups, id_offset)
+                count += len(records)
+                if progress:
+                    progress(count)
+    finally:
+        # The ids were given explicitly, so move the sequences past them (PostgreSQL)
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Event, Event_Update]):
+            cursor.execute(sql)
+
+        # Everything cached about the events is out of date (the versions, which the ETags
+        # are built from, move last so they never go with the old content)
+        for key in ('events_ns', 'event_count_ns'):
+            functions.namespace_bump(logger, key)
+        functions.cache_set('timeline', timeline.build())
+        for key in (event_cache.VERSION_KEY, timeline.VERSION_KEY):
+            functions.namespace_bump(logger, key)
+
+    return count
@@ -19,7 +19,7 @@
 
 import logging
 from django.conf import settings
-from django.core.cache import cache, get_cache
+from django.core.cache import get_cache
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
 from django.template import RequestContext
@@ -27,6 +27,9 @@ from django.contrib import messages
 from django import get_version
 from ssd.dashboard.models import Config_Admin
 from ssd.dashboard.forms import AdminConfigForm
+from ssd.dashboard import localcache
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
@@ -110,6 +113,7 @@ def cache_status(request):
           'title':'System Status Dashboard | Admin - Cache',
           'cache_settings':cache_settings,
           'm_stats':m_stats,
+          'tier_stats':localcache.stats(),
           'nav_section':'admin',
           'nav_sub':'cache_status'
        },
@@ -140,7 +144,10 @@ def admin_config(request):
             Config_Admin.objects.filter(id=Config_Admin.objects.values('id')[0]['id']).update(link_enabled=link_enabled)
 
             # Clear the cache
-            cache.delete('display_admin')
+            siteconfig.invalidate()
+
+            # Refresh the static snapshot, every page shows the configuration
+            snapshot.publish_config()
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Preferences saved successfully')
@@ -154,7 +161,7 @@ def admin_config(request):
 
     # Obtain the email config
 
-    admin_config = Config_Admin.objects.filter(id=Config_Admin.objects.values('id')[0]['id']).values('link_enabled')
+    admin_config = siteconfig.get().admin
 
     # Print the page
     return render_to_response(
@@ -0,0 +1,366 @@
+#
+# Copyright 2013 - Tom Alessi
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""This module contains the JSON API of SSD.
+
+   The API is intended for monitoring systems and portals that poll the
+   dashboard.  Each response carries an ETag built from the cache versions
+   (see ssd.dashboard.timeline, ssd.dashboard.event_cache and
+   ssd.dashboard.localcache) so a poll that sends If-None-Match gets a 304
+   without any database or serialization work when nothing has changed.
+
+   All dates are returned in UTC, in ISO 8601 format.
+
+   /api/v1/availability reports the daily availability of a service from
+   the rollup table (see ssd.dashboard.rollup), so it reads one row per day
+   with events rather than the event history.
+
+   /api/v1/changes is a Server-Sent Events stream of the change feed (see
+   ssd.dashboard.feed).  A stream is closed as soon as it has sent a change,
+   or after SSD_FEED_TIMEOUT seconds without one, and the browser
+   reconnects with the Last-Event-ID header so no change is missed.  Each
+   open stream holds a web server worker while it waits, so it should be
+   served by its own mod_wsgi daemon process group (see wsgi.conf).  With
+   SSD_FEED_ENABLED = False it answers 404 and the dashboard polls
+   /api/v1/status instead.
+
+"""
+
+
+import datetime
+import json
+import logging
+import pytz
+import time
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from ssd.dashboard.models import Service
+from ssd.dashboard import conditional
+from ssd.dashboard import event_cache
+from ssd.dashboard import feed
+from ssd.dashboard import functions
+from ssd.dashboard import localcache
+from ssd.dashboard import rollup
+from ssd.dashboard import timeline as dashboard_timeline
+
+
+# Get an instance of the ssd logger
+logger = logging.getLogger(__name__)
+
+
+# The API version, part of every url and ETag
+API_VERSION = 'v1'
+
+# The largest date range (in days) the events call will return
+MAX_DAYS = 366
+
+# The default number of days the availability call covers
+AVAILABILITY_DAYS = 30
+
+# Whether the change stream is served (otherwise the dashboard polls the status)
+FEED_ENABLED = getattr(settings, 'SSD_FEED_ENABLED', True)
+
+# Seconds a change stream without changes is held open before the browser reconnects
+FEED_TIMEOUT = getattr(settings, 'SSD_FEED_TIMEOUT', 10)
+
+# Seconds between checks of the feed version while a stream is open
+FEED_POLL = getattr(settings, 'SSD_FEED_POLL', 1)
+
+
+def _etag(*parts):
+    """Build an ETag from the API version and a list of version stamps"""
+
+    return conditional.etag(API_VERSION, *parts)
+
+
+def _date(value):
+    """Format an aware datetime for the API (UTC, ISO 8601)"""
+
+    if value == None:
+        return None
+
+    return value.astimezone(pytz.utc).isoformat()
+
+
+def _json(data):
+    """Return data as a compact JSON response"""
+
+    return HttpResponse(json.dumps(data, separators=(',',':')), content_type='application/json')
+
+
+def _status_etag(request):
+    """The status changes with the active events and the service list"""
+
+    return _etag('status', dashboard_timeline.version(), localcache.version())
+
+
+def _events_etag(request):
+    """The events change with any event write, the range and the timezone used for the range
+
+    The default range moves with the date, so today's date is included as well.
+
+    """
+
+    return _etag(
+                 'events',
+                 event_cache.version(),
+                 request.GET.get('from', ''),
+                 request.GET.get('to', ''),
+                 request.timezone,
+                 datetime.datetime.now(pytz.timezone(request.timezone)).date()
+                )
+
+
+@condition(etag_func=_status_etag)
+def status(request):
+    """Current Status
+
+    Return the status of every service along with the active incidents and
+    maintenances.  A service status is one of ok, incident or maintenance
+    (incidents take precedence).
+
+    """
+
+    logger.debug('%s view being executed.' % 'api.status')
+
+    timeline = functions.cache_get_or_compute(logger, 'timeline', dashboard_timeline.build)
+    services = localcache.get(logger, 'services', lambda: list(Service.objects.values('service_name').order_by('service_name')))
+
+    service_status = []
+    for service in services:
+        service_name = service['service_name']
+        if service_name in timeline['lookup']['incident']:
+            state = 'incident'
+        elif service_name in timeline['lookup']['maintenance']:
+            state = 'maintenance'
+        else:
+            state = 'ok'
+        service_status.append({'service':service_name,'status':state})
+
+    events = []
+    for type, type_events in timeline['events'].items():
+        for id, event in type_events.items():
+            events.append({
+                           'id':id,
+                           'type':type,
+                           'description':event['description'],
+                           'start':_date(event['start']),
+                           'services':[service['event_service__service__service_name'] for service in event['services']],
+                           'updates':[{'date':_date(update[0]),'update':update[1]} for update in event.get('updates', [])]
+                          })
+    events.sort(key=lambda event: event['id'])
+
+    return _json({
+                  'version':API_VERSION,
+                  'services':service_status,
+                  'events':events
+                 })
+
+
+@condition(etag_func=_events_etag)
+def events(request):
+    """Events In A Date Range
+
+    Return every event (other than planned maintenances) starting between
+    the from and to dates (YYYY-MM-DD, inclusive, in the requested timezone).
+    to defaults to today and from to 6 days before to, like the dashboard.
+
+    """
+
+    logger.debug('%s view being executed.' % 'api.events')
+
+    tz = pytz.timezone(request.timezone)
+
+    try:
+        if request.GET.get('to'):
+            to_date = datetime.datetime.strptime(request.GET['to'],'%Y-%m-%d').date()
+        else:
+            to_date = datetime.datetime.now(tz).date()
+
+        if request.GET.get('from'):
+            from_date = datetime.datetime.strptime(request.GET['from'],'%Y-%m-%d').date()
+        else:
+            from_date = to_date - datetime.timedelta(days=6)
+    except ValueError:
+        return HttpResponseBadRequest('Improperly formatted date, use YYYY-MM-DD.')
+
+    if from_date > to_date:
+        return HttpResponseBadRequest('The from date must not be after the to date.')
+
+    if (to_date - from_date).days >= MAX_DAYS:
+        return HttpResponseBadRequest('The date range may not exceed %s days.' % MAX_DAYS)
+
+    start = tz.localize(datetime.datetime.combine(from_date, datetime.time.min))
+    end = tz.localize(datetime.datetime.combine(to_date, datetime.time.max))
+
+    # Each row is one event/service combination, so collapse them by event
+    events = []
+    by_id = {}
+    for row in event_cache.get_events(start, end):
+        if not row['id'] in by_id:
+            by_id[row['id']] = {
+                                'id':row['id'],
+                                'type':row['type__type'],
+                                'description':row['description'],
+                                'status':row['status__status'],
+                                'start':_date(row['start']),
+                                'end':_date(row['end']),
+                                'services':[]
+                               }
+            events.append(by_id[row['id']])
+
+        if row['event_service__service__service_name']:
+            by_id[row['id']]['services'].append(row['event_service__service__service_name'])
+
+    response = _json({
+                      'version':API_VERSION,
+                      'from':from_date.isoformat(),
+                      'to':to_date.isoformat(),
+                      'events':events
+                     })
+
+    # The range depends on the timezone cookie
+    patch_vary_headers(response, ('Cookie',))
+
+    return response
+
+
+def _availability_etag(request):
+    """Availability changes with any event write and the service list
+
+    Open incidents count up to the current time, so the minute is included as well.
+
+    """
+
+    return _etag(
+                 'availability',
+                 event_cache.version(),
+                 localcache.version(),
+                 request.GET.get('service', ''),
+                 request.GET.get('days', ''),
+                 datetime.datetime.now(pytz.utc).strftime('%Y%m%d%H%M')
+                )
+
+
+@condition(etag_func=_availability_etag)
+def availability(request):
+    """Service Availability
+
+    Return the availability of a service over the last days UTC days
+    (including today, 30 by default): the uptime (the percentage of the
+    range without incidents), the incident and maintenance minutes and
+    counts, and the same for each day that had events.
+
+    """
+
+    logger.debug('%s view being executed.' % 'api.availability')
+
+    service = Service.objects.filter(service_name=request.GET.get('service', '')).values('id','service_name')
+    if not service:
+        return HttpResponseBadRequest('Unknown service.')
+
+    try:
+        days = int(request.GET.get('days', AVAILABILITY_DAYS))
+    except ValueError:
+        return HttpResponseBadRequest('Improperly formatted number of days.')
+
+    if days < 1 or days > MAX_DAYS:
+        return HttpResponseBadRequest('The number of days must be between 1 and %s.' % MAX_DAYS)
+
+    to_date = datetime.datetime.now(pytz.utc).date()
+    from_date = to_date - datetime.timedelta(days=days - 1)
+
+    result = rollup.availability(service[0]['id'], from_date, to_date)
+    for day in result['days']:
+        day['day'] = day['day'].isoformat()
+
+    return _json({
+                  'version':API_VERSION,
+                  'service':service[0]['service_name'],
+                  'from':from_date.isoformat(),
+                  'to':to_date.isoformat(),
+                  'uptime':result['uptime'],
+                  'incident_minutes':result['incident_minutes'],
+                  'maintenance_minutes':result['maintenance_minutes'],
+                  'incidents':result['incidents'],
+                  'maintenances':result['maintenances'],
+                  'days':result['days']
+                 })
+
+
+def _sse(number, event, data):
+    """Format one Server-Sent Events message"""
+
+    return 'id: %s\nevent: %s\ndata: %s\n\n' % (number, event, json.dumps(data, separators=(',',':')))
+
+
+def _stream(since):
+    """Yield the changes after number since, until there are some or FEED_TIMEOUT passes"""
+
+    # Tell the browser how quickly to reconnect (milliseconds) and where it is in the feed
+    yield 'retry: %s\n\n' % (FEED_POLL * 1000)
+    yield _sse(since, 'hello', {})
+
+    deadline = time.time() + FEED_TIMEOUT
+    while True:
+        found = feed.changes(since)
+
+        # The listener fell behind, it has to refresh everything
+        if found == None:
+            yield _sse(feed.version(), 'reset', {})
+            break
+
+        # Free the worker as soon as there is something to send, the browser reconnects for more
+        if found:
+            for number, change in found:
+                yield _sse(number, 'change', change)
+            break
+
+        if time.time() >= deadline:
+            break
+
+        time.sleep(FEED_POLL)
+
+
+def changes(request):
+    """Change Stream
+
+    Stream the change feed as Server-Sent Events.  The stream starts after
+    the Last-Event-ID header (sent by the browser on reconnect) or the since
+    parameter, otherwise at the current version.
+
+    """
+
+    logger.debug('%s view being executed.' % 'api.changes')
+
+    if not FEED_ENABLED:
+        raise Http404
+
+    since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        since = feed.version()
+
+    response = StreamingHttpResponse(_stream(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+
+    # Ask proxies (nginx) not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+
+    return response
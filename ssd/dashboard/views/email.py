@@ -27,6 +27,7 @@ from django.core.validators import validate_email
 from django.contrib import messages
 from ssd.dashboard.models import Config_Email, Email, Event
 from ssd.dashboard.forms import AddRecipientForm, DeleteRecipientForm, EmailConfigForm, XEditableModifyForm
+from ssd.dashboard import siteconfig
 
 
 # Get an instance of the ssd logger
@@ -74,6 +75,9 @@ def email_config(request):
                                                         email_footer=email_footer
                                                     )
 
+            # Clear the cache
+            siteconfig.invalidate()
+
             messages.add_message(request, messages.SUCCESS, 'Email configuration saved successfully')
         else:
             messages.add_message(request, messages.ERROR, 'Invalid data entered, please correct the errors below:')
@@ -86,17 +90,7 @@ def email_config(request):
         form = EmailConfigForm
 
     # Obtain the email config
-    email_config = Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values(
-                                                                                    'enabled',
-                                                                                    'email_format',
-                                                                                    'from_address',
-                                                                                    'text_pager',
-                                                                                    'incident_greeting',
-                                                                                    'incident_update',
-                                                                                    'maintenance_greeting',
-                                                                                    'maintenance_update',
-                                                                                    'email_footer'
-                                                                                    )
+    email_config = siteconfig.get().email
 
     # Print the page
     return render_to_response(
@@ -18,7 +18,6 @@
 
 
 import logging
-from django.core.cache import cache
 from django.db import IntegrityError
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
@@ -28,12 +27,34 @@ from django.db.models import F
 from django.contrib import messages
 from ssd.dashboard.models import Config_Escalation, Escalation
 from ssd.dashboard.forms import AddContactForm, EscalationConfigForm, XEditableModifyForm, SwitchContactForm, RemoveContactForm
+from ssd.dashboard import conditional
+from ssd.dashboard import functions
+from ssd.dashboard import localcache
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
 logger = logging.getLogger(__name__)
 
 
+# The memcached key holding the escalation contacts version
+VERSION_KEY = 'escalation_ns'
+
+
+def _escalation_version(request):
+    """The escalation page changes with the configuration and the contacts"""
+
+    return (localcache.version(), functions.namespace_get(logger, VERSION_KEY))
+
+
+def _contacts_changed():
+    """Record a change to the escalation contacts"""
+
+    functions.namespace_bump(logger, VERSION_KEY)
+
+
+@conditional.condition(_escalation_version)
 def escalation(request):
     """Escalation page
 
@@ -45,11 +66,8 @@ def escalation(request):
     logger.debug('%s view being executed.' % 'escalation.escalation')
 
     # If this functionality is disabled in the admin, let the user know
-    enable_escalation = cache.get('enable_escalation')
-    if enable_escalation == None:
-        enable_escalation = Config_Escalation.objects.filter(id=Config_Escalation.objects.values('id')[0]['id']).values('enabled')[0]['enabled']
-        cache.set('enable_escalation', enable_escalation)
-    if enable_escalation == 0:
+    escalation_config = siteconfig.get().escalation
+    if escalation_config.enabled == 0:
         # Escalation is disabled, send them to the homepage with an error message
         messages.add_message(request, messages.ERROR, 'Your system administrator has disabled the escalation path functionality')
         return HttpResponseRedirect('/')
@@ -63,7 +81,7 @@ def escalation(request):
        {
           'title':'System Status Dashboard | Escalation Path',
           'contacts':contacts,
-          'instructions':Config_Escalation.objects.filter(id=Config_Escalation.objects.values('id')[0]['id']).values('instructions')[0]['instructions']
+          'instructions':escalation_config.instructions
        },
        context_instance=RequestContext(request)
     )
@@ -93,7 +111,10 @@ def escalation_config(request):
             Config_Escalation.objects.filter(id=Config_Escalation.objects.values('id')[0]['id']).update(enabled=enabled,instructions=instructions)
 
             # Clear the cache
-            cache.delete('enable_escalation')
+            siteconfig.invalidate()
+
+            # Refresh the static snapshot, every page shows the configuration
+            snapshot.publish_config()
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Escalation configuration saved successfully')
@@ -107,7 +128,7 @@ def escalation_config(request):
         form = EscalationConfigForm
 
     # Obtain the escalation config
-    escalation_config = Config_Escalation.objects.filter(id=Config_Escalation.objects.values('id')[0]['id']).values('enabled','instructions')
+    escalation_config = siteconfig.get().escalation
 
     # Print the page
     return render_to_response(
@@ -158,6 +179,8 @@ def escalation_contacts(request):
             except IntegrityError:
                 pass
 
+            _contacts_changed()
+
             # Send them back so they can see the newly created email addresses
             # incident
             return HttpResponseRedirect('/admin/escalation_contacts')
@@ -281,6 +304,8 @@ def contact_switch(request):
         else:
             messages.add_message(request, messages.ERROR, 'There was an error processing your request: %s' % form.errors)
 
+        _contacts_changed()
+
     # Send them back so they can see the newly updated services list
     return HttpResponseRedirect('/admin/escalation_contacts')
 
@@ -318,6 +343,8 @@ def contact_delete(request):
             else:
                 Escalation.objects.filter(id=id).update(order=1)
 
+            _contacts_changed()
+
             # Set a message that delete was successful
             messages.add_message(request, messages.SUCCESS, 'Contact successfully removed.')
 
@@ -402,6 +429,8 @@ def contact_modify(request):
                 logger.error('%s: Error saving update: %s' % ('escalation.contact_modify',e))
                 return HttpResponseBadRequest('An error was encountered with this request.')
 
+            _contacts_changed()
+
             return HttpResponse('Value successfully modified')
 
         else:
@@ -18,13 +18,17 @@
 
 
 import logging
-from django.core.cache import cache
 from django.contrib.auth.models import User
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.contrib import messages
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
 from ssd.dashboard.models import Event_Update
 from ssd.dashboard.forms import XEditableModifyForm
+from ssd.dashboard import event_doc
+from ssd.dashboard import feed
+from ssd.dashboard import search_index
+from ssd.dashboard import snapshot
+from ssd.dashboard import timeline
 
 
 # Get an instance of the ssd logger
@@ -70,8 +74,16 @@ def update_modify(request):
                 logger.error('%s: Error saving update: %s' % ('events.update_modify',e))
                 return HttpResponseBadRequest('An error was encountered with this request.')
 
-            # Clear the cache 
-            cache.delete('timeline')
+            # Patch the update in the cached timeline
+            timeline.modify_update(pk, value)
+
+            # Rebuild the cached event document and search index entry, let the dashboards know and refresh the static snapshot
+            event = Event_Update.objects.filter(id=pk).values('event_id','event__type__type','event__status__status')
+            if event:
+                event_doc.refresh(event[0]['event_id'])
+                search_index.update(event[0]['event_id'])
+                feed.publish(event[0]['event__type__type'], event[0]['event_id'], 'updated', event[0]['event__status__status'])
+                snapshot.publish_event(event[0]['event_id'])
 
             return HttpResponse('Value successfully modified')
 
@@ -22,17 +22,28 @@ import datetime
 import pytz
 import re
 from django.conf import settings
-from django.core.cache import cache
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
+from django.db import transaction
 from django.contrib.auth.models import User
 from ssd.dashboard.decorators import staff_member_required_ssd
-from ssd.dashboard.models import Event, Type, Status, Event_Service, Event_Update, Event_Email, Event_Impact, Event_Coordinator, Service, Email, Config_Email
+from ssd.dashboard.models import Event, Type, Status, Event_Service, Event_Update, Event_Email, Event_Impact, Event_Coordinator, Service, Email
 from ssd.dashboard.forms import DeleteUpdateForm, AddIncidentForm, DeleteEventForm, UpdateIncidentForm, DetailForm, ListForm
-from ssd.dashboard import notify
+from ssd.dashboard import conditional
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_counts
+from ssd.dashboard import event_doc
+from ssd.dashboard import feed
+from ssd.dashboard import keyset
+from ssd.dashboard import localcache
+from ssd.dashboard import outbox
+from ssd.dashboard import rollup
+from ssd.dashboard import search_index
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
+from ssd.dashboard import timeline
 
 
 # Get an instance of the ssd logger
@@ -58,6 +69,7 @@ def incident(request):
         # by the user.  Templates do not allow access to Arrays stored in QueryDict objects so we have
         # to determine the list and send back to the template on failed form submits
         affected_svcs = request.POST.getlist('service')
+        affected_emails = request.POST.getlist('email_id')
 
         # Check the form elements
         form = AddIncidentForm(request.POST)
@@ -71,7 +83,8 @@ def incident(request):
             e_time = form.cleaned_data['e_time']
             description = form.cleaned_data['description']
             broadcast = form.cleaned_data['broadcast']
-            email_id = form.cleaned_data['email_id']
+            # Should be numbers only (as with the services), and each recipient only once
+            email_ids = sorted(set([int(email_id) for email_id in affected_emails if re.match(r'^\d+$', email_id)]))
 
             # Combine the dates and times into datetime objects and set the timezones
             tz = pytz.timezone(request.timezone)
@@ -87,39 +100,60 @@ def incident(request):
                 # Status is still open
                 status='open'
 
-            # Create the event and obtain the ID                                     
-            e = Event.objects.create(
-                                     type_id=Type.objects.filter(type='incident').values('id')[0]['id'],
-                                     description=description,
-                                     status_id=Status.objects.filter(status=status).values('id')[0]['id'],
-                                     start=start,
-                                     end=end,
-                                     user_id=request.user.id
-                                    )
-            event_id = e.pk
-
-            # Add the email recipient, if requested.
-            # Form validation ensures that a valid email is selected if broadcast is selected.  
-            if broadcast: 
-                Event_Email(event_id=event_id,email_id=email_id).save()
-
-            # Find out which services this impacts and associate the services with the event
-            # Form validation confirms that there is at least 1 service
-            for service_id in affected_svcs:
-                # Should be number only -- can't figure out how to validate
-                # multiple checkboxes in the form
-                if re.match(r'^\d+$', service_id):
-                    Event_Service(service_id=service_id,event_id=event_id).save()
-
-
-            # Send an email notification to the appropriate list about this issue if requested.  Broadcast won't be
-            # allowed to be true if an email address is not defined or if global email is disabled.
-            if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1 and broadcast:
-                email = notify.email()
-                email.email_event(event_id,email_id,request.timezone,True)
-
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+            # Save the change and queue its notification in one transaction, so the
+            # notification is only sent if the change is committed
+            with transaction.atomic():
+                # Create the event and obtain the ID                                     
+                e = Event.objects.create(
+                                         type_id=Type.objects.filter(type='incident').values('id')[0]['id'],
+                                         description=description,
+                                         status_id=Status.objects.filter(status=status).values('id')[0]['id'],
+                                         start=start,
+                                         end=end,
+                                         user_id=request.user.id
+                                        )
+                event_id = e.pk
+
+                # Add the email recipients, if requested.
+                # Form validation ensures that a valid email is selected if broadcast is selected.  
+                if broadcast: 
+                    for email_id in email_ids:
+                        Event_Email(event_id=event_id,email_id=email_id).save()
+
+                # Find out which services this impacts and associate the services with the event
+                # Form validation confirms that there is at least 1 service
+                for service_id in affected_svcs:
+                    # Should be number only -- can't figure out how to validate
+                    # multiple checkboxes in the form
+                    if re.match(r'^\d+$', service_id):
+                        Event_Service(service_id=service_id,event_id=event_id).save()
+
+
+                # Queue an email notification to the appropriate list about this issue if requested.  Broadcast won't be
+                # allowed to be true if an email address is not defined or if global email is disabled.
+                if siteconfig.get().email.enabled == 1 and broadcast:
+                    outbox.queue_event(event_id,email_ids,True,request.timezone)
+
+                # Roll the event into the hourly graph counts and note the services and days it covers
+                event_counts.update(None, event_counts.snapshot(event_id))
+                after_days = rollup.snapshot(event_id)
+
+            # Roll the event into the daily availability of its services (once committed, see rollup.update)
+            rollup.update(after_days)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(event_id)
+            search_index.update(event_id)
+
+            # Clear the cache entries for the day this event starts on
+            event_cache.invalidate(event_cache.snapshot(event_id))
+
+            # Add the event to the cached timeline (if it's active)
+            timeline.refresh_event(event_id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('incident', event_id, 'created', status)
+            snapshot.publish_event(event_id)
             
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Incident successfully created.')
@@ -133,8 +167,9 @@ def incident(request):
 
     # Not a POST so create a blank form
     else:
-        # There are no affected services selected yet
+        # There are no affected services or email recipients selected yet
         affected_svcs = []
+        affected_emails = []
 
         # Create a blank form
         form = AddIncidentForm()
@@ -153,8 +188,9 @@ def incident(request):
           'services':services,
           'emails':emails,
           'affected_svcs':tuple(affected_svcs),
+          'affected_emails':tuple(affected_emails),
           'form':form,
-          'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+          'email_enabled':siteconfig.get().email.enabled,
           'nav_section':'event',
           'nav_sub':'incident'
 
@@ -182,6 +218,7 @@ def i_update(request):
         # by the user.  Templates do not allow access to Arrays stored in QueryDict objects so we have
         # to determine the list and send back to the template on failed form submits
         affected_svcs = request.POST.getlist('service')
+        affected_emails = request.POST.getlist('email_id')
 
         # Check the form elements
         form = UpdateIncidentForm(request.POST)
@@ -198,7 +235,8 @@ def i_update(request):
             e_time = form.cleaned_data['e_time']
             update = form.cleaned_data['update']
             broadcast = form.cleaned_data['broadcast']
-            email_id = form.cleaned_data['email_id']
+            # Should be numbers only (as with the services), and each recipient only once
+            email_ids = sorted(set([int(email_id) for email_id in affected_emails if re.match(r'^\d+$', email_id)]))
 
             # Combine the dates and times into datetime objects and set the timezones
             tz = pytz.timezone(request.timezone)
@@ -214,48 +252,78 @@ def i_update(request):
                 # Status is still open
                 status='open'
 
-            # Update the event                                     
-            Event.objects.filter(id=id).update(
-                                     description=description,
-                                     status=Status.objects.filter(status=status).values('id')[0]['id'],
-                                     start=start,
-                                     end=end)
-            
-            # Add the update, if there is one, using the current time
-            if update:
-                # Create a datetime object for right now and add the server's timezone (whatever DJango has)
-                time_now = datetime.datetime.now()
-                time_now = pytz.timezone(settings.TIME_ZONE).localize(time_now)
-                Event_Update(event_id=id, date=time_now, update=update, user_id=request.user.id).save()
-
-            # Add the email recipient.  If an email recipient is missing, then the broadcast email will not be checked.
-            # In both cases, delete the existing email (because it will be re-added)
-            Event_Email.objects.filter(event_id=id).delete()
-            if email_id: 
-                Event_Email(event_id=id,email_id=email_id).save()
-
-            # See if we are adding or subtracting services
-            # The easiest thing to do here is remove all affected  
-            # services and re-add the ones indicated here
-
-            # Remove first
-            Event_Service.objects.filter(event_id=id).delete()
-    
-            # Now add (form validation confirms that there is at least 1)
-            for service_id in affected_svcs:
-                # Should be number only -- can't figure out how to validate
-                # multiple checkboxes in the form
-                if re.match(r'^\d+$', service_id):
-                    Event_Service(event_id=id,service_id=service_id).save()
-
-            # Send an email notification to the appropriate list about this issue if requested.  Broadcast won't be
-            # allowed to be true if an email address is not defined or if global email is disabled.
-            if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1 and broadcast:
-                email = notify.email()
-                email.email_event(id,email_id,request.timezone,False)
-
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+            # Record the cache relevant state of the event before changing it
+            before = event_cache.snapshot(id)
+
+            # Save the change and queue its notification in one transaction, so the
+            # notification is only sent if the change is committed
+            with transaction.atomic():
+                # Lock the event and note the services and days it covers and the hour it starts in before the change
+                before_days = rollup.snapshot(id)
+                before_hour = event_counts.snapshot(id)
+
+                # Update the event (update() skips auto_now, so the modification date is set explicitly)
+                Event.objects.filter(id=id).update(
+                                         date=pytz.timezone(settings.TIME_ZONE).localize(datetime.datetime.now()),
+                                         description=description,
+                                         status=Status.objects.filter(status=status).values('id')[0]['id'],
+                                         start=start,
+                                         end=end)
+
+                # Add the update, if there is one, using the current time
+                if update:
+                    # Create a datetime object for right now and add the server's timezone (whatever DJango has)
+                    time_now = datetime.datetime.now()
+                    time_now = pytz.timezone(settings.TIME_ZONE).localize(time_now)
+                    Event_Update(event_id=id, date=time_now, update=update, user_id=request.user.id).save()
+
+                # Add the email recipients.  If email recipients are missing, then the broadcast email will not be checked.
+                # In both cases, delete the existing emails (because they will be re-added)
+                Event_Email.objects.filter(event_id=id).delete()
+                for email_id in email_ids:
+                    Event_Email(event_id=id,email_id=email_id).save()
+
+                # See if we are adding or subtracting services
+                # The easiest thing to do here is remove all affected  
+                # services and re-add the ones indicated here
+
+                # Remove first
+                Event_Service.objects.filter(event_id=id).delete()
+
+                # Now add (form validation confirms that there is at least 1)
+                for service_id in affected_svcs:
+                    # Should be number only -- can't figure out how to validate
+                    # multiple checkboxes in the form
+                    if re.match(r'^\d+$', service_id):
+                        Event_Service(event_id=id,service_id=service_id).save()
+
+                # Queue an email notification to the appropriate list about this issue if requested.  Broadcast won't be
+                # allowed to be true if an email address is not defined or if global email is disabled.
+                if siteconfig.get().email.enabled == 1 and broadcast:
+                    outbox.queue_event(id,email_ids,False,request.timezone)
+
+                # Move the event to the graph count of the hour it starts in now and note the services and days
+                # it covers after the change
+                event_counts.update(before_hour, event_counts.snapshot(id))
+                after_days = rollup.snapshot(id)
+
+            # Recompute the daily availability of the services and days the event covered before and after
+            # (once committed, see rollup.update)
+            rollup.update(before_days, after_days)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(id)
+            search_index.update(id)
+
+            # Clear the cache entries for the days this event started on before and after the update
+            event_cache.invalidate(before, event_cache.snapshot(id))
+
+            # Patch the event in the cached timeline
+            timeline.refresh_event(id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('incident', id, 'updated', status)
+            snapshot.publish_event(id)
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Incident successfully updated')
@@ -297,6 +365,9 @@ def i_update(request):
         for service_id in affected_svcs_tmp:
             affected_svcs.append(service_id['event_service__service_id'])
         affected_svcs = list(affected_svcs)
+
+        # And the email recipients
+        affected_emails = [email['email_id'] for email in Event_Email.objects.filter(event_id=id).values('email_id')]
         
         # Create a blank form
         form = UpdateIncidentForm()
@@ -305,7 +376,6 @@ def i_update(request):
     details = Event.objects.filter(id=id,type__type='incident').values(
                                                 'description',
                                                 'status__status',
-                                                'event_email__email__id',
                                                 'start',
                                                 'end',
                                                 'status__status'
@@ -332,11 +402,12 @@ def i_update(request):
           'details':details,
           'services':services,
           'affected_svcs':affected_svcs,
+          'affected_emails':affected_emails,
           'id':id,
           'form':form,
           'updates':updates,
           'emails':emails,
-          'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+          'email_enabled':siteconfig.get().email.enabled,
           'nav_section':'event',
           'nav_sub':'i_update'
        },
@@ -366,11 +437,33 @@ def i_delete(request):
             # Obtain the cleaned data
             id = form.cleaned_data['id']
 
-            # Delete the incident
-            Event.objects.filter(id=id).delete()
+            # Record the cache relevant state of the event before deleting it
+            before = event_cache.snapshot(id)
+
+            # Delete the incident and take it out of the hourly graph counts in one transaction
+            with transaction.atomic():
+                # Lock the event and note the services and days it covered and the hour it started in
+                before_days = rollup.snapshot(id)
+                before_hour = event_counts.snapshot(id)
+
+                Event.objects.filter(id=id).delete()
+                event_counts.update(before_hour, None)
+
+            # Take the event out of the daily availability of its services (once committed, see rollup.update)
+            rollup.update(before_days)
+
+            # Clear the cache entries for the day this event started on
+            event_cache.invalidate(before)
 
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+            # Remove the event from the cached timeline
+            timeline.remove_event(id)
+
+            # Rebuild the cached event document (its search index entry went with the event)
+            event_doc.refresh(id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('incident', id, 'deleted')
+            snapshot.publish_event(id)
 
             # Set a message that the delete was successful
             messages.add_message(request, messages.SUCCESS, 'Incident id:%s successfully deleted' % id)
@@ -414,6 +507,17 @@ def i_delete(request):
         return HttpResponseRedirect('/admin/i_list')
 
 
+def _detail_version(request):
+    """The detail page changes with the event document and the configuration"""
+
+    id = request.GET.get('id', '')
+    if not id.isdigit():
+        return ('invalid', id)
+
+    return (event_doc.version(id), localcache.version(), id)
+
+
+@conditional.condition(_detail_version)
 def i_detail(request):
     """Incident Detail View
 
@@ -435,48 +539,38 @@ def i_detail(request):
         messages.add_message(request, messages.ERROR, 'Improperly formatted incident ID, cannot display incident detail') 
         return HttpResponseRedirect('/')
 
-    # Obain the incident detail (and make sure it's an incident)
-    details = Event.objects.filter(id=id,type__type='incident').values(
-                                                'status__status',
-                                                'start',
-                                                'end',
-                                                'description',
-                                                'user_id__first_name',
-                                                'user_id__last_name'
-                                                )
+    # Obtain the event document (and make sure it's an incident)
+    doc = event_doc.get(id)
     # If nothing was returned, send back to the home page
-    if not details:
+    if not doc or not doc['type'] == 'incident':
         messages.add_message(request, messages.ERROR, 'Invalid request: no such incident id.')
         return HttpResponseRedirect('/')
 
-    # Which services were impacted
-    services = Event.objects.filter(id=id).values('event_service__service__service_name')
-
-    # Obain any incident updates
-    updates = Event.objects.filter(id=id).values(
-                                                'event_update__id',
-                                                'event_update__date',
-                                                'event_update__update',
-                                                'event_update__user__first_name',
-                                                'event_update__user__last_name'
-                                                ).order_by('event_update__id')
-    # If there are no updates, set to None
-    if len(updates) == 1 and updates[0]['event_update__date'] == None:
-        updates = None
+    details = doc['details']
+    services = doc['services']
+    updates = doc['updates']
 
     # Print the page
-    return render_to_response(
+    response = render_to_response(
        'incidents/i_detail.html',
        {
           'title':'System Status Dashboard | Incident Detail',
           'services':services,
           'id':id,
           'details':details,
-          'updates':updates
+          'updates':updates,
+          'archived':doc.get('archived')
        },
        context_instance=RequestContext(request)
     )
 
+    # The page was last modified by the latest event or update save
+    dates = [detail['date'] for detail in details]
+    if updates:
+        dates.extend([update['event_update__date'] for update in updates])
+
+    return conditional.last_modified(response, *dates)
+
 
 @staff_member_required_ssd
 def i_list(request):
@@ -494,23 +588,16 @@ def i_list(request):
     # Check the params
     if form.is_valid():
 
-        page = form.cleaned_data['page']
+        cursor = form.cleaned_data['cursor']
 
         # Obtain all open incidents
-        incidents_all = Event.objects.filter(type__type='incident',status__status='open').values('id','start','description').order_by('-id')
+        incidents_all = Event.objects.filter(type__type='incident',status__status='open').values('id','start','description')
 
-        # Create a paginator and paginate the list w/ 10 messages per page
-        paginator = Paginator(incidents_all, 10)
+        # Create a keyset paginator and paginate the list w/ 10 messages per page
+        paginator = keyset.KeysetPaginator(incidents_all, 10, ('id',), count_key=keyset.count_key('i_list', *conditional.event_versions()))
 
-        # Paginate them
-        try:
-            incidents = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, or is not given deliver first page.
-            incidents = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            incidents = paginator.page(paginator.num_pages)
+        # Paginate them (a missing or invalid cursor gives the first page)
+        incidents = paginator.page(cursor)
 
         # Print the page
         return render_to_response(
@@ -556,8 +643,16 @@ def i_update_delete(request):
             # Delete the event update
             Event_Update.objects.filter(id=id).delete()
 
-            # Clear the cache 
-            cache.delete('timeline')
+            # Remove the update from the cached timeline
+            timeline.remove_update(event_id, id)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(event_id)
+            search_index.update(event_id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('incident', event_id, 'updated')
+            snapshot.publish_event(event_id)
 
             # Set a message that the delete was successful
             messages.add_message(request, messages.SUCCESS, 'Incident update id:%s successfully deleted' % id)
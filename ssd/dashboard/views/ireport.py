@@ -21,22 +21,29 @@ import os
 import datetime
 import pytz
 from django.conf import settings
-from django.core.cache import cache
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
-from ssd.dashboard.models import Config_Ireport, Config_Email, Ireport
+from django.db import transaction
+from ssd.dashboard.models import Config_Ireport, Ireport
 from ssd.dashboard.forms import IreportConfigForm, ReportIncidentForm, ListForm, DeleteEventForm, DetailForm
-from ssd.dashboard import notify
+from ssd.dashboard import functions
+from ssd.dashboard import keyset
+from ssd.dashboard import outbox
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
 logger = logging.getLogger(__name__)
 
 
+# Moved whenever an incident report is added or deleted (keys the cached report count)
+IREPORT_VERSION_KEY = 'ireport_ns'
+
+
 def ireport(request):
     """Report View
 
@@ -47,17 +54,14 @@ def ireport(request):
     logger.debug('%s view being executed.' % 'ireport.ireport')
 
     # If this functionality is disabled in the admin, let the user know
-    enable_ireport = cache.get('enable_ireport')
-    if enable_ireport == None:
-        enable_ireport = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('enabled')[0]['enabled']
-        cache.set('enable_ireport', enable_ireport)
-    if enable_ireport == 0:
+    config = siteconfig.get()
+    if config.ireport.enabled == 0:
         # Incident reports are disabled, send them to the homepage with an error message
         messages.add_message(request, messages.ERROR, 'Your system administrator has disabled incident reports')
         return HttpResponseRedirect('/')
 
     # See if file uploads are anabled
-    enable_uploads = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('upload_enabled')[0]['upload_enabled']
+    enable_uploads = config.ireport.upload_enabled
 
     # If this is a POST, then check the input params and perform the
     # action, otherwise print the index page
@@ -98,27 +102,31 @@ def ireport(request):
                 screenshot2 = ''
             
             # Save the data (if the admin has not setup the upload directory, it'll fail)
+            # The page to the pager address is queued in the same transaction (the ssd_outbox worker sends it)
             try:
-                Ireport(date=report_time,
-                        name=name,
-                        email=email,
-                        detail=detail,
-                        extra=extra,
-                        screenshot1=screenshot1,
-                        screenshot2=screenshot2,
-                       ).save()
+                with transaction.atomic():
+                    Ireport(date=report_time,
+                            name=name,
+                            email=email,
+                            detail=detail,
+                            extra=extra,
+                            screenshot1=screenshot1,
+                            screenshot2=screenshot2,
+                           ).save()
+
+                    # If email is enabled and report notifications are turned on, page the pager address
+                    if config.email.enabled == 1:
+                        if config.ireport.email_enabled == 1:
+                            outbox.queue_page(detail)
             except Exception as e:
                 messages.add_message(request, messages.ERROR, e)
                 return HttpResponseRedirect('/')
 
-            # If email is enabled and report notifications are turned on, send an email to the pager address
-            if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1:
-                if Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('email_enabled')[0]['email_enabled'] == 1:
-                    pager = notify.email()
-                    pager.page(detail)
+            # The report list has changed
+            functions.namespace_bump(logger, IREPORT_VERSION_KEY)
 
             # Give the user a thank you and let them know what to expect
-            message = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('submit_message')[0]['submit_message']
+            message = config.ireport.submit_message
             messages.add_message(request, messages.SUCCESS, message)
             return HttpResponseRedirect('/')
         
@@ -137,7 +145,7 @@ def ireport(request):
           'title':'System Status Dashboard | Report Incident',
           'form':form,
           'enable_uploads':enable_uploads,
-          'instructions':Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('instructions')[0]['instructions']
+          'instructions':config.ireport.instructions
        },
        context_instance=RequestContext(request)
     )
@@ -180,7 +188,10 @@ def ireport_config(request):
                                                   )
 
             # Clear the cache 
-            cache.delete('enable_ireport')
+            siteconfig.invalidate()
+
+            # Refresh the static snapshot, every page shows the configuration
+            snapshot.publish_config()
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Preferences saved successfully')
@@ -193,16 +204,16 @@ def ireport_config(request):
         form = IreportConfigForm
 
     # Obtain the email config
-    ireport_config = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('enabled','email_enabled','instructions','submit_message','upload_path','upload_enabled','file_size')
+    config = siteconfig.get()
 
     # Print the page
     return render_to_response(
        'ireport/config.html',
        {
           'title':'System Status Dashboard | Incident Report Configuration',
-          'ireport_config':ireport_config,
+          'ireport_config':config.ireport,
           'form':form,
-          'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+          'email_enabled':config.email.enabled,
           'nav_section':'ireport',
           'nav_sub':'ireport_config'
        },
@@ -226,23 +237,16 @@ def ireport_list(request):
     # Check the params
     if form.is_valid():
 
-        page = form.cleaned_data['page']
+        cursor = form.cleaned_data['cursor']
 
         # Obtain all incidents reports
-        ireports_all = Ireport.objects.values('id','date','name','email','detail','extra','screenshot1','screenshot2').order_by('-id')
+        ireports_all = Ireport.objects.values('id','date','name','email','detail','extra','screenshot1','screenshot2')
 
-        # Create a paginator and paginate the list w/ 10 messages per page
-        paginator = Paginator(ireports_all, 10)
+        # Create a keyset paginator and paginate the list w/ 10 messages per page
+        paginator = keyset.KeysetPaginator(ireports_all, 10, ('id',), count_key=keyset.count_key('ireport_list', functions.namespace_get(logger, IREPORT_VERSION_KEY)))
 
-        # Paginate them
-        try:
-            ireports = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, or is not given deliver first page.
-            ireports = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            ireports = paginator.page(paginator.num_pages)
+        # Paginate them (a missing or invalid cursor gives the first page)
+        ireports = paginator.page(cursor)
 
         # Print the page
         return render_to_response(
@@ -286,7 +290,7 @@ def ireport_delete(request):
 
             # First, delete any screenshots
             # Obtain the local uploads location
-            upload_path = Config_Ireport.objects.filter(id=Config_Ireport.objects.values('id')[0]['id']).values('upload_path')[0]['upload_path']
+            upload_path = siteconfig.get().ireport.upload_path
             # Get any screenshots
             screenshots = Ireport.objects.filter(id=id).values('screenshot1','screenshot2')
             for screenshot in screenshots:
@@ -302,6 +306,9 @@ def ireport_delete(request):
             # Delete the incident
             Ireport.objects.filter(id=id).delete()
 
+            # The report list has changed
+            functions.namespace_bump(logger, IREPORT_VERSION_KEY)
+
             # Set a message that the delete was successful
             messages.add_message(request, messages.SUCCESS, 'Incident report id:%s successfully deleted' % id)
 
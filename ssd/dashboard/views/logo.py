@@ -17,7 +17,6 @@
 """This module contains all of the logo configuration functions of SSD."""
 
 import logging
-from django.core.cache import cache
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
 from django.template import RequestContext
@@ -25,6 +24,8 @@ from django.http import HttpResponseRedirect
 from django.contrib import messages
 from ssd.dashboard.models import Config_Logo
 from ssd.dashboard.forms import LogoConfigForm
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
@@ -55,7 +56,10 @@ def logo_config(request):
             Config_Logo.objects.filter(id=Config_Logo.objects.values('id')[0]['id']).update(url=url,logo_enabled=logo_enabled)
 
             # Clear the cache 
-            cache.delete_many(['display_logo','logo_url'])
+            siteconfig.invalidate()
+
+            # Refresh the static snapshot, every page shows the configuration
+            snapshot.publish_config()
 
             messages.add_message(request, messages.SUCCESS, 'Preferences saved successfully')
         else:
@@ -67,7 +71,7 @@ def logo_config(request):
         form = LogoConfigForm
 
     # Obtain the email config
-    logo_config = Config_Logo.objects.filter(id=Config_Logo.objects.values('id')[0]['id']).values('url','logo_enabled')
+    logo_config = siteconfig.get().logo
 
     # Print the page
     return render_to_response(
@@ -22,20 +22,36 @@ import datetime
 import pytz
 import re
 from django.conf import settings
-from django.core.cache import cache
-from django.db.models import Q
 from django.http import HttpResponseRedirect
 from django.contrib import messages
 from django.shortcuts import render_to_response
 from django.template import RequestContext
-from ssd.dashboard.models import Event, Event_Update, Service, Config_Message
+from ssd.dashboard.models import Service
+from ssd.dashboard import conditional
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_counts
 from ssd.dashboard import functions
+from ssd.dashboard import grid
+from ssd.dashboard import localcache
+from ssd.dashboard import siteconfig
+from ssd.dashboard import timeline as dashboard_timeline
 
 
 # Get an instance of the ssd logger
 logger = logging.getLogger(__name__)
 
 
+def _index_version(request):
+    """The dashboard changes with any event or configuration write, the
+    reference date and (when no reference date is given) the current date
+
+    """
+
+    today = datetime.datetime.now(pytz.timezone(request.timezone)).date()
+    return conditional.event_versions() + (request.GET.get('ref'), today)
+
+
+@conditional.condition(_index_version)
 def index(request):
     """Index Page View
 
@@ -46,6 +62,9 @@ def index(request):
 
     logger.debug('%s view being executed.' % 'main.index')
 
+    # The requested timezone, used for all date conversions in this view
+    tz = pytz.timezone(request.timezone)
+
     # -------------------------------------------------------- #
     # OBTAIN AND CONFIGURE DATE INFORMATION
 
@@ -61,7 +80,7 @@ def index(request):
         ref = pytz.timezone(settings.TIME_ZONE).localize(ref)
 
         # Now convert to the requested timezone
-        ref = ref.astimezone(pytz.timezone(request.timezone))
+        ref = ref.astimezone(tz)
 
         # Format for just the year, month, day.  We'll add the entire day later
         ref = ref.strftime("%Y-%m-%d")
@@ -79,14 +98,14 @@ def index(request):
         messages.add_message(request, messages.ERROR, 'Improperly formatted reference date.')
         # Redirect to the homepage
         return HttpResponseRedirect('/') 
-    ref_q = pytz.timezone(request.timezone).localize(ref_q)
+    ref_q = tz.localize(ref_q)
 
     # The reference date is the last date displayed in the calendar
     # so add that and create a datetime object in the user's timezone
     # (or the server timezone if its not set)
     ref += ' 00:00:00'
     ref = datetime.datetime.strptime(ref,'%Y-%m-%d %H:%M:%S') 
-    ref = pytz.timezone(request.timezone).localize(ref)
+    ref = tz.localize(ref)
 
     # Obtain the current 7 days
     dates = []
@@ -116,110 +135,11 @@ def index(request):
     # OBTAIN ACTIVE INCIDENT INFORMATION
     #
     # This information will be used to build the timelines and also as lookups
-    # to set the service status in the main dashboard
-    #
-    # We'll use the following data structure
-    # timeline = {
-    #              'events': {
-    #                            incident':{
-    #                                        '1': {
-    #                                               'start':'2013-01-01 10:28:25 PDT',
-    #                                               'description':'We are having an issue with the exchange server',
-    #                                               'services':['service1','service2'],                                
-    #                                               'updates': [
-    #                                                            ['2013-01-01 10:29:25 PDT','We are having an issue'],
-    #                                                            ['2013-01-01 10:30:25 PDT','Resolved now']
-    #                                                           ]
-    #                                              }
-    #                                       },
-    #                            
-    #                            maintenance':{
-    #                                           '5': {
-    #                                                  'start':'2013-01-01 10:28:25 PDT',
-    #                                                  'description':'We are having an issue with the exchange server',
-    #                                                  'services':['service1','service2'],                                
-    #                                                  'updates': [
-    #                                                               ['2013-01-01 10:29:25 PDT','We are having an issue'],
-    #                                                               ['2013-01-01 10:30:25 PDT','Resolved now']
-    #                                                             ]
-    #                                                 }
-    #                                         }
-    #
-    #
-    #                        },
-    #               'lookup': {
-    #                           'incident': {
-    #                                           'service1': '',
-    #                                           'service2': ''
-    #                                       },
-    #                           'maintenance': {
-    #                                                'service3': '',
-    #                                                'service4': ''
-    #                                            }
-    #                         }
-    #            }
-    #          
-    timeline = cache.get('timeline')
-    if timeline == None:
-        logger.debug('cache miss: %s' % 'timeline')
-
-        # Create the timeline structure
-        timeline = {
-                    'events': {},
-                    'lookup': {
-                                'incident': {},
-                                'maintenance': {}
-                    }
-        }
-
-        
-        # Get the events
-        timeline_events = Event.objects.filter(Q(status__status='open') | Q(status__status='started')).values('id','start','type__type','description').order_by('start')
-
-        # Build the timeline data structure
-        for event in timeline_events:
-
-            # Add the type to the timeline if not there
-            if not event['type__type'] in timeline['events']:
-                timeline['events'][event['type__type']] = {}
-            
-            # Add the event id to the timeline if not there
-            if not event['id'] in timeline['events'][event['type__type']]:
-                timeline['events'][event['type__type']][event['id']] = {}
-
-            # Add the event data to the timeline
-            timeline['events'][event['type__type']][event['id']]['start'] = event['start']
-            timeline['events'][event['type__type']][event['id']]['description'] = event['description']
-
-            # Find out which services this event impacts and add to the timeline
-            # We need to cast this to a list so that it's evaluated and caching works properly
-            services_impacted = list(Event.objects.filter(id=event['id']).values('event_service__service__service_name'))
-
-            # Add the services to the timeline
-            timeline['events'][event['type__type']][event['id']]['services'] = services_impacted
-
-            # Check each service impacted and add to the events_lookup table
-            for service in services_impacted:
-
-                if not service['event_service__service__service_name'] in timeline['lookup'][event['type__type']]:
-                    timeline['lookup'][event['type__type']][service['event_service__service__service_name']] = ''            
-
-        # Now get the updates
-        timeline_updates = Event_Update.objects.filter(Q(event_id__status__status='open') | Q(event_id__status__status='started')).values('event_id','event_id__type__type','date','update').order_by('id')
-
-        for update in timeline_updates:
-
-            # Add the updates array to the timeline if not there
-            if not 'updates' in timeline['events'][update['event_id__type__type']][update['event_id']]:
-                timeline['events'][update['event_id__type__type']][update['event_id']]['updates'] = []
-
-            # Add the update to the timeline
-            timeline['events'][update['event_id__type__type']][update['event_id']]['updates'].append([update['date'],update['update']])
-
-        # Put in cache
-        cache.set('timeline', timeline)
-    else:
-        logger.debug('cache hit: %s' % 'timeline')
+    # to set the service status in the main dashboard.  See ssd.dashboard.timeline
+    # for the data structure.
+    # The timeline is built with a fixed number of queries and only one
+    # worker rebuilds it when it expires
+    timeline = functions.cache_get_or_compute(logger, 'timeline', dashboard_timeline.build)
     
     # END ACTIVE INCIDENT INFORMATION
     # -------------------------------------------------------- #
@@ -246,106 +166,18 @@ def index(request):
 
 
     # Grab all services
-    services = cache.get('services')
-    if services == None:
-        logger.debug('cache miss: %s' % 'services')
-        services = Service.objects.values('service_name').order_by('service_name')
-        cache.set('services', services)
-    else:
-        logger.debug('cache hit: %s' % 'services')
+    services = localcache.get(logger, 'services', lambda: list(Service.objects.values('service_name').order_by('service_name')))
 
 
-    # Grab all events within the time range requested (for the specific time range):
-    # 
-    # The memcache key will be:
-    # events_[ns]_[from]_[to]
-    #
+    # Grab all events within the time range requested (for the specific time range).
+    # These are served from per-day shards (see ssd.dashboard.event_cache) so
+    # overlapping windows share cache entries.
+    events = event_cache.get_events(dates[0], ref_q)
 
-    # Obtain the memcached namespace for the key events_
-    events_ns = functions.namespace_get(logger, 'events_ns')
-    events_key = 'events_%s_%s_%s' % (events_ns,dates[0].strftime('%Y%m%d%Z'),ref.strftime('%Y%m%d%Z'))
-    logger.debug('events key: %s' % events_key)
-    
-    events = cache.get(events_key)
-    if events == None:
-        logger.debug('cache miss: %s' % events_key)
-        # The only thing we don't want shown here are maintenances that are in the planning stage
-        events = Event.objects.filter(start__range=[dates[0],ref_q]).exclude(status__status='planning').values(
-                                                                                                              'id',
-                                                                                                              'type__type',
-                                                                                                              'description',
-                                                                                                              'start',
-                                                                                                              'end',
-                                                                                                              'event_service__service__service_name',
-                                                                                                              'status__status'
-                                                                                                              ).order_by('id')
-        cache.set(events_key, list(events))
-    else:
-        logger.debug('cache hit: %s' % events_key)
-
-
-    # Run through each service and see if it had an incident during the time range
-    for service in services:
-        # Make a row for this service, which looks like this:
-        # {service:www.domain1.com,status:0},['green'],[{'id':foo, 'description':foo,'open':foo,'closed':foo,'type':foo}]
-        # The service will initially be green and incidents trump maintenances
-        # Statuses are as follows:
-        #   - 0 = green
-        #   - 1 = active incident
-        #   - 2 = active maintenance
-        row = [{'service':service['service_name'],'status':0}]
-
-        # Set the status from our lookup table first
-        # Incidents over-ride everything for setting the status of the service
-        if service['service_name'] in timeline['lookup']['incident']:
-            row[0]['status'] = 1
-        elif service['service_name'] in timeline['lookup']['maintenance']:
-            row[0]['status'] = 2
-
-        # Run through each date for each service
-        for date in dates:
-
-            # Check each event to see if there is a match
-            # There could be more than one event per day
-            row_event = []
-
-            # First the incidents
-            for event in events:
-                if service['service_name'] == event['event_service__service__service_name']:
-
-                    # This event affected our service
-                    # Convert to the requested timezone
-                    event_date = event['start']
-                    event_date = event_date.astimezone(pytz.timezone(request.timezone))
-
-                    # If the event closed date is there, make sure the time zone is correct
-                    end_date = event['end']
-                    if event['end']:
-                        end_date = end_date.astimezone(pytz.timezone(request.timezone))
-
-                    # If this is our date, add it
-                    if date.date() == event_date.date():
-                        # This is our date so add the incident information
-                        e = {
-                                 'id':event['id'],
-                                 'type':event['type__type'],
-                                 'description':event['description'],
-                                 'open':event_date,
-                                 'closed':end_date,
-                                 'status':event['status__status']
-                                 }
-                        row_event.append(e)
-            
-            # If the row_event is empty, this indicates there were no incidents so mark this date/service as green
-            if not row_event:
-                row_event.append('green')
-                
-
-            # Add the event row to the main row
-            row.append(row_event)
-
-        # Add the main row to our data dict
-        data.append(row)
+
+    # Bucket the events by service and local date once and then assemble
+    # the rows from those buckets
+    data.extend(grid.build_rows(services, events, dates, timeline['lookup'], tz))
     
     # END MAIN DASHBOARD TABLE INFORMATION
     # -------------------------------------------------------- #
@@ -385,21 +217,10 @@ def index(request):
     forward = datetime.timedelta(days=day_range)
     forward_date = ref_q + forward
 
-    # Obtain the memcached namespace for the key event_count_
-    event_count_ns = functions.namespace_get(logger, 'event_count_ns')
-    event_count_key = 'event_count_%s_%s_%s' % (event_count_ns,back_date.strftime('%Y%m%d%Z'),forward_date.strftime('%Y%m%d%Z'))
-    logger.debug('event_count key: %s' % event_count_key)
-
-    # Check the cache
-    event_count = cache.get(event_count_key)
-    if event_count == None:
-        logger.debug('cache miss: %s ' % event_count_key)
-        event_count = Event.objects.filter(start__range=[back_date,forward_date]).values('type__type','start')
-        cache.set(event_count_key, event_count)
-    else:
-        logger.debug('cache hit: %s ' % event_count_key)
+    # Obtain the number of events of each type on each day in the range from the hourly counts
+    day_counts = event_counts.daily_counts(back_date, forward_date, tz)
 
-    # Iterate through the graph_dates and find matching events
+    # Iterate through the graph_dates and fill in their counts
     # This data structure will look like this:
     # count_data = [
     #               {'date' : '2013-09-01', 'incidents':0, 'maintenances':0, 'reports':1}
@@ -415,11 +236,10 @@ def index(request):
         # Create a tuple to hold this data series
         t = {'date':day, 'incident':0, 'maintenance':0}
 
-        # Check for events that match this date
-        for row in event_count:
-            if row['start'].astimezone(pytz.timezone(request.timezone)).strftime("%Y-%m-%d") == day:
-                t[row['type__type']] += 1
-                show_graph = True
+        # Add the counts for this date
+        if day in day_counts:
+            t.update(day_counts[day])
+            show_graph = True
 
         # Add the tuple
         count_data.append(t)
@@ -430,23 +250,17 @@ def index(request):
 
     # -------------------------------------------------------- #
     # OBTAIN ALERT AND INFORMATION TEXT
-    alerts = cache.get('alerts')
-    if alerts == None:
-        logger.debug('cache miss: %s' % 'alerts')
-        alerts = Config_Message.objects.filter(id=Config_Message.objects.values('id')[0]['id']).values('alert_enabled','alert','main_enabled','main')
-        cache.set('alerts', alerts)
-    else:
-        logger.debug('cache hit: %s' % 'alerts')
+    message_config = siteconfig.get().message
 
     # If we are showing the alert, obtain the alert text
-    if alerts[0]['alert_enabled'] == 1:
-        alert = alerts[0]['alert']
+    if message_config.alert_enabled == 1:
+        alert = message_config.alert
     else:
         alert = None
 
     # If we are showing the information message, obtain the text
-    if alerts[0]['main_enabled'] == 1:
-        information = alerts[0]['main']
+    if message_config.main_enabled == 1:
+        information = message_config.main
     else:
         information = None
     # END ALERT AND INFORMATION TEXT
@@ -22,18 +22,29 @@ import datetime
 import pytz
 import re
 from django.conf import settings
-from django.core.cache import cache
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Q
 from django.contrib.auth.models import User
 from ssd.dashboard.decorators import staff_member_required_ssd
-from ssd.dashboard.models import Event, Type, Status, Event_Service, Event_Update, Event_Email, Event_Impact, Event_Coordinator, Service, Email,Config_Email
+from ssd.dashboard.models import Event, Type, Status, Event_Service, Event_Update, Event_Email, Event_Impact, Event_Coordinator, Service, Email
 from ssd.dashboard.forms import DeleteUpdateForm, DetailForm, DeleteEventForm,UpdateMaintenanceForm, EmailMaintenanceForm, AddMaintenanceForm, ListForm
-from ssd.dashboard import notify
+from ssd.dashboard import conditional
+from ssd.dashboard import event_cache
+from ssd.dashboard import event_counts
+from ssd.dashboard import event_doc
+from ssd.dashboard import feed
+from ssd.dashboard import keyset
+from ssd.dashboard import localcache
+from ssd.dashboard import outbox
+from ssd.dashboard import rollup
+from ssd.dashboard import search_index
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
+from ssd.dashboard import timeline
 
 
 # Get an instance of the ssd logger
@@ -56,6 +67,7 @@ def maintenance(request):
         # by the user.  Templates do not allow access to Arrays stored in QueryDict objects so we have
         # to determine the list and send back to the template on failed form submits
         affected_svcs = request.POST.getlist('service')
+        affected_emails = request.POST.getlist('email_id')
 
         # Check the form elements
         form = AddMaintenanceForm(request.POST)
@@ -71,7 +83,8 @@ def maintenance(request):
             impact = form.cleaned_data['impact']
             coordinator = form.cleaned_data['coordinator']
             broadcast = form.cleaned_data['broadcast']
-            email_id = form.cleaned_data['email_id']
+            # Should be numbers only (as with the services), and each recipient only once
+            email_ids = sorted(set([int(email_id) for email_id in affected_emails if re.match(r'^\d+$', email_id)]))
                         
             # Combine the dates and times into datetime objects
             start = datetime.datetime.combine(s_date, s_time)
@@ -82,42 +95,62 @@ def maintenance(request):
             start = tz.localize(start)
             end = tz.localize(end)
             
-            # Create the event and obtain the ID                                     
-            e = Event.objects.create(type_id=Type.objects.filter(type='maintenance').values('id')[0]['id'],
-                                     description=description,
-                                     status_id=Status.objects.filter(status='planning').values('id')[0]['id'],
-                                     start=start,
-                                     end=end,
-                                     user_id=request.user.id
-                                    )
-            event_id = e.pk
-
-            # Save the impact analysis
-            Event_Impact(event_id=event_id,impact=impact).save()
-
-            # Save the coordinator, if requested
-            Event_Coordinator(event_id=event_id,coordinator=coordinator).save()
-
-            # Add the email recipient, if requested
-            if email_id: 
-                Event_Email(event_id=event_id,email_id=email_id).save()
-
-            # Find out which services this impacts and associate the services with the event
-            # Form validation confirms that there is at least 1
-            for service_id in affected_svcs:
-                # Should be number only -- can't figure out how to validate
-                # multiple checkboxes in the form
-                if re.match(r'^\d+$', service_id):
-                    Event_Service(service_id=service_id,event_id=event_id).save()
-
-            # Send an email notification to the appropriate list about this maintenance, if requested.  Broadcast won't be
-            # allowed to be true if an email address is not defined or if global email is disabled.
-            if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1 and broadcast:
-                email = notify.email()
-                email.email_event(event_id,email_id,request.timezone,True)
-
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+            # Save the change and queue its notification in one transaction, so the
+            # notification is only sent if the change is committed
+            with transaction.atomic():
+                # Create the event and obtain the ID                                     
+                e = Event.objects.create(type_id=Type.objects.filter(type='maintenance').values('id')[0]['id'],
+                                         description=description,
+                                         status_id=Status.objects.filter(status='planning').values('id')[0]['id'],
+                                         start=start,
+                                         end=end,
+                                         user_id=request.user.id
+                                        )
+                event_id = e.pk
+
+                # Save the impact analysis
+                Event_Impact(event_id=event_id,impact=impact).save()
+
+                # Save the coordinator, if requested
+                Event_Coordinator(event_id=event_id,coordinator=coordinator).save()
+
+                # Add the email recipients, if requested
+                for email_id in email_ids:
+                    Event_Email(event_id=event_id,email_id=email_id).save()
+
+                # Find out which services this impacts and associate the services with the event
+                # Form validation confirms that there is at least 1
+                for service_id in affected_svcs:
+                    # Should be number only -- can't figure out how to validate
+                    # multiple checkboxes in the form
+                    if re.match(r'^\d+$', service_id):
+                        Event_Service(service_id=service_id,event_id=event_id).save()
+
+                # Queue an email notification to the appropriate list about this maintenance, if requested.  Broadcast won't be
+                # allowed to be true if an email address is not defined or if global email is disabled.
+                if siteconfig.get().email.enabled == 1 and broadcast:
+                    outbox.queue_event(event_id,email_ids,True,request.timezone)
+
+                # Roll the event into the hourly graph counts and note the services and days it covers
+                event_counts.update(None, event_counts.snapshot(event_id))
+                after_days = rollup.snapshot(event_id)
+
+            # Roll the event into the daily availability of its services (once committed, see rollup.update)
+            rollup.update(after_days)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(event_id)
+            search_index.update(event_id)
+
+            # Clear the cache entries for the day this event starts on
+            event_cache.invalidate(event_cache.snapshot(event_id))
+
+            # Add the event to the cached timeline (if it's active)
+            timeline.refresh_event(event_id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('maintenance', event_id, 'created', 'planning')
+            snapshot.publish_event(event_id)
             
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Maintenance successfully created.')
@@ -132,8 +165,9 @@ def maintenance(request):
     # Not a POST so create a blank form
     else:
 
-        # There are no affected services selected yet
+        # There are no affected services or email recipients selected yet
         affected_svcs = []
+        affected_emails = []
         
         # Create a blank form
         form = AddMaintenanceForm() 
@@ -152,8 +186,9 @@ def maintenance(request):
           'form':form,
           'services':services,
           'affected_svcs':tuple(affected_svcs),
+          'affected_emails':tuple(affected_emails),
           'emails':emails,
-          'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+          'email_enabled':siteconfig.get().email.enabled,
           'nav_section':'event',
           'nav_sub':'maintenance'
        },
@@ -180,6 +215,7 @@ def m_update(request):
         # by the user.  Templates do not allow access to Arrays stored in QueryDict objects so we have
         # to determine the list and send back to the template on failed form submits
         affected_svcs = request.POST.getlist('service')
+        affected_emails = request.POST.getlist('email_id')
 
         # Check the form elements
         form = UpdateMaintenanceForm(request.POST)
@@ -198,7 +234,8 @@ def m_update(request):
             coordinator = form.cleaned_data['coordinator']
             update = form.cleaned_data['update']
             broadcast = form.cleaned_data['broadcast']
-            email_id = form.cleaned_data['email_id']
+            # Should be numbers only (as with the services), and each recipient only once
+            email_ids = sorted(set([int(email_id) for email_id in affected_emails if re.match(r'^\d+$', email_id)]))
             started = form.cleaned_data['started']
             completed = form.cleaned_data['completed']
 
@@ -219,61 +256,91 @@ def m_update(request):
             else:
                 status='planning'
 
-            # Update the event                                     
-            Event.objects.filter(id=id).update(
-                                     description=description,
-                                     status=Status.objects.filter(status=status).values('id')[0]['id'],
-                                     start=start,
-                                     end=end)
+            # Record the cache relevant state of the event before changing it
+            before = event_cache.snapshot(id)
+
+            # Save the change and queue its notification in one transaction, so the
+            # notification is only sent if the change is committed
+            with transaction.atomic():
+                # Lock the event and note the services and days it covers and the hour it starts in before the change
+                before_days = rollup.snapshot(id)
+                before_hour = event_counts.snapshot(id)
+
+                # Update the event (update() skips auto_now, so the modification date is set explicitly)
+                Event.objects.filter(id=id).update(
+                                         date=pytz.timezone(settings.TIME_ZONE).localize(datetime.datetime.now()),
+                                         description=description,
+                                         status=Status.objects.filter(status=status).values('id')[0]['id'],
+                                         start=start,
+                                         end=end)
+
+                # Update the impact analysis (if it's blank, make sure it's deleted, maybe they added it previously)
+                if impact:
+                    Event_Impact.objects.filter(event_id=id).update(impact=impact)
+                else:
+                    Event_Impact.objects.filter(event_id=id).delete()
 
-            # Update the impact analysis (if it's blank, make sure it's deleted, maybe they added it previously)
-            if impact:
-                Event_Impact.objects.filter(event_id=id).update(impact=impact)
-            else:
-                Event_Impact.objects.filter(event_id=id).delete()
+                # Update the coordinator (if it's blank, make sure it's deleted, maybe they added it previously)
+                if coordinator:
+                    Event_Coordinator.objects.filter(event_id=id).update(coordinator=coordinator)
+                else:
+                    Event_Coordinator.objects.filter(event_id=id).delete()
 
-            # Update the coordinator (if it's blank, make sure it's deleted, maybe they added it previously)
-            if coordinator:
-                Event_Coordinator.objects.filter(event_id=id).update(coordinator=coordinator)
-            else:
-                Event_Coordinator.objects.filter(event_id=id).delete()
+                # Add the update, if there is one, using the current time
+                if update:
+                    # Create a datetime object for right now and add the server's timezone (whatever DJango has)
+                    time_now = datetime.datetime.now()
+                    time_now = pytz.timezone(settings.TIME_ZONE).localize(time_now)
+                    Event_Update(event_id=id, date=time_now, update=update, user_id=request.user.id).save()
 
-            # Add the update, if there is one, using the current time
-            if update:
-                # Create a datetime object for right now and add the server's timezone (whatever DJango has)
-                time_now = datetime.datetime.now()
-                time_now = pytz.timezone(settings.TIME_ZONE).localize(time_now)
-                Event_Update(event_id=id, date=time_now, update=update, user_id=request.user.id).save()
+                # Add the email recipients.  If email recipients are missing, then the broadcast email will not be checked.
+                # In both cases, delete the existing emails (because they will be re-added)
+                Event_Email.objects.filter(event_id=id).delete()
+                for email_id in email_ids:
+                    Event_Email(event_id=id,email_id=email_id).save()
 
-            # Add the email recipient.  If an email recipient is missing, then the broadcast email will not be checked.
-            # In both cases, delete the existing email (because it will be re-added)
-            Event_Email.objects.filter(event_id=id).delete()
-            if email_id:
-                Event_Email(event_id=id,email_id=email_id).save()
 
+                # See if we are adding or subtracting services
+                # The easiest thing to do here is remove all affected  
+                # services and re-add the ones indicated here
 
-            # See if we are adding or subtracting services
-            # The easiest thing to do here is remove all affected  
-            # services and re-add the ones indicated here
+                # Remove first
+                Event_Service.objects.filter(event_id=id).delete()
 
-            # Remove first
-            Event_Service.objects.filter(event_id=id).delete()
-    
-            # Now add (form validation confirms that there is at least 1)
-            for service_id in affected_svcs:
-                # Should be number only -- can't figure out how to validate
-                # multiple checkboxes in the form
-                if re.match(r'^\d+$', service_id):
-                    Event_Service(event_id=id,service_id=service_id).save()
-           
-            # Send an email notification to the appropriate list about this maintenance, if requested.  Broadcast won't be
-            # allowed to be true if an email address is not defined or if global email is disabled.
-            if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1 and broadcast:
-                email = notify.email()
-                email.email_event(id,email_id,request.timezone,False)
-
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+                # Now add (form validation confirms that there is at least 1)
+                for service_id in affected_svcs:
+                    # Should be number only -- can't figure out how to validate
+                    # multiple checkboxes in the form
+                    if re.match(r'^\d+$', service_id):
+                        Event_Service(event_id=id,service_id=service_id).save()
+
+                # Queue an email notification to the appropriate list about this maintenance, if requested.  Broadcast won't be
+                # allowed to be true if an email address is not defined or if global email is disabled.
+                if siteconfig.get().email.enabled == 1 and broadcast:
+                    outbox.queue_event(id,email_ids,False,request.timezone)
+
+                # Move the event to the graph count of the hour it starts in now and note the services and days
+                # it covers after the change
+                event_counts.update(before_hour, event_counts.snapshot(id))
+                after_days = rollup.snapshot(id)
+
+            # Recompute the daily availability of the services and days the event covered before and after
+            # (once committed, see rollup.update)
+            rollup.update(before_days, after_days)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(id)
+            search_index.update(id)
+
+            # Clear the cache entries for the days this event started on before and after the update
+            event_cache.invalidate(before, event_cache.snapshot(id))
+
+            # Patch the event in the cached timeline
+            timeline.refresh_event(id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('maintenance', id, 'updated', status)
+            snapshot.publish_event(id)
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Maintenance successfully updated')
@@ -317,6 +384,9 @@ def m_update(request):
             affected_svcs.append(service_id['event_service__service_id'])
         affected_svcs = list(affected_svcs)
 
+        # And the email recipients
+        affected_emails = [email['email_id'] for email in Event_Email.objects.filter(event_id=id).values('email_id')]
+
         # Create a blank form
         form = UpdateMaintenanceForm()
 
@@ -329,7 +399,6 @@ def m_update(request):
                                                 'description',
                                                 'event_impact__impact',
                                                 'event_coordinator__coordinator',
-                                                'event_email__email__id',
                                                 'user__first_name',
                                                 'user__last_name'
                                                 )
@@ -367,6 +436,7 @@ def m_update(request):
           'title':'System Status Dashboard | Scheduled Maintenance Update',
           'details':details,
           'affected_svcs':affected_svcs,
+          'affected_emails':affected_emails,
           'services':services,
           'id':id,
           'form':form,
@@ -375,7 +445,7 @@ def m_update(request):
           'e_date':e_date,
           'e_time':e_time,
           'emails':emails,
-          'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+          'email_enabled':siteconfig.get().email.enabled,
           'updates':updates,
           'nav_section':'event',
           'nav_sub':'m_update'
@@ -384,6 +454,17 @@ def m_update(request):
     )
 
 
+def _detail_version(request):
+    """The detail page changes with the event document and the configuration"""
+
+    id = request.GET.get('id', '')
+    if not id.isdigit():
+        return ('invalid', id)
+
+    return (event_doc.version(id), localcache.version(), id)
+
+
+@conditional.condition(_detail_version)
 def m_detail(request):
     """Maintenance Detail View
 
@@ -406,40 +487,19 @@ def m_detail(request):
         messages.add_message(request, messages.ERROR, 'Improperly formatted maintenance ID, cannot display maintenance detail') 
         return HttpResponseRedirect('/')
 
-    # Obain the maintenance detail (and make sure it's a maintenance)
-    details = Event.objects.filter(id=id,type__type='maintenance').values(
-                                                'start',
-                                                'end',
-                                                'status__status',
-                                                'description',
-                                                'event_impact__impact',
-                                                'event_coordinator__coordinator',
-                                                'event_email__email__email',
-                                                'user_id__first_name',
-                                                'user_id__last_name'
-                                                )
+    # Obtain the event document (and make sure it's a maintenance)
+    doc = event_doc.get(id)
     # If nothing was returned, send back to the home page
-    if not details:
+    if not doc or not doc['type'] == 'maintenance':
         messages.add_message(request, messages.ERROR, 'Invalid request: no such maintenance id.')
         return HttpResponseRedirect('/')
 
-    # Which services were impacted
-    services = Event.objects.filter(id=id).values('event_service__service__service_name')
-
-    # Obain any maintenance updates
-    updates = Event.objects.filter(id=id).values(
-                                                'event_update__id',
-                                                'event_update__date',
-                                                'event_update__update',
-                                                'event_update__user__first_name',
-                                                'event_update__user__last_name'
-                                                ).order_by('event_update__id')
-    # If there are no updates, set to None
-    if len(updates) == 1 and updates[0]['event_update__date'] == None:
-        updates = None
+    details = doc['details']
+    services = doc['services']
+    updates = doc['updates']
 
     # Print the page
-    return render_to_response(
+    response = render_to_response(
        'maintenance/m_detail.html',
        {
           'title':'System Status Dashboard | Scheduled Maintenance Detail',
@@ -447,9 +507,17 @@ def m_detail(request):
           'id':id,
           'details':details,
           'updates':updates,
+          'archived':doc.get('archived'),
        },
        context_instance=RequestContext(request)
     )
+
+    # The page was last modified by the latest event or update save
+    dates = [detail['date'] for detail in details]
+    if updates:
+        dates.extend([update['event_update__date'] for update in updates])
+
+    return conditional.last_modified(response, *dates)
     
 
 @staff_member_required_ssd
@@ -466,22 +534,17 @@ def m_email(request):
         # Obtain the cleaned data
         id = form.cleaned_data['id']
 
-        # Obtain the email address id
-        recipient_id = Event.objects.filter(id=id).values('event_email__email__id')[0]['event_email__email__id']
+        # Obtain the email address ids
+        recipient_ids = [email['email_id'] for email in Event_Email.objects.filter(event_id=id).values('email_id')]
 
         # If there is no recipient defined, give them an error message and send back to the list view
-        if not recipient_id:
+        if not recipient_ids:
             messages.add_message(request, messages.ERROR, 'There is no recipient defined for maintenance id:%s.  Please add one before sending email notifications.' % id)
 
-        # Only send the email if email functionality is enabled.
-        if Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'] == 1:
-            email = notify.email()
-            email_status = email.email_event(id,recipient_id,request.timezone,False)
-
-            if email_status == 'success':
-                messages.add_message(request, messages.SUCCESS, 'Email successfully sent for maintenance id:%s.' % id)
-            else:
-                messages.add_message(request, messages.ERROR, 'Email failed for maintenance id:%s.  Error message: %s' % (id,email_status))
+        # Only queue the emails if email functionality is enabled (the ssd_outbox worker sends them)
+        elif siteconfig.get().email.enabled == 1:
+            outbox.queue_event(id,recipient_ids,False,request.timezone)
+            messages.add_message(request, messages.SUCCESS, 'Email queued for %s recipient(s) of maintenance id:%s.' % (len(recipient_ids),id))
         else:
             messages.add_message(request, messages.ERROR, 'Email functionality is disabled.')
     else:
@@ -514,11 +577,33 @@ def m_delete(request):
             # Obtain the cleaned data
             id = form.cleaned_data['id']
 
-            # Delete the maintenance
-            Event.objects.filter(id=id).delete()
+            # Record the cache relevant state of the event before deleting it
+            before = event_cache.snapshot(id)
+
+            # Delete the maintenance and take it out of the hourly graph counts in one transaction
+            with transaction.atomic():
+                # Lock the event and note the services and days it covered and the hour it started in
+                before_days = rollup.snapshot(id)
+                before_hour = event_counts.snapshot(id)
+
+                Event.objects.filter(id=id).delete()
+                event_counts.update(before_hour, None)
+
+            # Take the event out of the daily availability of its services (once committed, see rollup.update)
+            rollup.update(before_days)
+
+            # Clear the cache entries for the day this event started on
+            event_cache.invalidate(before)
 
-            # Clear the cache - don't discriminate and just clear everything that impacts events
-            cache.delete_many(['timeline','events_ns','event_count_ns'])
+            # Remove the event from the cached timeline
+            timeline.remove_event(id)
+
+            # Rebuild the cached event document (its search index entry went with the event)
+            event_doc.refresh(id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('maintenance', id, 'deleted')
+            snapshot.publish_event(id)
 
             # Set a message that the delete was successful
             messages.add_message(request, messages.SUCCESS, 'Maintenance id:%s successfully deleted' % id)
@@ -578,23 +663,17 @@ def m_list(request):
     # Check the params
     if form.is_valid():
 
-        page = form.cleaned_data['page']
+        cursor = form.cleaned_data['cursor']
 
         # Obtain all open incidents
-        maintenances_all = Event.objects.filter(Q(type=2,status__status='planning') | Q(type=2,status__status='started')).values('id','start','description','event_email__email__email').order_by('-id')
+        # (with the number of email recipients of each)
+        maintenances_all = Event.objects.filter(Q(type=2,status__status='planning') | Q(type=2,status__status='started')).values('id','start','description').annotate(recipients=Count('event_email'))
 
-        # Create a paginator and paginate the list w/ 10 messages per page
-        paginator = Paginator(maintenances_all, 10)
+        # Create a keyset paginator and paginate the list w/ 10 messages per page
+        paginator = keyset.KeysetPaginator(maintenances_all, 10, ('id',), count_key=keyset.count_key('m_list', *conditional.event_versions()))
 
-        # Paginate them
-        try:
-            maintenances = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, or is not given deliver first page.
-            maintenances = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            maintenances = paginator.page(paginator.num_pages)
+        # Paginate them (a missing or invalid cursor gives the first page)
+        maintenances = paginator.page(cursor)
 
 
         # Print the page
@@ -603,7 +682,7 @@ def m_list(request):
            {
               'title':'System Status Dashboard | Open Maintenance',
               'maintenances':maintenances,
-              'email_enabled':Config_Email.objects.filter(id=Config_Email.objects.values('id')[0]['id']).values('enabled')[0]['enabled'],
+              'email_enabled':siteconfig.get().email.enabled,
               'nav_section':'event',
               'nav_sub':'m_list'
            },
@@ -642,8 +721,16 @@ def m_update_delete(request):
             # Delete the event update
             Event_Update.objects.filter(id=id).delete()
 
-            # Clear the cache 
-            cache.delete('timeline')
+            # Remove the update from the cached timeline
+            timeline.remove_update(event_id, id)
+
+            # Rebuild the cached event document and its search index entry
+            event_doc.refresh(event_id)
+            search_index.update(event_id)
+
+            # Let the dashboards know and refresh the static snapshot
+            feed.publish('maintenance', event_id, 'updated')
+            snapshot.publish_event(event_id)
 
             # Set a message that the delete was successful
             messages.add_message(request, messages.SUCCESS, 'Maintenance update id:%s successfully deleted' % id)
@@ -20,12 +20,13 @@
 import logging
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
-from django.core.cache import cache
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
 from django.contrib import messages
 from ssd.dashboard.models import Config_Message
 from ssd.dashboard.forms import MessagesConfigForm
+from ssd.dashboard import siteconfig
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
@@ -64,7 +65,10 @@ def messages_config(request):
                                                     )
 
             # Clear the cache
-            cache.delete('alerts')
+            siteconfig.invalidate()
+
+            # Refresh the static snapshot, every page shows the configuration
+            snapshot.publish_config()
 
             # Set a success message
             messages.add_message(request, messages.SUCCESS, 'Preferences saved successfully')
@@ -79,12 +83,7 @@ def messages_config(request):
         form = MessagesConfigForm
 
     # Obtain the email config
-    messages_config = Config_Message.objects.filter(id=Config_Message.objects.values('id')[0]['id']).values(
-                                                                                    'main',
-                                                                                    'main_enabled',
-                                                                                    'alert',
-                                                                                    'alert_enabled'
-                                                                                    )
+    messages_config = siteconfig.get().message
 
     # Print the page
     return render_to_response(
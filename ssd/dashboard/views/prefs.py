@@ -17,8 +17,12 @@
 """This module contains all of the user preference setting functions of SSD."""
 
 
+import json
 import logging
-from django.http import HttpResponseRedirect
+import pytz
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from ssd.dashboard.forms import JumpToForm, UpdateTZForm
 
@@ -27,11 +31,20 @@ from ssd.dashboard.forms import JumpToForm, UpdateTZForm
 logger = logging.getLogger(__name__)
 
 
+# The timezone list only changes with pytz, so serialize it once
+TIMEZONES_JSON = json.dumps(list(pytz.all_timezones))
+
+
+@csrf_exempt
 def set_timezone(request):
     """Process a form submit to set the timezone
 
     Supported timezones are from pytz
 
+    This only sets a preference cookie and it's posted from the static
+    snapshot pages (see ssd.dashboard.snapshot), which carry no csrf token,
+    so csrf protection is not applied.
+
     """
 
     logger.debug('%s view being executed.' % 'prefs.set_timezone')
@@ -80,11 +93,15 @@ def set_timezone(request):
     return HttpResponseRedirect('/')
 
 
+@csrf_exempt
 def jump(request):
     """Process a form submit to jump to a specific date
 
     Any date can be processed
 
+    This is only a redirect and it's posted from the static snapshot pages,
+    so csrf protection is not applied.
+
     """
 
     logger.debug('%s view being executed.' % 'prefs.jump')
@@ -108,3 +125,20 @@ def jump(request):
     # Either its not a POST, or the form was not valid
     # Redirect to the homepage and they'll get the standard view
     return HttpResponseRedirect('/')
+
+
+def timezones(request):
+    """Return the list of supported timezones as JSON
+
+    The footer timezone picker is filled in from this list by the browser.
+    The url carries the pytz version (see context_processors.timezones) so
+    the response can be cached for a long time.
+
+    """
+
+    logger.debug('%s view being executed.' % 'prefs.timezones')
+
+    response = HttpResponse(TIMEZONES_JSON, content_type='application/json')
+    patch_cache_control(response, public=True, max_age=31536000)
+
+    return response
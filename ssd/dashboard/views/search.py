@@ -20,19 +20,34 @@
 import logging
 import datetime
 import pytz
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
-from ssd.dashboard.models import Event
+from ssd.dashboard.models import Event, Archive_Event
 from ssd.dashboard.forms import SearchForm, GSearchForm
+from ssd.dashboard import archive
+from ssd.dashboard import conditional
+from ssd.dashboard import keyset
+from ssd.dashboard import search_cache
+from ssd.dashboard import search_index
 
 
 # Get an instance of the ssd logger
 logger = logging.getLogger(__name__)
 
 
+# The columns shown in the event search results
+EVENT_VALUES = ('id','status__status','type__type','start','end','description')
+
+
+def _graph_version(request):
+    """The graph results change with any event write and the search parameters"""
+
+    return conditional.event_versions() + (request.GET.urlencode(),)
+
+
+@conditional.condition(_graph_version)
 def graph(request):
     """Event Search View (Graph)
 
@@ -49,7 +64,7 @@ def graph(request):
         # Obtain the cleaned data (only validate the dates)
         date = form.cleaned_data['date']
         type = form.cleaned_data['type']
-        page = form.cleaned_data['page']
+        cursor = form.cleaned_data['cursor']
 
         # Combine the dates and times into datetime objects
         start = datetime.datetime.combine(date, datetime.datetime.strptime('00:00:00','%H:%M:%S').time())
@@ -60,22 +75,26 @@ def graph(request):
         start = tz.localize(start)
         end = tz.localize(end)
 
-        results_all = Event.objects.filter(type__type=type,start__range=[start,end]
-                                          ).values('id','type__type','start','description','status__status'
-                                          ).order_by('-start')
+        def _page():
+            # Live and archived events
+            results_all = [
+                           events.filter(type__type=type,start__range=[start,end]).values('id','type__type','start','description','status__status')
+                           for events in (Event.objects.all(), Archive_Event.objects.all())
+                          ]
+
+            # Create a keyset paginator (newest start first) and paginate the list w/ 10 messages per page
+            paginator = keyset.MergedPaginator(
+                                               results_all,
+                                               10,
+                                               ('start','id'),
+                                               count_key=keyset.count_key('graph', request.timezone, date, type, *conditional.event_versions())
+                                              )
 
-        # Create a paginator and paginate the list w/ 10 messages per page
-        paginator = Paginator(results_all, 10)
+            # Paginate them (a missing or invalid cursor gives the first page)
+            return paginator.page(cursor)
 
-        # Paginate them
-        try:
-            results = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, or is not given deliver first page.
-            results = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            results = paginator.page(paginator.num_pages)
+        # The same day in another timezone covers another UTC range, so the key uses the range
+        results = search_cache.get('graph', {'range':search_cache.utc_range(start,end), 'type':type, 'cursor':cursor}, _page)
 
         # Put together the query params
         query_params = 'date=%s&type=%s' % (date,type)
@@ -114,7 +133,7 @@ def events(request):
     # Check the params
     if form.is_valid():
 
-        page = form.cleaned_data['page']
+        cursor = form.cleaned_data['cursor']
         start = form.cleaned_data['start']
         end = form.cleaned_data['end']
         text = form.cleaned_data['text']
@@ -124,6 +143,9 @@ def events(request):
         filter = {}
         query_params = None
 
+        # The normalized query, for the result cache
+        params = {}
+
         # Start/End
         if start and end:
             # Combine the dates and times into datetime objects
@@ -136,44 +158,61 @@ def events(request):
             end_tmp = tz.localize(end_tmp)
 
             filter['start__range'] = [start_tmp,end_tmp]
+            params['range'] = search_cache.utc_range(start_tmp,end_tmp)
             query_params = 'start=%s&end=%s' % (start,end)
 
         # Type
         if type:
             filter['type__type'] = '%s' % type
+            params['type'] = type
             if query_params:
                 query_params += '&type=%s' % type
             else:
                 query_params = 'type=%s' % type
 
-        # Text
+        # Text (matched through the full-text index, most relevant first)
         if text:
-            filter['description__contains'] = '%s' % text
+            params['text'] = search_cache.normalize_text(text)
+
             if query_params:
                 query_params += '&text=%s' % text
             else:
                 query_params = 'text=%s' % text
 
-        # Obtain filtered incidents
-        if filter:
-            events_all = Event.objects.filter(**filter).values('id','status__status','type__type','start','end','description').order_by('-id')
+        def _ids():
+            # The matches that also pass the other filters
+            ids = search_index.search(text, **filter)
+
+            # Followed by the archived matches (newest first)
+            return ids + archive.search(text, **filter)
+
+        def _page():
+            if text:
+                # The ids are already in memory (and in relevance order), so page through the list
+                paginator = keyset.ListPaginator(search_cache.get('event_ids', params, _ids), 10)
+
+            # Obtain filtered (or all) live and archived incidents, newest first, w/ 10 messages per page
+            else:
+                paginator = keyset.MergedPaginator(
+                                                   [Event.objects.filter(**filter).values(*EVENT_VALUES), Archive_Event.objects.filter(**filter).values(*EVENT_VALUES)],
+                                                   10,
+                                                   ('id',),
+                                                   count_key=keyset.count_key('events', request.timezone, query_params, *conditional.event_versions())
+                                                  )
+
+            # Paginate them (a missing or invalid cursor gives the first page)
+            page = paginator.page(cursor)
 
-        # Obtain all incidents
-        else:
-            events_all = Event.objects.values('id','status__status','type__type','start','end','description').order_by('-id')
+            # A text search paginates event ids, so load the events on this page (keeping the relevance order)
+            if text:
+                rows = dict([(row['id'], row) for row in Event.objects.filter(id__in=page.object_list).values(*EVENT_VALUES)])
+                rows.update([(row['id'], row) for row in Archive_Event.objects.filter(id__in=page.object_list).values(*EVENT_VALUES)])
+                page.object_list = [rows[id] for id in page.object_list if id in rows]
 
-        # Create a paginator and paginate the list w/ 10 messages per page
-        paginator = Paginator(events_all, 10)
+            return page
 
-        # Paginate them
-        try:
-            events = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, or is not given deliver first page.
-            events = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999), deliver last page of results.
-            events = paginator.page(paginator.num_pages)
+        # The id list of a text search is shared by all of its pages
+        events = search_cache.get('events', dict(params, cursor=cursor), _page)
 
         # Print the page
         return render_to_response(
@@ -181,7 +220,6 @@ def events(request):
            {
               'title':'System Status Dashboard | Events Search',
               'events':events,
-              'page':page,
               'start':start,
               'end':end,
               'text':text,
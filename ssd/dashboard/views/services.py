@@ -19,14 +19,16 @@
 
 import logging
 from django.db import IntegrityError
-from django.core.cache import cache
 from ssd.dashboard.decorators import staff_member_required_ssd
 from django.shortcuts import render_to_response
 from django.template import RequestContext
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
 from django.contrib import messages
-from ssd.dashboard.models import Service, Event_Service
+from ssd.dashboard.models import Service, Event_Service, Archive_Event_Service
 from ssd.dashboard.forms import AddServiceForm, RemoveServiceForm, XEditableModifyForm
+from ssd.dashboard import event_doc
+from ssd.dashboard import localcache
+from ssd.dashboard import snapshot
 
 
 # Get an instance of the ssd logger
@@ -61,7 +63,8 @@ def services(request):
                 messages.add_message(request, messages.SUCCESS, 'Service saved successfully.')
 
             # Clear the cache so the new services show up in the dashboard immediately
-            cache.delete('services')
+            localcache.bump(['services'])
+            snapshot.publish_config()
 
             # Send them back so they can see the newly created service
             return HttpResponseRedirect('/admin/services')
@@ -112,8 +115,8 @@ def service_delete(request):
             # Do not allow them to be deleted w/o removing them from the relevant
             # services first
 
-            # Part of any incidents or maintenances?
-            if Event_Service.objects.filter(service_id=id):
+            # Part of any incidents or maintenances (including archived ones)?
+            if Event_Service.objects.filter(service_id=id) or Archive_Event_Service.objects.filter(service_id=id):
 
                 # Set a message that the delete failed
                 messages.add_message(request, messages.ERROR, 'The service you are attempting to delete is currently part of an event.  Please remove the service from the event, or delete the event and then delete the service.')
@@ -123,7 +126,8 @@ def service_delete(request):
                 Service.objects.filter(id=id).delete()
 
                 # Clear the cache so the modified service listing shows up in the dashboard immediately
-                cache.delete('services')
+                localcache.bump(['services'])
+                snapshot.publish_config()
 
                 # Set a message that delete was successful
                 messages.add_message(request, messages.SUCCESS, 'Service successfully removed.')
@@ -208,7 +212,16 @@ def service_modify(request):
                 return HttpResponseBadRequest('An error was encountered with this request.')
 
             # Clear the cache so the modified service listing shows up in the dashboard immediately
-            cache.delete('services')
+            localcache.bump(['services'])
+
+            # The cached documents of events using this service show its name
+            for row in Event_Service.objects.filter(service_id=pk).values('event_id'):
+                event_doc.invalidate(row['event_id'])
+            for row in Archive_Event_Service.objects.filter(service_id=pk).values('event_id'):
+                event_doc.invalidate(row['event_id'])
+
+            # Refresh the static snapshot, the dashboard and the detail pages show the service names
+            snapshot.publish_config()
 
             return HttpResponse('Value successfully modified')
 
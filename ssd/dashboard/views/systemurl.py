@@ -25,6 +25,7 @@ from django.http import HttpResponseRedirect
 from django.contrib import messages
 from ssd.dashboard.models import Config_Systemurl
 from ssd.dashboard.forms import SystemurlConfigForm
+from ssd.dashboard import siteconfig
 
 
 # Get an instance of the ssd logger
@@ -54,6 +55,9 @@ def systemurl_config(request):
             # There should only ever be one record in this table
             Config_Systemurl.objects.filter(id=Config_Systemurl.objects.values('id')[0]['id']).update(url=url,url_enabled=url_enabled)
 
+            # Clear the cache
+            siteconfig.invalidate()
+
             messages.add_message(request, messages.SUCCESS, 'Preferences saved successfully')
         else:
             messages.add_message(request, messages.ERROR, 'Invalid data entered, please correct the errors below:')
@@ -65,7 +69,7 @@ def systemurl_config(request):
 
     # Obtain the email config
 
-    systemurl_config = Config_Systemurl.objects.filter(id=Config_Systemurl.objects.values('id')[0]['id']).values('url','url_enabled')
+    systemurl_config = siteconfig.get().systemurl
 
     # Print the page
     return render_to_response(
@@ -33,6 +33,7 @@ urlpatterns = patterns('',
     # Preferences
     url(r'^prefs/set_timezone$',            'ssd.dashboard.views.prefs.set_timezone'),
     url(r'^prefs/jump$',                    'ssd.dashboard.views.prefs.jump'),
+    url(r'^prefs/timezones$',               'ssd.dashboard.views.prefs.timezones'),
 
     # Incident Events
     url(r'^i_detail$',                      'ssd.dashboard.views.incidents.i_detail'),
@@ -43,6 +44,12 @@ urlpatterns = patterns('',
     # Incident Reports
     url(r'^ireport$',                       'ssd.dashboard.views.ireport.ireport'),
 
+    # JSON API
+    url(r'^api/v1/status$',                 'ssd.dashboard.views.api.status'),
+    url(r'^api/v1/events$',                 'ssd.dashboard.views.api.events'),
+    url(r'^api/v1/changes$',                'ssd.dashboard.views.api.changes'),
+    url(r'^api/v1/availability$',           'ssd.dashboard.views.api.availability'),
+
 
 
     # -- from here down, it's all admin functionality -- #